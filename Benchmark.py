@@ -0,0 +1,135 @@
+# Benchmark del percorso di acquisizione su simulatore locale (nessun hardware).
+# Per ogni protocollo e numero di inverter: righe/s, latenza per riga (media, p95), jitter.
+#
+#   python Benchmark.py --rows 50 --counts 1,2,5,10 --protocols TCP,AzzurroHUB,RTU
+#   python Benchmark.py --latency 0.02 --jitter 0.01 --error-rate 0.05
+import argparse
+import statistics
+import time
+import warnings
+
+from drivers.simulator import SimConfig, TcpSimulator, RtuSimulator
+from drivers.instruments import Instruments
+from drivers.read_plan import compile_read_plan
+from drivers.decoders import DecodePlan
+from drivers.rate_limit import configure_hub_limiter, HUB_DEFAULT_RATE, HUB_DEFAULT_BURST
+
+warnings.filterwarnings("ignore")
+
+# stessi registri di default del pannello Log
+BENCH_REGISTERS = [
+    ("System State", "0x0404", "1"),
+    ("Active Output Power [kW]", "0x0485", "0.01"),
+    ("Reactive Output Power [kVAr]", "0x0486", "0.01"),
+    ("Apparent Output Power [kVA]", "0x0487", "0.01"),
+    ("Active PCC Power [kW]", "0x0488", "0.01"),
+    ("Reactive PCC Power [kVAr]", "0x0489", "0.01"),
+    ("Apparent PCC Power [kVA]", "0x048A", "0.01"),
+    ("Voltage DC1 [V]", "0x0584", "0.1"),
+    ("Current DC1 [A]", "0x0585", "0.01"),
+    ("Power DC1 [kW]", "0x0586", "0.01"),
+    ("Voltage DC2 [V]", "0x0587", "0.1"),
+    ("Current DC2 [A]", "0x0588", "0.01"),
+    ("Power DC2 [kW]", "0x0589", "0.01"),
+    ("Charge/Discharge Power [kW]", "0x0667", "0.1"),
+    ("Battery SOC [%]", "0x0668", "1"),
+]
+
+
+def _start_sims(proto, n, cfg):
+    """Ritorna (simulatori, inv_cfgs) per n inverter."""
+    if proto == "TCP":
+        # un host (porta) per inverter, slave 1 come in read_SN
+        sims = [TcpSimulator(slaves=[1], cfg=cfg).start() for _ in range(n)]
+        cfgs = [{"name": f"INV{i + 1}", "address": "127.0.0.1", "port": s.port, "modbus": 1}
+                for i, s in enumerate(sims)]
+    elif proto == "AzzurroHUB":
+        # un solo HUB, n slave ID dietro la stessa porta
+        sim = TcpSimulator(slaves=range(1, n + 1), cfg=cfg).start()
+        sims = [sim]
+        cfgs = [{"name": f"INV{i}", "address": "127.0.0.1", "port": sim.port, "modbus": i}
+                for i in range(1, n + 1)]
+    elif proto == "RTU":
+        # una linea RS485 (pty), n slave ID
+        sim = RtuSimulator(slaves=range(1, n + 1), cfg=cfg).start()
+        sims = [sim]
+        cfgs = [{"name": f"INV{i}", "address": sim.port, "modbus": i} for i in range(1, n + 1)]
+    else:
+        raise ValueError(f"Protocollo non supportato: {proto}")
+    return sims, cfgs
+
+
+def run_case(proto, n, rows, cfg, max_gap=0, deadline=2.0, hub_rate=HUB_DEFAULT_RATE, hub_burst=HUB_DEFAULT_BURST):
+    sims, inv_cfgs = _start_sims(proto, n, cfg)
+    ins = None
+    try:
+        if proto == "AzzurroHUB":
+            # il limiter dell'HUB vale per tutto il processo: stesso ritmo del banco reale
+            configure_hub_limiter("127.0.0.1", sims[0].port, rate=hub_rate, burst=hub_burst)
+        ins = Instruments(inv_cfgs=inv_cfgs, protocol=proto)
+        plan = compile_read_plan(BENCH_REGISTERS, max_gap=max_gap)
+        decoder = DecodePlan(BENCH_REGISTERS)
+        cols = list(range(len(BENCH_REGISTERS)))
+        names = [c["name"] for c in inv_cfgs]
+        lat, missing = [], 0
+        t_start = time.perf_counter()
+        for _ in range(rows):
+            t0 = time.perf_counter()
+            polled = ins.inv_poll_blocks(plan, names=names, deadline=deadline)
+            for name in names:
+                vals = decoder.decode(cols, plan, polled.get(name) or [None] * len(plan))
+                missing += sum(v is None for v in vals)
+            lat.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - t_start
+        lat_ms = sorted(x * 1000.0 for x in lat)
+        return {
+            "proto": proto, "n": n, "rows": rows,
+            "rows_s": rows / elapsed if elapsed else 0.0,
+            "samples_s": rows * n * len(BENCH_REGISTERS) / elapsed if elapsed else 0.0,
+            "lat_mean_ms": statistics.mean(lat_ms),
+            "lat_p95_ms": lat_ms[min(len(lat_ms) - 1, int(0.95 * len(lat_ms)))],
+            "jitter_ms": statistics.pstdev(lat_ms),
+            "missing": missing,
+            "bus_requests": sum(s.requests for s in sims),
+        }
+    finally:
+        if ins is not None:
+            ins.close_all()
+        for s in sims:
+            s.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark acquisizione inverter su simulatore Modbus")
+    ap.add_argument("--protocols", default="TCP,AzzurroHUB,RTU")
+    ap.add_argument("--counts", default="1,2,5,10", help="numero di inverter per caso")
+    ap.add_argument("--rows", type=int, default=30)
+    ap.add_argument("--latency", type=float, default=0.005)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--drop-rate", type=float, default=0.0)
+    ap.add_argument("--max-gap", type=int, default=0)
+    ap.add_argument("--deadline", type=float, default=2.0, help="deadline per riga [s]")
+    ap.add_argument("--hub-rate", type=float, default=HUB_DEFAULT_RATE, help="richieste/s verso l'HUB (0 = nessun limite)")
+    ap.add_argument("--hub-burst", type=int, default=HUB_DEFAULT_BURST)
+    args = ap.parse_args()
+
+    cfg = SimConfig(latency=args.latency, jitter=args.jitter,
+                    error_rate=args.error_rate, drop_rate=args.drop_rate)
+    print(f"{'proto':<11}{'inv':>4}{'righe/s':>10}{'campioni/s':>12}{'lat media':>11}"
+          f"{'lat p95':>10}{'jitter':>9}{'mancanti':>10}{'richieste':>11}")
+    for proto in [p.strip() for p in args.protocols.split(",") if p.strip()]:
+        for n in [int(c) for c in args.counts.split(",") if c.strip()]:
+            try:
+                r = run_case(proto, n, args.rows, cfg, max_gap=args.max_gap, deadline=args.deadline,
+                             hub_rate=args.hub_rate, hub_burst=args.hub_burst)
+            except Exception as e:
+                print(f"{proto:<11}{n:>4}  ERRORE: {e}")
+                continue
+            print(f"{r['proto']:<11}{r['n']:>4}{r['rows_s']:>10.2f}{r['samples_s']:>12.1f}"
+                  f"{r['lat_mean_ms']:>9.1f}ms{r['lat_p95_ms']:>8.1f}ms{r['jitter_ms']:>7.1f}ms"
+                  f"{r['missing']:>10}{r['bus_requests']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,20 @@ import openpyxl
 import threading
 import time
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from drivers.instruments import *
-from drivers.decoders import decode_u16_auto
+from drivers.modbus_inv import read_inverter_sn
+from drivers.discovery import discover
+from drivers.decoders import DecodePlan, parse_dtype
+from drivers.read_plan import MultiRatePlanner
+from drivers.scheduler import FixedRateScheduler
+from drivers.deadband import DeadbandFilter, SPARSE_PERIOD_COL
+from drivers.event_log import EventLogCollector
+from drivers.faults import FaultWatcher
+from drivers.scpi import send_batch
+from drivers.rate_limit import configure_hub_limiter, HUB_DEFAULT_RATE, HUB_DEFAULT_BURST
+from drivers.visa_registry import open_session, close_all_sessions
 from drivers.test import *
 import matplotlib
 matplotlib.use("TkAgg")
@@ -45,26 +56,6 @@ current_report_ctx = {}  # {"template_path": "...", "serials": [...]} oppure vuo
 current_session_dir = None  # cartella della sessione corrente .\Data\SN_YYYYMMDD_HHMMSS
 
 
-def _visa_is_present(addr: str, timeout_ms: int = 500) -> tuple[bool, str]:
-    """Prova ad aprire la risorsa VISA 'addr'. True se apre, False se fallisce."""
-    try:
-        rm = pyvisa.ResourceManager()
-        inst = rm.open_resource(addr)
-        try:
-            inst.timeout = timeout_ms
-            # Tentativo soft di *IDN? (se non supportato non è un errore fatale)
-            try:
-                idn = inst.query("*IDN?").strip()
-            except Exception:
-                idn = ""
-        finally:
-            try: inst.close()
-            except Exception: pass
-        return True, idn
-    except Exception as e:
-        return False, str(e)
-
-
 # ------------------------------------------------------------
 # Stima durata test (per impostare il tempo del logging)
 # ------------------------------------------------------------
@@ -138,6 +129,22 @@ def stop_logging_and_release():
         print(f"[WARN] stop_logging_and_release: {e}")
 
 
+# comando manuale (pannelli AC/DC/inverter): lo stato in cache di Instruments non è più affidabile
+def forget_commanded_state(resource=None):
+    ins = current_shared_ins
+    if not ins:
+        return
+    if resource is None:
+        ins.invalidate_state()
+        return
+    srcs = dict(ins.dc)
+    if ins.ac:
+        srcs["AC"] = ins.ac
+    for name, src in srcs.items():
+        if getattr(src, "resource", None) == resource:
+            ins.invalidate_state(name)
+
+
 def open_realtime_panel(colnames, default_col=None):
     # registra le colonne mostrate nel pannello
     global rt_columns
@@ -241,84 +248,32 @@ def open_realtime_panel(colnames, default_col=None):
     col_combo.bind("<<ComboboxSelected>>", _on_change)
 
 
-# --- helper da hex a int ---
-def _to_int_reg(r):
-    if isinstance(r, int): return r
-    s = str(r).strip().lower()
-    return int(s, 16) if s.startswith("0x") else int(s)
-
-
 # --- lettura SN Inverter ---
 def read_SN(proto, ip_tcp=None, porta_com=None, ip_hub=None,
-            slave_id_rtu=None, slave_id_azzurro=None, max_retries=10):
-    registri_read = [
-        0x0445, 0x0446, 0x0447, 0x0448, 0x0449,
-        0x044a, 0x044b, 0x044c, 0x0470, 0x0471
-    ]
-    expected_lengths = {14, 20}
-
-    def connect_client():
-        if proto == "RTU":
-            return ModbusSerialClient(
-                port=porta_com,
-                baudrate=9600,
-                # timeout=1,
-                # stopbits=1,
-                # bytesize=8,
-                # parity='N'
-            ), int(slave_id_rtu)
-        elif proto == "TCP":
-            return ModbusTcpClient(ip_tcp, port=8899, timeout=1), 1
-        elif proto == "AzzurroHUB":
-            return ModbusTcpClient(ip_hub, port=55400, timeout=5), int(slave_id_azzurro)
-        else:
-            raise ValueError(f"Protocollo non supportato: {proto}")
-
-    for attempt_sn in range(max_retries):  # retry per intero SN
-        sn_str = ""
-        client, slave_id = connect_client()
-
-        if not client.connect():
-            print(f"[ERRORE] Connessione fallita ({proto})")
-            return "UNKNOWN"
-
-        try:
-            for reg in registri_read:
-                val_ok = False
-                for _ in range(max_retries):  # retry per singolo registro
-                    rr = client.read_holding_registers(address=reg, count=1, slave=slave_id)
-                    if not rr.isError():
-                        val = rr.registers[0]
-                        hex_str = f"{val:04x}"
-                        if hex_str == '0000':
-                            val_ok = True
-                            break
-                        sn_str += chr(int(hex_str[0:2], 16))
-                        sn_str += chr(int(hex_str[2:4], 16))
-                        val_ok = True
-                        break
-                    # piccolo delay prima del retry
-                    if proto == "AzzurroHUB":
-                        time.sleep(3)  # attesa obbligatoria per non farsi bloccare dall'HUB
-                    else:
-                        time.sleep(0.5)  # attesa più breve per TCP/RTU
-
-                if not val_ok:
-                    print(f"[WARN] Registro {hex(reg)} non letto dopo {max_retries} tentativi")
-
-        except Exception as e:
-            print(f"[ERRORE lettura SN] {e}")
-            sn_str = ""
-        finally:
-            client.close()
-
-        sn_str = sn_str.strip()
-        if len(sn_str) in expected_lengths:
-            return sn_str  # SN valido trovato
-
-        print(f"[WARN] SN incompleto (len={len(sn_str)}), retry {attempt_sn+1}/{max_retries}")
-
-    return "UNKNOWN"
+            slave_id_rtu=None, slave_id_azzurro=None, max_retries=3, use_cache=True):
+    """
+    SN in due letture a blocco (0x0445..0x044C, 0x0470..0x0471) sul trasporto condiviso
+    (SerialBus su RTU, rate limiter su HUB), con cache per (protocollo, indirizzo, porta, slave).
+    """
+    if proto == "RTU":
+        address, slave_id = porta_com, int(slave_id_rtu)
+    elif proto == "TCP":
+        address, slave_id = ip_tcp, 1
+    elif proto == "AzzurroHUB":
+        address, slave_id = ip_hub, int(slave_id_azzurro)
+    else:
+        print(f"[ERRORE] Protocollo non supportato: {proto}")
+        return "UNKNOWN"
+    try:
+        sn = read_inverter_sn(proto, address, slave=slave_id, timeout=5 if proto == "AzzurroHUB" else 1,
+                              use_cache=use_cache, attempts=max_retries)
+    except Exception as e:
+        print(f"[ERRORE lettura SN] {e}")
+        sn = None
+    if not sn:
+        print(f"[WARN] SN non letto ({proto} {address}/{slave_id})")
+        return "UNKNOWN"
+    return sn
 
 
 # --- Lettura DB inverter ---
@@ -346,21 +301,53 @@ def open_subpanel(title):
 
 
 # apro il thread per il log
-def start_logging_routine(protocol, inverters, registers, file_path, sampling_time, total_time, shared_ins=None):
+def start_logging_routine(protocol, inverters, registers, file_path, sampling_time, total_time, shared_ins=None,
+                          max_gap=0, slow_fill="ffill", change_filter=None, event_period=30.0, fault_period=None):
+    """
+    registers: [(label, reg, scale[, periodo_s[, tipo]]), ...]; periodo vuoto = sampling_time,
+               tipo vuoto = "auto" (vedi drivers.decoders: u16/s16/u32/s32/f32[_lsw]/asciiN).
+    slow_fill: "ffill" ripete l'ultimo valore dei registri lenti nelle righe intermedie,
+               "sparse" lascia la cella vuota.
+    change_filter: DeadbandFilter per il logging "solo variazioni" (None = una riga per campione).
+    event_period: periodo [s] di lettura dello storico eventi 0x1480 durante il log.
+    fault_period: periodo [s] della sorveglianza fault 0x0405..0x040E (None/0 = disattivata, default;
+                  le letture passano a priorità bassa dietro al logger e al test).
+    """
     global logging_running, logging_paused, rt_columns
     logging_running = True
     logging_paused = False
+    # piano di lettura a blocchi per gruppo di periodo: registri contigui (entro max_gap)
+    # in un'unica richiesta, registri lenti letti solo ai loro tick
+    planner = MultiRatePlanner(registers, base_period=float(sampling_time), max_gap=max_gap)
+    # indirizzi/scaling/tipi compilati una volta: a runtime decodifica vettoriale per blocco
+    decoder = DecodePlan(registers, signed_hint_thresh=0xF000)
 
     def log_loop():
         global rt_columns
         start_time = time.time()
         # Prepara header CSV
-        header = ["timestamp"]
+        header = ["timestamp"] + ([SPARSE_PERIOD_COL] if change_filter else [])
         col_names = []
         for inv_index, inv in enumerate(inverters):
-            for label, _, _ in registers:
+            for label, *_ in registers:
                 col_names.append(f"Inverter{inv_index+1}_{label}")
+        # misure DC/AC nella stessa riga degli inverter: colonne "<DCx|AC>_<grandezza> [unità]"
+        src_cols = shared_ins.source_columns() if shared_ins else []
+        col_names += [c for _, _, c in src_cols]
         header += col_names
+        # ultimo valore per inverter/colonna (forward-fill dei registri lenti)
+        last_vals = [[None] * len(registers) for _ in inverters]
+        # storico eventi letto a blocco durante il log (thread a bassa priorità)
+        inv_names = [inv.get("name") or f"INV{i + 1}" for i, inv in enumerate(inverters)]
+        events = EventLogCollector(shared_ins, inv_names, period=event_period).start() if shared_ins else None
+        # fault attivi: solo i fronti, con timestamp al ms, nel CSV <test>_faults.csv della sessione
+        faults = None
+        if shared_ins and fault_period:
+            try:
+                faults = FaultWatcher(shared_ins, inv_names, period=fault_period,
+                                      csv_path=os.path.splitext(file_path)[0] + "_faults.csv").start()
+            except Exception as e:
+                print(f"[WARN] avvio sorveglianza fault fallito: {e}")
         try:
             # assicura che la cartella esista
             from datetime import datetime
@@ -374,13 +361,38 @@ def start_logging_routine(protocol, inverters, registers, file_path, sampling_ti
                 f.flush()
                 warned_ports = set()
                 warned_file_lock = False
+                # griglia di campionamento fissa (deadline monotone): il periodo non dipende
+                # dalla durata di letture/scritture; i tick in ritardo vengono saltati e contati
+                sched = FixedRateScheduler(float(sampling_time), skip_late=True)
+                timing_rows = []
+                was_paused = False
+                pending_row = None  # ultima riga scartata dal deadband (scritta a fine log)
+                # misure degli strumenti lanciate prima del polling inverter, raccolte dopo
+                src_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-src") if src_cols else None
                 while time.time() - start_time < total_time:
                     if not logging_running:
                         break
                     if logging_paused:
+                        was_paused = True
                         time.sleep(0.5); continue
+                    if was_paused:
+                        was_paused = False
+                        sched.reanchor()
+                    tick = sched.wait_next()
+                    if not logging_running or time.time() - start_time >= total_time:
+                        break
                     timestamp_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     row_vals = []
+                    due_cols, read_plan = planner.due(tick.index)
+                    src_fut = src_pool.submit(shared_ins.sources_measure, max(0.5, float(sampling_time))) \
+                        if src_pool else None
+                    # polling di tutti gli inverter per la riga: TCP/HUB in parallelo, RTU in sequenza
+                    try:
+                        polled = shared_ins.inv_poll_blocks(read_plan, names=inv_names,
+                                                            deadline=max(0.5, float(sampling_time))) if (shared_ins and read_plan) else {}
+                    except Exception as e:
+                        print(f"[WARN] Polling inverter fallito: {e}")
+                        polled = {}
                     # for inv in inverters:
                     #     address = inv["ip"]
                     #     modbus_id = int(inv["modbus"])
@@ -427,65 +439,101 @@ def start_logging_routine(protocol, inverters, registers, file_path, sampling_ti
                     #                 client.close()
                     #         except Exception:
                     #             pass
-                    for inv in inverters:
-                        # usa il service condiviso per leggere (ruolo da 'slave' flag)
-                        reg_values = []
-                        role = "slave" if inv.get("slave") else "master"
+                    for inv_index, inv in enumerate(inverters):
+                        # lettura indirizzata sul singolo inverter (nome come in build_inv_cfgs_from_ui)
+                        inv_name = inv_names[inv_index]
+                        last = last_vals[inv_index]
+                        reg_values = list(last) if slow_fill == "ffill" else [None] * len(registers)
                         try:
-                            for _, reg, scale in registers:
-                                # reg può essere "0x...." o int
-                                out = shared_ins.inv_broadcast_read(reg, count=1, role=role) if shared_ins else None
-                                if out and isinstance(out, dict) and out:
-                                    regs = next(iter(out.values()))  # prima entry del dict
-                                    raw = regs[0] if regs else None
-                                else:
-                                    raw = None
-                                # decode 16 bit  scaling  two's complement (se necessario)
-                                val = decode_u16_auto(raw, scale=scale, signed_hint_thresh=0xF000)
-                                reg_values.append(val)
+                            # una lettura per blocco contiguo (vedi read_plan), poi slicing per colonna
+                            block_regs = polled.get(inv_name) or [None] * len(read_plan)
+                            # decode (16/32 bit, two's complement, word order, scaling) in un colpo solo
+                            vals = decoder.decode(due_cols, read_plan, block_regs)
+                            for val, col in zip(vals, due_cols):
+                                reg_values[col] = val
+                                last[col] = val
                         except Exception as e:
                             # in caso d'errore su un inverter, logga vuoti ma continua con gli altri
                             reg_values = [None] * len(registers)
-                            print(f"[WARN] Lettura {role} fallita: {e}")
+                            print(f"[WARN] Lettura {inv_name} fallita: {e}")
                         row_vals.extend(reg_values)
+                    if src_fut:
+                        try:
+                            meas = src_fut.result()
+                        except Exception as e:
+                            print(f"[WARN] Misure strumenti fallite: {e}")
+                            meas = {}
+                        row_vals.extend(meas.get(n, {}).get(k) for n, k, _ in src_cols)
                     # Normalizza riga (None/NaN -> stringa vuota) e scrivi
                     def _cell(v):
                         if v is None: return ""
                         if isinstance(v, float) and math.isnan(v): return ""
                         return v
-                    row = [timestamp_str] + [_cell(v) for v in row_vals]
+                    row = [timestamp_str] + ([sampling_time] if change_filter else []) + [_cell(v) for v in row_vals]
+                    # modalità "solo variazioni": salva solo se qualcosa si è mosso oltre la banda morta
+                    store = change_filter is None or change_filter.should_store(col_names, row_vals, tick.start)
+                    pending_row = None if store else row
+                    if store:
+                        try:
+                            writer.writerow(row)
+                            f.flush()  # flush ad ogni campione (puoi togliere se vuoi flush periodico)
+                        except PermissionError as e:
+                            # file probabilmente aperto in Excel: avvisa una sola volta, poi continua il log
+                            if not warned_file_lock:
+                                 warned_file_lock = True
+                                 try:
+                                     messagebox.showwarning("File bloccato",f"Non riesco a scrivere su:\n{file_path}\n\nMotivo: {e}\n. Chiudi il file se è aperto (e.g. Excel). Continuerò a tentare.")
+                                 except Exception:
+                                     print(f"[WARN] CSV lock: {e}")
+                        except Exception as e:
+                        # altre eccezioni: non bloccare il logger
+                            print(f"[WARN] writerow fallita: {e}")
+                        # === PUSH nei buffer realtime ===
+                        with rt_lock:
+                            # inizializza colonne se vuoto
+                            if not rt_columns:
+                                rt_columns.clear(); rt_columns.extend(col_names)
+                            # allinea lunghezza
+                            rt_time.append(timestamp_str)
+                            for cname, val in zip(col_names, row_vals):
+                                # numerico → float; altrimenti NaN (mantiene cardinalità uguale a rt_time)
+                                try:
+                                    v = float(val)
+                                except (TypeError, ValueError):
+                                    v = math.nan
+                                rt_data[cname].append(v)
+                    sched.end_tick(tick)
+                    timing_rows.append([timestamp_str, tick.index, round(tick.lateness, 4),
+                                        round(tick.duration, 4), int(tick.overrun), tick.skipped])
+                if src_pool:
+                    src_pool.shutdown(wait=False)
+                # chiude la serie sparsa con l'ultimo campione, così la ricostruzione arriva fino in fondo
+                if pending_row:
                     try:
-                        writer.writerow(row)
-                        f.flush()  # flush ad ogni campione (puoi togliere se vuoi flush periodico)
-                    except PermissionError as e:
-                        # file probabilmente aperto in Excel: avvisa una sola volta, poi continua il log
-                        if not warned_file_lock:
-                             warned_file_lock = True
-                             try:
-                                 messagebox.showwarning("File bloccato",f"Non riesco a scrivere su:\n{file_path}\n\nMotivo: {e}\n. Chiudi il file se è aperto (e.g. Excel). Continuerò a tentare.")
-                             except Exception:
-                                 print(f"[WARN] CSV lock: {e}")
+                        writer.writerow(pending_row)
                     except Exception as e:
-                    # altre eccezioni: non bloccare il logger
-                        print(f"[WARN] writerow fallita: {e}")
-                    # === PUSH nei buffer realtime ===
-                    with rt_lock:
-                        # inizializza colonne se vuoto
-                        if not rt_columns:
-                            rt_columns.clear(); rt_columns.extend(col_names)
-                        # allinea lunghezza
-                        rt_time.append(timestamp_str)
-                        for cname, val in zip(col_names, row_vals):
-                            # numerico → float; altrimenti NaN (mantiene cardinalità uguale a rt_time)
-                            try:
-                                v = float(val)
-                            except (TypeError, ValueError):
-                                v = math.nan
-                            rt_data[cname].append(v)
-                    time.sleep(sampling_time)
+                        print(f"[WARN] writerow finale fallita: {e}")
+                if change_filter:
+                    print(f"[INFO] Log solo variazioni: {change_filter.stored}/{change_filter.seen} righe "
+                          f"(riduzione x{change_filter.reduction:.1f})")
             #messagebox.showinfo("Logging completato", f"File salvato:\n{file_path}")
             print(f"[INFO] Logging completato. File salvato: {file_path}")
 
+            # Statistiche di temporizzazione della sessione (per tick + riepilogo)
+            try:
+                timing_path = os.path.splitext(file_path)[0] + "_timing.csv"
+                with open(timing_path, mode='w', newline='', encoding='utf-8') as tf:
+                    tw = csv.writer(tf)
+                    tw.writerow(["timestamp", "tick", "lateness_s", "duration_s", "overrun", "skipped"])
+                    tw.writerows(timing_rows)
+                    for k, v in sched.stats().items():
+                        tw.writerow([f"# {k}", v])
+                print("[INFO] Timing campionamento:", sched.stats())
+                if shared_ins:
+                    print("[INFO] Statistiche inverter:", shared_ins.inv_stats())
+            except Exception as e:
+                print(f"[WARN] scrittura timing fallita: {e}")
+
             # Esporta anche in XLSX con fogli per inverter (nome = seriale)
             try:
                 import pandas as pd, re
@@ -501,31 +549,25 @@ def start_logging_routine(protocol, inverters, registers, file_path, sampling_ti
                         cols = [c for c in df_all.columns if c.startswith(prefix)]
                         if not cols:
                             continue
-                        df_sheet = df_all[["timestamp"] + cols].copy()
+                        # log sparso: la colonna del periodo base segue in ogni foglio (serve ai report)
+                        meta_cols = [c for c in [SPARSE_PERIOD_COL] if c in df_all.columns]
+                        # misure DC/AC (stessa timeline) in ogni foglio, col nome strumento: per i report
+                        src_names = [c for _, _, c in src_cols if c in df_all.columns]
+                        df_sheet = df_all[["timestamp"] + meta_cols + cols + src_names].copy()
                         # rinomina rimuovendo il prefisso
-                        df_sheet.columns = ["timestamp"] + [c[len(prefix):] for c in cols]
+                        df_sheet.columns = ["timestamp"] + meta_cols + [c[len(prefix):] for c in cols] + src_names
                         df_sheet.to_excel(wr, sheet_name=safe_serial, index=False)
                 print(f"[INFO] XLSX con fogli per inverter salvato: {xlsx_path}")
             except Exception as e:
                 print(f"[WARN] esportazione XLSX per inverter fallita: {e}")
                 # ====== Export sheet "LogErrori" per ciascun inverter ======
+            if events:
+                events.stop()  # ultima lettura del ring: eventi fino alla fine del log
+            if faults:
+                faults.stop()
             try:
                 import pandas as pd, re
                 from datetime import datetime
-                from openpyxl import load_workbook
-
-                def _bcd4(n: int):
-                    """Ritorna 4 nibble (0..9) da un U16: [d3,d2,d1,d0]."""
-                    a = str(hex(n)).split('x')[1]
-                    return [a[0], a[1], a[2], a[3]]
-
-                def _safe_dt(y, m, d, hh, mm, ss):
-                    try:
-                        # anno su 2 cifre → 2000+YY (adatta se serve 20xx o 19xx)
-                        Y = 2000 + y
-                        return datetime(Y, m, d, hh, mm, ss)
-                    except Exception:
-                        return None
 
                 # intervallo del test = durata del logging
                 log_start_dt = datetime.fromtimestamp(start_time)
@@ -540,104 +582,15 @@ def start_logging_routine(protocol, inverters, registers, file_path, sampling_ti
 
                 with writer_ctx as wr:
                     for idx, inv in enumerate(inverters, start=1):
-                        role = "slave" if inv.get("slave") else "master"
+                        inv_name = inv_names[idx - 1]
                         serial = str(inv.get("sn", f"INV{idx}"))
                         safe_serial = re.sub(r'[:\\/?*\[\]]', "_", serial)[:31] or f"INV{idx}"
                         sheet_name = f"{safe_serial}_LogErrori"
 
-                        rows = []
-                        # leggi fino a 100 eventi (0..99)
-                        for k in range(10):
-                            base = 0x1480 + 4 * k
-                            try:
-                                out = shared_ins.inv_broadcast_read(base, count=4,
-                                                                    role=role) if shared_ins else None
-                                # 'out' atteso: dict {<id> : [r0,r1,r2,r3]}
-                                if not out or not isinstance(out, dict) or not out:
-                                    continue
-                                regs = next(iter(out.values()))
-                                if not regs or len(regs) < 4:
-                                    continue
-                                code = regs[0] & 0xFFFF
-                                y1, y2, m1, m2 = _bcd4(regs[1])
-                                try:
-                                    year = '0x' + y1 + y2
-                                except:
-                                    year = '0x' + y2
-                                try:
-                                    month = '0x' + m1 + m2
-                                except:
-                                    month = '0x' + m2
-                                d1, d2, h1, h2 = _bcd4(regs[2])
-                                try:
-                                    day = '0x' + d1 + d2
-                                except:
-                                    day = '0x' + d2
-                                try:
-                                    hour = '0x' + h1 + h2
-                                except:
-                                    hour = '0x' + h2
-                                M1, M2, S1, S2 = _bcd4(regs[3])
-                                try:
-                                    minute = '0x' + M1  + M2
-                                except:
-                                    minute = '0x' + M2
-                                try:
-                                    sec = '0x' + S1 + S2
-                                except:
-                                    sec = '0x' + S2
-                                ts = _safe_dt(int(year, base=16), int(month, base=16), int(day, base=16),
-                                              int(hour, base=16), int(minute, base=16), int(sec, base=16))
-                                if not ts:
-                                    continue
-                                # filtra eventi del test
-                                if log_start_dt <= ts <= log_end_dt:
-                                    rows.append({
-                                        "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
-                                        "code_dec": int(code),
-                                        "code_hex": f"0x{code:04X}",
-                                        "fault_index": None,
-                                        "register": None,
-                                        "source": "HIST",
-                                        "YY": year, "MM": month, "DD": day,
-                                        "hh": hour, "mm": minute, "ss": sec
-                                    })
-                            except Exception as e:
-                                print(f"[WARN] lettura LogErrori {role} evt#{k}: {e}")
-
-                        # # ====== Errori attuali (ongoing) 0x0405..0x040E ======
-                        # try:
-                        #     # timestamp = ultima riga del CSV (o adesso)
-                        #     try:
-                        #         df_all_csv = pd.read_csv(file_path)
-                        #         last_ts_str = str(
-                        #             df_all_csv["timestamp"].iloc[-1]) if not df_all_csv.empty else None
-                        #     except Exception:
-                        #         last_ts_str = None
-                        #     if not last_ts_str:
-                        #         last_ts_str = log_end_dt.strftime("%Y-%m-%d %H:%M:%S")
-                        ### TO DO: mappa dei bit per leggere gli errori.
-                        #     cur = shared_ins.inv_broadcast_read(0x0405, count=1,
-                        #                                         role=role) if shared_ins else None
-                        #     if cur and isinstance(cur, dict) and cur:
-                        #         regs = next(iter(cur.values()))
-                        #         if regs and len(regs) >= 1:
-                        #
-                        #             for j, val in enumerate(regs[:10]):
-                        #                 v = int(val)
-                        #                 if v != 0:  # logga solo fault presenti
-                        #                     rows.append({
-                        #                         "timestamp": last_ts_str,
-                        #                         "code_dec": v,
-                        #                         "code_hex": f"0x{v:04X}",
-                        #                         "fault_index": j + 1,
-                        #                         "register": f"0x{0x0405 + j:04X}",
-                        #                         "source": "ONGOING",
-                        #                         "YY": "", "MM": "", "DD": "",
-                        #                         "hh": "", "mm": "", "ss": ""
-                        #                     })
-                        # except Exception as e:
-                        #     print(f"[WARN] lettura Fault1..10 {role}: {e}")
+                        # eventi raccolti durante il log, già de-duplicati; filtro sulla finestra del test
+                        rows = events.rows(inv_name, log_start_dt, log_end_dt) if events else []
+                        # fronti dei fault attivi rilevati in diretta
+                        rows += faults.rows(inv_name) if faults else []
 
                         if rows:
                             df_err = pd.DataFrame(rows).sort_values("timestamp")
@@ -695,6 +648,10 @@ def start_logging_routine(protocol, inverters, registers, file_path, sampling_ti
 
 
         except Exception as e:
+            if events:
+                events.stop(final_poll=False)
+            if faults:
+                faults.stop()
             messagebox.showerror("Errore logging", str(e))
 
     t = threading.Thread(target=log_loop, daemon=True)
@@ -702,6 +659,84 @@ def start_logging_routine(protocol, inverters, registers, file_path, sampling_ti
     return t
 
 
+# --- scansione bus / discovery inverter ---
+def open_scan_panel(parent, protocol_var, inverter_entries):
+    """Scansiona porte COM / range IP e precompila la griglia inverter del pannello Log."""
+    scan_win = tk.Toplevel(parent)
+    scan_win.title("Scansione inverter")
+
+    proto = protocol_var.get().strip()
+    tk.Label(scan_win, text=f"Protocollo: {proto}", font=("Arial", 10, "bold")).grid(row=0, column=0, columnspan=2,
+                                                                                     sticky="w", padx=10, pady=5)
+    hint = "Porte COM (vuoto = tutte)" if proto == "RTU" else "IP / range (es. 192.168.1.10-20)"
+    tk.Label(scan_win, text=hint).grid(row=1, column=0, sticky="w", padx=10)
+    targets_entry = tk.Entry(scan_win, width=30)
+    targets_entry.grid(row=1, column=1, padx=10, pady=2)
+    tk.Label(scan_win, text="Slave ID (es. 1-10, 11)").grid(row=2, column=0, sticky="w", padx=10)
+    slaves_entry = tk.Entry(scan_win, width=30)
+    slaves_entry.insert(0, "1-10")
+    slaves_entry.grid(row=2, column=1, padx=10, pady=2)
+    if proto == "TCP":
+        slaves_entry.config(state="disabled")  # TCP diretto: slave 1
+
+    results = tk.Listbox(scan_win, width=80, height=12)
+    results.grid(row=3, column=0, columnspan=2, padx=10, pady=5)
+    status_var = tk.StringVar(value="")
+    tk.Label(scan_win, textvariable=status_var).grid(row=4, column=0, columnspan=2, sticky="w", padx=10)
+
+    found = []
+    stop = threading.Event()
+
+    def _show(dev):
+        results.insert(tk.END, f"{dev.address}  slave {dev.slave}  SN {dev.sn or '?'}  "
+                               f"{dev.family or ''} {dev.model or ''}  ({dev.rtt * 1000:.0f} ms)")
+
+    def _fill_grid():
+        # le righe della griglia vengono riscritte dalla prima, fino a 10 inverter
+        for modbus_entry, ip_entry, _slave_var in inverter_entries:
+            modbus_entry.delete(0, tk.END)
+            ip_entry.delete(0, tk.END)
+        for dev, (modbus_entry, ip_entry, _slave_var) in zip(found, inverter_entries):
+            modbus_entry.insert(0, str(dev.slave))
+            ip_entry.insert(0, dev.address)
+        if len(found) > len(inverter_entries):
+            messagebox.showwarning("Scansione", f"Trovati {len(found)} inverter, la griglia ne contiene "
+                                                f"{len(inverter_entries)}.")
+
+    def start_scan():
+        stop_logging_and_release()  # libera COM/connessioni del logger
+        stop.clear()
+        found.clear()
+        results.delete(0, tk.END)
+        status_var.set("Scansione in corso...")
+        targets = [t.strip() for t in targets_entry.get().split(",") if t.strip()] if proto == "RTU" \
+            else targets_entry.get().strip()
+        if proto != "RTU" and not targets:
+            status_var.set("Inserisci almeno un IP")
+            return
+
+        def worker():
+            t0 = time.time()
+            try:
+                devs = discover(proto, targets or None, slaves=slaves_entry.get() or "1",
+                                on_found=lambda d: scan_win.after(0, _show, d), stop=stop)
+            except Exception as e:
+                scan_win.after(0, status_var.set, f"Errore: {e}")
+                return
+            found.extend(devs)
+            scan_win.after(0, status_var.set, f"Trovati {len(devs)} inverter in {time.time() - t0:.1f} s")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    btns = tk.Frame(scan_win)
+    btns.grid(row=5, column=0, columnspan=2, pady=5)
+    tk.Button(btns, text="Avvia", bg="lightgreen", command=start_scan).pack(side="left", padx=2)
+    tk.Button(btns, text="Ferma", bg="orange", command=stop.set).pack(side="left", padx=2)
+    tk.Button(btns, text="Compila griglia", command=_fill_grid).pack(side="left", padx=2)
+    tk.Button(btns, text="Exit", bg="red", fg="white", command=lambda: (stop.set(), scan_win.destroy())).pack(
+        side="left", padx=2)
+
+
 # Gestisco il Log del test automatico
 def open_log_panel():
     log_win = tk.Toplevel()
@@ -714,6 +749,14 @@ def open_log_panel():
     ttk.Label(log_win, text="Protocollo di Comunicazione").pack(anchor="w", padx=10, pady=(10, 0))
     ttk.Combobox(log_win, textvariable=protocol_var, values=["TCP", "RTU", "AzzurroHUB"]).pack(anchor="w", padx=10)
 
+    # Limite richieste verso l'AzzurroHUB (req/s, 0 = nessun limite); burst = una riga di polling
+    hub_rate_frame = tk.Frame(log_win)
+    hub_rate_frame.pack(anchor="w", padx=10)
+    tk.Label(hub_rate_frame, text="HUB req/s (0 = off):").pack(side="left")
+    hub_rate_entry = tk.Entry(hub_rate_frame, width=6)
+    hub_rate_entry.insert(0, f"{HUB_DEFAULT_RATE:g}")
+    hub_rate_entry.pack(side="left", padx=5)
+
     # Fino a 10 inverter
     inverter_entries = []
 
@@ -767,22 +810,23 @@ def open_log_panel():
         inverter_entries.append((modbus_entry, ip_entry, slave_var))#, alim_var))
 
     # === Registri di default ===
+    # (label, registro, scaling, periodo [s][, tipo]) — periodo vuoto = campionamento, tipo vuoto = auto
     default_registers = [
-        ("System State", "0x0404", "1"),
-        ("Active Output Power [kW]", "0x0485", "0.01"),
-        ("Reactive Output Power [kVAr]", "0x0486", "0.01"),
-        ("Apparent Output Power [kVA]", "0x0487", "0.01"),
-        ("Active PCC Power [kW]", "0x0488", "0.01"),
-        ("Reactive PCC Power [kVAr]", "0x0489", "0.01"),
-        ("Apparent PCC Power [kVA]", "0x048A", "0.01"),
-        ("Voltage DC1 [V]", "0x0584", "0.1"),
-        ("Current DC1 [A]", "0x0585", "0.01"),
-        ("Power DC1 [kW]", "0x0586", "0.01"),
-        ("Voltage DC2 [V]", "0x0587", "0.1"),
-        ("Current DC2 [A]", "0x0588", "0.01"),
-        ("Power DC2 [kW]", "0x0589", "0.01"),
-        ("Charge/Discharge Power [kW]", "0x0667", "0.1"),
-        ("Battery SOC [%]", "0x0668", "1")
+        ("System State", "0x0404", "1", "5"),
+        ("Active Output Power [kW]", "0x0485", "0.01", ""),
+        ("Reactive Output Power [kVAr]", "0x0486", "0.01", ""),
+        ("Apparent Output Power [kVA]", "0x0487", "0.01", ""),
+        ("Active PCC Power [kW]", "0x0488", "0.01", ""),
+        ("Reactive PCC Power [kVAr]", "0x0489", "0.01", ""),
+        ("Apparent PCC Power [kVA]", "0x048A", "0.01", ""),
+        ("Voltage DC1 [V]", "0x0584", "0.1", ""),
+        ("Current DC1 [A]", "0x0585", "0.01", ""),
+        ("Power DC1 [kW]", "0x0586", "0.01", ""),
+        ("Voltage DC2 [V]", "0x0587", "0.1", ""),
+        ("Current DC2 [A]", "0x0588", "0.01", ""),
+        ("Power DC2 [kW]", "0x0589", "0.01", ""),
+        ("Charge/Discharge Power [kW]", "0x0667", "0.1", ""),
+        ("Battery SOC [%]", "0x0668", "1", "10")
     ]
 
     # Sezione registri (20 registri in 4 colonne da 5 righe)
@@ -795,12 +839,17 @@ def open_log_panel():
     register_entries = []
 
     # Intestazioni per ciascuna colonna
+    reg_types = ["auto", "u16", "s16", "u32", "s32", "f32", "u32_lsw", "s32_lsw", "f32_lsw"]
     for col in range(4):  # 4 colonne
-        tk.Label(registers_frame, text="Label", font=("Arial", 9, "bold")).grid(row=0, column=col * 3, padx=2, pady=2)
-        tk.Label(registers_frame, text="Registro", font=("Arial", 9, "bold")).grid(row=0, column=col * 3 + 1, padx=2,
+        tk.Label(registers_frame, text="Label", font=("Arial", 9, "bold")).grid(row=0, column=col * 5, padx=2, pady=2)
+        tk.Label(registers_frame, text="Registro", font=("Arial", 9, "bold")).grid(row=0, column=col * 5 + 1, padx=2,
                                                                                    pady=2)
-        tk.Label(registers_frame, text="Scaling", font=("Arial", 9, "bold")).grid(row=0, column=col * 3 + 2, padx=2,
+        tk.Label(registers_frame, text="Scaling", font=("Arial", 9, "bold")).grid(row=0, column=col * 5 + 2, padx=2,
                                                                                   pady=2)
+        tk.Label(registers_frame, text="T [s]", font=("Arial", 9, "bold")).grid(row=0, column=col * 5 + 3, padx=2,
+                                                                                pady=2)
+        tk.Label(registers_frame, text="Tipo", font=("Arial", 9, "bold")).grid(row=0, column=col * 5 + 4, padx=2,
+                                                                               pady=2)
 
     # Registri (20 = 4 colonne × 5 righe)
     for i in range(20):
@@ -810,20 +859,29 @@ def open_log_panel():
         name_entry = tk.Entry(registers_frame, width=20)
         reg_entry = tk.Entry(registers_frame, width=10)
         scale_entry = tk.Entry(registers_frame, width=6)
+        period_entry = tk.Entry(registers_frame, width=4)
+        # editabile: accetta anche asciiN (N registri)
+        type_combo = ttk.Combobox(registers_frame, values=reg_types, width=7)
+        type_combo.set("auto")
 
         if i < len(default_registers):
-            name, reg, scale = default_registers[i]
+            name, reg, scale, period, *dtype = default_registers[i]
             name_entry.insert(0, name)
             reg_entry.insert(0, reg)
             scale_entry.insert(0, scale)
+            period_entry.insert(0, period)
+            if dtype:
+                type_combo.set(dtype[0])
         else:
             scale_entry.insert(0, "1")
 
-        name_entry.grid(row=row, column=col * 3, padx=2, pady=2)
-        reg_entry.grid(row=row, column=col * 3 + 1, padx=2, pady=2)
-        scale_entry.grid(row=row, column=col * 3 + 2, padx=2, pady=2)
+        name_entry.grid(row=row, column=col * 5, padx=2, pady=2)
+        reg_entry.grid(row=row, column=col * 5 + 1, padx=2, pady=2)
+        scale_entry.grid(row=row, column=col * 5 + 2, padx=2, pady=2)
+        period_entry.grid(row=row, column=col * 5 + 3, padx=2, pady=2)
+        type_combo.grid(row=row, column=col * 5 + 4, padx=2, pady=2)
 
-        register_entries.append((name_entry, reg_entry, scale_entry))
+        register_entries.append((name_entry, reg_entry, scale_entry, period_entry, type_combo))
 
     # File CSV
     # file_frame = tk.Frame(log_win)
@@ -857,6 +915,30 @@ def open_log_panel():
     sampling_entry.insert(0, "1")
     sampling_entry.pack(side="left", padx=5)
 
+    # Logging "solo variazioni" (soak test lunghi): banda morta 1% + riga forzata ogni N secondi
+    change_only_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(time_frame, text="Log solo variazioni", variable=change_only_var).pack(side="left", padx=(20, 0))
+    tk.Label(time_frame, text="Max silenzio [s]:").pack(side="left")
+    silence_entry = tk.Entry(time_frame, width=5)
+    silence_entry.insert(0, "60")
+    silence_entry.pack(side="left", padx=5)
+
+    def _make_change_filter():
+        if not change_only_var.get():
+            return None
+        try:
+            silence = float(silence_entry.get())
+        except Exception:
+            silence = 60.0
+        return DeadbandFilter(default_abs=0.0, default_rel=0.01, max_silence=silence)
+
+    # Sorveglianza fault 0x0405..0x040E (fronti con timestamp al ms): su richiesta, aggiunge traffico
+    fault_watch_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(time_frame, text="Sorveglia fault (1 s)", variable=fault_watch_var).pack(side="left", padx=(20, 0))
+
+    def _fault_period():
+        return 1.0 if fault_watch_var.get() else None
+
     # # Durata test calcolata automaticamente (readonly)
     # tk.Label(time_frame, text="Durata test [s]:", font=("Arial", 10, "bold")).pack(side="left", padx=(20, 0))
     # global duration_entry_var, duration_entry
@@ -881,26 +963,40 @@ def open_log_panel():
             messagebox.showerror("Errore", "Campionamento non valido")
             return
 
-        inverter_data = []
-        for idx, (modbus_entry, ip_entry, slave_var) in enumerate(inverter_entries):
-            ip_val = ip_entry.get().strip()
-            modbus_val = modbus_entry.get().strip()
-            if not ip_val or not modbus_val:
-                continue
-            mode = protocol_var.get().strip()
+        mode = protocol_var.get().strip()
+
+        rows = [(ip_entry.get().strip(), modbus_entry.get().strip(), slave_var.get())
+                for modbus_entry, ip_entry, slave_var in inverter_entries]
+        rows = [r for r in rows if r[0] and r[1]]
+
+        if mode == "AzzurroHUB":
+            try:
+                hub_rate = float(hub_rate_entry.get())
+            except Exception:
+                messagebox.showerror("Errore", "HUB req/s non valido")
+                return
+            for hub_ip in {r[0] for r in rows}:
+                configure_hub_limiter(hub_ip, 55400, rate=hub_rate, burst=HUB_DEFAULT_BURST)
+
+        def _sn_of(ip_val: str, modbus_val: str) -> str:
             if mode == "TCP":
-                sn = read_SN(mode, ip_tcp=ip_val)
+                return read_SN(mode, ip_tcp=ip_val)
             elif mode == "RTU":
-                sn = read_SN(mode, porta_com=ip_val, slave_id_rtu=int(modbus_val))
+                return read_SN(mode, porta_com=ip_val, slave_id_rtu=int(modbus_val))
             elif mode == "AzzurroHUB":
-                sn = read_SN(mode, ip_hub=ip_val, slave_id_azzurro=int(modbus_val))
-            else:
-                sn = "UNKNOWN"
+                return read_SN(mode, ip_hub=ip_val, slave_id_azzurro=int(modbus_val))
+            return "UNKNOWN"
+
+        # letture SN in parallelo (su RTU restano in coda sulla stessa linea)
+        with ThreadPoolExecutor(max_workers=max(1, len(rows)), thread_name_prefix="sn") as pool:
+            sns = list(pool.map(lambda r: _sn_of(r[0], r[1]), rows))
+        inverter_data = []
+        for (ip_val, modbus_val, is_slave), sn in zip(rows, sns):
             inverter_data.append({
                 "sn": sn,
                 "ip": ip_val,
                 "modbus": int(modbus_val),
-                "slave": slave_var.get(),
+                "slave": is_slave,
                 #"alimentatore": alim_var.get()
             })
 
@@ -919,12 +1015,19 @@ def open_log_panel():
         file_path = os.path.join(session_dir, f"{test_name}.csv")
 
         registers = []
-        for name_entry, reg_entry, scale_entry in register_entries:
+        for name_entry, reg_entry, scale_entry, period_entry, type_combo in register_entries:
             name = name_entry.get().strip()
             reg = reg_entry.get().strip()
             scale = scale_entry.get().strip()
+            period = period_entry.get().strip()
+            dtype = type_combo.get().strip() or "auto"
             if name and reg and scale:
-                registers.append((name, reg, scale))
+                try:
+                    parse_dtype(dtype)
+                except ValueError as e:
+                    messagebox.showerror("Errore", f"{name}: {e}")
+                    return
+                registers.append((name, reg, scale, period, dtype))
 
         if not registers:
             messagebox.showerror("Errore", "Nessun registro valido selezionato.")
@@ -1041,36 +1144,28 @@ def open_log_panel():
         # 1) Crea service condiviso ma SOLO per le porte realmente presenti
         inv_cfgs = build_inv_cfgs_from_ui(protocol_var.get(), inverter_data)
 
+        # DC/AC/inverter aperti in parallelo: gli strumenti assenti restano fuori (vedi readiness)
         dc_fixed = {"DC1": "ASRL20::INSTR", "DC2": "ASRL21::INSTR", "DC3": "ASRL22::INSTR"}
-        present_dc = {}
-        for ch, addr in dc_fixed.items():
-            ok, info = _visa_is_present(addr)
-            if ok:
-                present_dc[ch] = addr
-                print(f"[DC] {ch} OK @ {addr}" + (f" — {info}" if info else ""))
-            else:
-                print(f"[DC] {ch} NON presente @ {addr}")
-
         ac_fixed = "ASRL5::INSTR"
-        ac_ok, ac_info = _visa_is_present(ac_fixed)
-        ac_addr = ac_fixed if ac_ok else None
-        print(f"[AC] {'OK' if ac_ok else 'NON presente'} @ {ac_fixed}" + (f" — {ac_info}" if ac_ok and ac_info else ""))
-
         current_shared_ins = Instruments(
-            dc_map=(present_dc if present_dc else None),
-            ac_addr=ac_addr,
+            dc_map=dc_fixed,
+            ac_addr=ac_fixed,
             inv_cfgs=inv_cfgs,
             protocol=protocol_var.get()
         )
+        # errori SCPI (controllo differito per step di test) nel log della sessione
+        current_shared_ins.scpi_log_path = os.path.join(session_dir, "scpi_errors.csv")
         # 2) Avvia logging con service condiviso e conserva il thread
         logging_thread = start_logging_routine(protocol_var.get(), inverter_data, registers, file_path, sampling,
-                                               duration, shared_ins=current_shared_ins)
+                                               duration, shared_ins=current_shared_ins,
+                                               change_filter=_make_change_filter(), fault_period=_fault_period())
         # dopo aver popolato inverter_data e registers e avviato logging_thread
         # ricostruisci i nomi colonna come nel logger:
         col_names = []
         for inv_index, inv in enumerate(inverter_data):
-            for label, _, _ in registers:
+            for label, *_ in registers:
                 col_names.append(f"Inverter{inv_index + 1}_{label}")
+        col_names += [c for _, _, c in current_shared_ins.source_columns()]
 
         # default: prima grandezza = Inverter1_<primo label>
         default_col = col_names[0] if col_names else None
@@ -1117,7 +1212,8 @@ def open_log_panel():
 
                     # avvia logger per questo test
                     log_thread = start_logging_routine(protocol, inverter_data, registers, csv_path, sampling, dur,
-                                                       shared_ins=shared_ins)
+                                                       shared_ins=shared_ins, change_filter=_make_change_filter(),
+                                                       fault_period=_fault_period())
 
                     # avvia test singolo
                     t = run_test_from_template(template_path, sn, protocol, inverter_data, shared_ins=shared_ins)
@@ -1191,6 +1287,19 @@ def open_log_panel():
         global logging_paused
         logging_paused = False
 
+    def check_scpi_errors():
+        # controllo su richiesta delle code errori SCPI (in thread: le query non bloccano la UI)
+        ins = current_shared_ins
+        if ins is None:
+            messagebox.showinfo("Errori SCPI", "Nessuna sessione strumenti attiva.")
+            return
+
+        def _run():
+            found = ins.check_errors("manuale")
+            msg = "\n".join(f"{n}: {code} {text}" for n, r in found.items() for code, text in r["errors"])
+            log_win.after(0, lambda: messagebox.showinfo("Errori SCPI", msg or "Nessun errore in coda."))
+        threading.Thread(target=_run, daemon=True).start()
+
     button_frame = tk.Frame(log_win)
     button_frame.pack(fill="x", pady=5, padx=5)
 
@@ -1215,6 +1324,9 @@ def open_log_panel():
     tk.Button(button_frame, text="Pause", bg="orange", command=pause_logging).pack(side="right", padx=2)
     tk.Button(button_frame, text="Resume", bg="lightblue", command=resume_logging).pack(side="right", padx=2)
     tk.Button(button_frame, text="Exit", bg="red", fg="white", command=log_win.destroy).pack(side="right", padx=2)
+    tk.Button(button_frame, text="Scansione", command=lambda: open_scan_panel(log_win, protocol_var, inverter_entries)
+              ).pack(side="right", padx=2)
+    tk.Button(button_frame, text="Errori SCPI", command=check_scpi_errors).pack(side="right", padx=2)
 
     # -- Riga playlist (.txt) --
     playlist_row = tk.Frame(log_win)
@@ -1363,6 +1475,7 @@ def open_inverter_control_panel():
                     client.write_register(reg, scaled_vals[0], slave=slave_id)
                 else:
                     client.write_registers(reg, scaled_vals, slave=slave_id)
+                forget_commanded_state()
                 messagebox.showinfo("Scrittura", f"Scritti: {val_list} (scalati: {scaled_vals})")
 
             client.close()
@@ -1454,7 +1567,7 @@ def open_ac_control_panel():
     vac = tk.StringVar()
     freq = tk.StringVar()
 
-    inst_ac = None  # Oggetto pyvisa
+    inst_ac = None  # Sessione VISA condivisa (visa_registry)
 
     def send_command():
         nonlocal inst_ac
@@ -1463,16 +1576,12 @@ def open_ac_control_panel():
             freq_val = float(freq.get())
             tipo = selected_tipo.get()
 
-            rm = pyvisa.ResourceManager()
-            inst_ac = rm.open_resource("ASRL5::INSTR")  # <--- Adatta qui la porta!
+            inst_ac = open_session("ASRL5::INSTR")  # <--- Adatta qui la porta!
 
-            inst_ac.write(f'VOLT {vac_val}')
-            inst_ac.write(f'FREQ {freq_val}')
-
-            if tipo == "Monofase":
-                inst_ac.write("SYST:FUNC ONE")
-            else:
-                inst_ac.write("SYST:FUNC THREE")
+            forget_commanded_state(inst_ac.resource)
+            send_batch(inst_ac, [f'VOLT {vac_val}',
+                                 f'FREQ {freq_val}',
+                                 "SYST:FUNC ONE" if tipo == "Monofase" else "SYST:FUNC THREE"])
 
             messagebox.showinfo("Successo", "Comandi AC inviati correttamente.")
 
@@ -1482,6 +1591,7 @@ def open_ac_control_panel():
     def turn_on():
         try:
             if inst_ac:
+                forget_commanded_state(inst_ac.resource)
                 inst_ac.write('OUTP ON')
         except Exception as e:
             messagebox.showerror("Errore", str(e))
@@ -1489,6 +1599,7 @@ def open_ac_control_panel():
     def turn_off():
         try:
             if inst_ac:
+                forget_commanded_state(inst_ac.resource)
                 inst_ac.write('OUTP OFF')
         except Exception as e:
             messagebox.showerror("Errore", str(e))
@@ -1537,7 +1648,7 @@ def open_dc_control_panel():
     isc = tk.StringVar()
     ff = tk.StringVar(value="1.0")
 
-    inst = None  # Variabile di riferimento per pyvisa
+    inst = None  # Sessione VISA condivisa (visa_registry)
 
     def send_command():
         nonlocal inst
@@ -1550,13 +1661,13 @@ def open_dc_control_panel():
                 raise ValueError("Fattore di forma deve essere tra 0 e 1")
 
             porta = porta_map[selected_strumento.get()]
-            rm = pyvisa.ResourceManager()
-            inst = rm.open_resource(porta)
+            inst = open_session(porta)
 
-            inst.write(f'SOL:USER:VOC {voc_val}')
-            inst.write(f'SOL:USER:VMP {voc_val * ff_val}')
-            inst.write(f'SOL:USER:ISC {isc_val}')
-            inst.write(f'SOL:USER:IMP {isc_val * ff_val}')
+            forget_commanded_state(porta)
+            send_batch(inst, [f'SOL:USER:VOC {voc_val}',
+                              f'SOL:USER:VMP {voc_val * ff_val}',
+                              f'SOL:USER:ISC {isc_val}',
+                              f'SOL:USER:IMP {isc_val * ff_val}'])
             messagebox.showinfo("Successo", "Comandi inviati correttamente.")
         except Exception as e:
             messagebox.showerror("Errore", str(e))
@@ -1564,6 +1675,7 @@ def open_dc_control_panel():
     def turn_on():
         try:
             if inst:
+                forget_commanded_state(inst.resource)
                 inst.write('OUTP 1')
         except Exception as e:
             messagebox.showerror("Errore", str(e))
@@ -1571,6 +1683,7 @@ def open_dc_control_panel():
     def turn_off():
         try:
             if inst:
+                forget_commanded_state(inst.resource)
                 inst.write('OUTP 0')
         except Exception as e:
             messagebox.showerror("Errore", str(e))
@@ -1866,3 +1979,4 @@ for text, command, color in buttons:
     btn.pack(fill="x", padx=30, pady=5)
 
 root.mainloop()
+close_all_sessions()  # sessioni VISA condivise (strumenti, pannelli manuali)
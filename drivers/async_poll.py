@@ -0,0 +1,330 @@
+# drivers/async_poll.py
+from __future__ import annotations
+import asyncio
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusIOException
+from .rate_limit import find_hub_limiter
+from .serial_bus import PRIO_NORMAL
+
+# device: (host, port, slave id)
+Device = Tuple[str, int, int]
+
+# Attesa massima [s] di una chiamata sincrona (TcpTransport): coda sul lock dell'host + richiesta
+CALL_WAIT_MAX = 30.0
+
+
+class AsyncPoller:
+    """
+    Motore asyncio per il polling concorrente degli inverter Modbus TCP / AzzurroHUB.
+    Gira su un event loop in un thread dedicato; la facciata sincrona (read_blocks)
+    permette a Instruments e al logger di usarlo senza diventare async.
+      - un client per (host, port): più slave dietro lo stesso HUB condividono la connessione
+        e vengono serializzati; host diversi sono interrogati in parallelo
+      - è anche il trasporto dei driver sincroni (TcpTransport): verso ogni host c'è
+        una sola connessione TCP, usata sia dal polling sia dal test executor
+      - deadline per dispositivo: un inverter lento/irraggiungibile non blocca la riga
+      - timeout per richiesta: quello del driver che la fa (TcpTransport) o, per il polling,
+        il più lungo tra i driver attivi sull'host (una scansione non lo accorcia agli altri)
+      - ogni riapertura della connessione incrementa la generazione dell'host e avvisa
+        i listener (add_reconnect_listener): dall'altra parte può esserci un altro apparecchio
+    """
+
+    def __init__(self, timeout: float = 1.0):
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="AsyncPoller", daemon=True)
+        self._thread.start()
+        self._clients: Dict[Tuple[str, int], AsyncModbusTcpClient] = {}
+        self._locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+        self._generations: Dict[Tuple[str, int], int] = {}  # connessioni riuscite per host
+
+    # ---- lato asyncio ----
+    async def _get_client(self, host: str, port: int) -> Optional[AsyncModbusTcpClient]:
+        key = (host, port)
+        cli = self._clients.get(key)
+        if cli is None:
+            cli = AsyncModbusTcpClient(host, port=port, timeout=_host_timeout(host, port, self.timeout), retries=0)
+            self._clients[key] = cli
+        if not cli.connected:
+            try:
+                await cli.connect()
+            except Exception as e:
+                print(f"[WARN] Connessione async {host}:{port} fallita: {e}")
+            if cli.connected:
+                gen = self._generations.get(key, 0) + 1
+                self._generations[key] = gen
+                if gen > 1:
+                    _notify_reconnect(host, port)
+        return cli if cli.connected else None
+
+    def _drop_client(self, host: str, port: int):
+        cli = self._clients.pop((host, port), None)
+        if cli is not None:
+            try: cli.close()
+            except Exception: pass
+
+    async def _request(self, host: str, port: int, cli: AsyncModbusTcpClient, fn, timeout: float):
+        """
+        Esegue fn(cli) sulla connessione condivisa con il timeout di risposta 'timeout' (le
+        richieste sullo stesso host sono serializzate dal lock, quindi il timeout del client
+        si può impostare richiesta per richiesta). Se il task viene cancellato mentre la
+        richiesta è in volo (deadline), la risposta resterebbe pendente sul socket: chiudiamo
+        la connessione, al prossimo uso si riapre; lo stesso se la risposta non arriva entro
+        'timeout' (pymodbus non controlla il transaction id: una risposta tardiva verrebbe
+        presa per quella della richiesta successiva). Cancellazioni prima dell'invio (attesa
+        del lock o del token) non toccano la connessione.
+        """
+        # il TransactionManager ha una sua copia dei parametri: è quella che usa per l'attesa
+        cli.comm_params.timeout_connect = timeout
+        cli.ctx.comm_params.timeout_connect = timeout
+        try:
+            return await fn(cli)
+        except asyncio.CancelledError:
+            self._drop_client(host, port)
+            raise
+        except ModbusIOException:
+            self._drop_client(host, port)
+            raise
+
+    async def _acquire_token(self, limiter, priority: int = PRIO_NORMAL) -> bool:
+        """
+        Token dal limiter condiviso con il test executor, senza thread bloccati: try_acquire
+        non blocca e l'attesa è un asyncio.sleep. Se il task viene cancellato (deadline)
+        nessun token resta prenotato o consumato a vuoto.
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + self.timeout
+        while not limiter.try_acquire(priority):
+            left = end - loop.time()
+            if left <= 0:
+                return False
+            await asyncio.sleep(min(limiter.wait_hint(), left))
+        return True
+
+    async def _read_device(self, dev: Device, blocks, out: List[Optional[List[int]]], priority: int):
+        host, port, slave = dev
+        limiter = find_hub_limiter(host, port)  # solo AzzurroHUB
+        cli = await self._get_client(host, port)
+        if cli is None:
+            return
+        timeout = _host_timeout(host, port, self.timeout)
+        for k, b in enumerate(blocks):
+            start, count = (b.start, b.count) if hasattr(b, "start") else b
+            if limiter is not None and not await self._acquire_token(limiter, priority):
+                continue
+            try:
+                rr = await self._request(host, port, cli, lambda c: c.read_holding_registers(
+                    int(start), count=int(count), slave=slave), timeout)
+                if rr is not None and not rr.isError():
+                    out[k] = list(rr.registers)
+            except Exception as e:
+                print(f"[WARN] Lettura async {host}:{port}/{slave} @0x{int(start):04X}: {e}")
+
+    async def _read_with_deadline(self, dev: Device, blocks, out, deadline: float, priority: int):
+        # la deadline parte dopo il lock dell'host: l'attesa dietro agli altri slave dello
+        # stesso HUB non la consuma
+        async with self._locks.setdefault((dev[0], dev[1]), asyncio.Lock()):
+            try:
+                await asyncio.wait_for(self._read_device(dev, blocks, out, priority), timeout=deadline)
+            except asyncio.TimeoutError:
+                print(f"[WARN] Deadline {deadline:.2f}s superata per {dev[0]}:{dev[1]}/{dev[2]}")
+
+    async def _read_all(self, devices: Dict[str, Device], blocks, deadline: float, priority: int):
+        results = {name: [None] * len(blocks) for name in devices}
+        await asyncio.gather(*(self._read_with_deadline(dev, blocks, results[name], deadline, priority)
+                               for name, dev in devices.items()))
+        return results
+
+    async def _call(self, host: str, port: int, fn, timeout: float):
+        """Una richiesta dal lato sincrono (TcpTransport), serializzata con il polling sullo stesso host."""
+        async with self._locks.setdefault((host, port), asyncio.Lock()):
+            cli = await self._get_client(host, port)
+            if cli is None:
+                raise ConnectionError(f"{host}:{port} non raggiungibile")
+            if fn is None:  # solo connessione
+                return True
+            return await self._request(host, port, cli, fn, timeout)
+
+    async def _drop(self, host: str, port: int):
+        async with self._locks.setdefault((host, port), asyncio.Lock()):
+            self._drop_client(host, port)
+
+    async def _close_all(self):
+        for host, port in list(self._clients):
+            self._drop_client(host, port)
+
+    # ---- facciata sincrona ----
+    def read_blocks(self, devices: Dict[str, Device], blocks: Sequence,
+                    deadline: float = 2.0, priority: int = PRIO_NORMAL) -> Dict[str, List[Optional[List[int]]]]:
+        """
+        Legge gli stessi blocchi da tutti i 'devices' {nome: (host, port, slave)} in parallelo.
+        Ritorna {nome: [regs|None per blocco]}; la durata è ~ quella del dispositivo più lento,
+        limitata da 'deadline' per dispositivo (gli slave dello stesso HUB vanno in fila).
+        'priority' vale per i token del limiter HUB (PRIO_LOW: letture di servizio).
+        """
+        if not devices:
+            return {}
+        per_host = max(Counter((h, p) for h, p, _ in devices.values()).values())
+        fut = asyncio.run_coroutine_threadsafe(self._read_all(devices, list(blocks), deadline, priority), self._loop)
+        try:
+            return fut.result(timeout=deadline * per_host + 1.0)
+        except Exception as e:
+            print(f"[WARN] Polling async fallito: {e}")
+            fut.cancel()
+            return {name: [None] * len(blocks) for name in devices}
+
+    def call(self, host: str, port: int, fn, timeout: Optional[float] = None, wait: float = CALL_WAIT_MAX):
+        """
+        Esegue fn(client async) sul loop e ne attende il risultato (eccezioni rilanciate).
+        'timeout' = timeout di risposta della sola richiesta (None: quello del poller).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        fut = asyncio.run_coroutine_threadsafe(self._call(host, port, fn, timeout), self._loop)
+        try:
+            return fut.result(timeout=wait)
+        except Exception:
+            fut.cancel()  # attesa scaduta: la richiesta, se in volo, chiude la connessione
+            raise
+
+    def is_connected(self, host: str, port: int) -> bool:
+        cli = self._clients.get((host, port))
+        return bool(cli is not None and cli.connected)
+
+    def generation(self, host: str, port: int) -> int:
+        """Connessioni riuscite verso (host, port): cambia a ogni riapertura."""
+        return self._generations.get((host, port), 0)
+
+    def drop(self, host: str, port: int):
+        """Chiude la connessione verso (host, port); al prossimo uso si riapre."""
+        try:
+            asyncio.run_coroutine_threadsafe(self._drop(host, port), self._loop).result(timeout=CALL_WAIT_MAX)
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_all(), self._loop).result(timeout=2.0)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=2.0)
+
+
+class TcpTransport:
+    """
+    Client sincrono per Inverter (TCP / AzzurroHUB) con la stessa API usata dai driver
+    (connect/close/connected/read_holding_registers/write_registers), appoggiato alla
+    connessione condivisa dell'AsyncPoller di processo. Il registro conta i trasporti
+    attivi per (host, porta): la connessione si chiude solo quando l'ultimo viene rilasciato.
+    """
+
+    def __init__(self, poller: AsyncPoller, host: str, port: int, timeout: float = 1.0):
+        self.poller = poller
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        _attach(self)
+
+    @property
+    def connected(self) -> bool:
+        return self.poller.is_connected(self.host, self.port)
+
+    @property
+    def generation(self) -> int:
+        return self.poller.generation(self.host, self.port)
+
+    def connect(self) -> bool:
+        _attach(self)  # riuso dopo release()
+        try:
+            return bool(self.poller.call(self.host, self.port, None, timeout=self.timeout))
+        except Exception:
+            return False
+
+    def close(self):
+        """Forza la riconnessione, ma solo se nessun altro driver sta usando la stessa connessione."""
+        if _users_of(self.host, self.port) <= 1:
+            self.poller.drop(self.host, self.port)
+
+    def release(self):
+        """Fine uso (Inverter.close): chiude la connessione se era l'ultimo utente."""
+        if _detach(self):
+            self.poller.drop(self.host, self.port)
+
+    def read_holding_registers(self, address: int, count: int = 1, slave: int = 1):
+        return self.poller.call(self.host, self.port,
+                                lambda c: c.read_holding_registers(address, count=count, slave=slave),
+                                timeout=self.timeout)
+
+    def write_registers(self, address: int, values, slave: int = 1):
+        return self.poller.call(self.host, self.port,
+                                lambda c: c.write_registers(address, values, slave=slave),
+                                timeout=self.timeout)
+
+
+# ---- registro process-wide: un AsyncPoller (event loop) e una connessione per (host, porta) ----
+_poller: Optional[AsyncPoller] = None
+_users: Dict[Tuple[str, int], Dict[int, float]] = {}  # trasporti attivi: id -> timeout
+_reconnect_listeners: List[Callable[[str, int], None]] = []
+_poller_lock = threading.Lock()
+
+
+def _attach(t: TcpTransport):
+    with _poller_lock:
+        _users.setdefault((t.host, t.port), {})[id(t)] = t.timeout
+
+
+def _detach(t: TcpTransport) -> bool:
+    """Toglie 't' dagli utenti; True se era l'ultimo."""
+    with _poller_lock:
+        users = _users.get((t.host, t.port))
+        if not users or id(t) not in users:
+            return False
+        del users[id(t)]
+        if users:
+            return False
+        del _users[(t.host, t.port)]
+        return True
+
+
+def _users_of(host: str, port: int) -> int:
+    with _poller_lock:
+        return len(_users.get((host, port), ()))
+
+
+def _host_timeout(host: str, port: int, default: float) -> float:
+    """Timeout del polling verso (host, port): il più lungo tra i trasporti attivi, altrimenti 'default'."""
+    with _poller_lock:
+        return max(_users.get((host, port), {}).values(), default=default)
+
+
+def get_async_poller() -> AsyncPoller:
+    """AsyncPoller di processo, creato al primo uso."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = AsyncPoller()
+        return _poller
+
+
+def get_tcp_transport(host: str, port: int, timeout: float = 1.0) -> TcpTransport:
+    """Trasporto sincrono verso (host, port) sulla connessione condivisa dell'AsyncPoller."""
+    return TcpTransport(get_async_poller(), host, int(port), timeout=timeout)
+
+
+def add_reconnect_listener(fn: Callable[[str, int], None]):
+    """fn(host, port) a ogni riapertura della connessione condivisa (dal thread dell'event loop)."""
+    with _poller_lock:
+        _reconnect_listeners.append(fn)
+
+
+def _notify_reconnect(host: str, port: int):
+    with _poller_lock:
+        listeners = list(_reconnect_listeners)
+    for fn in listeners:
+        try:
+            fn(host, port)
+        except Exception as e:
+            print(f"[WARN] listener riconnessione {host}:{port}: {e}")
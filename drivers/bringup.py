@@ -0,0 +1,104 @@
+# drivers/bringup.py
+"""
+Avvio parallelo degli strumenti: ogni dispositivo (DC, AC, inverter) viene aperto e verificato
+in un thread del pool con un proprio timeout, così gli strumenti assenti non si sommano in
+secondi di attesa prima della sessione. Il risultato è un ReadinessReport strutturato.
+"""
+from __future__ import annotations
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class DeviceStatus:
+    kind: str               # "DC" | "AC" | "INV"
+    name: str               # es. "DC1", "AC", "INV1"
+    address: str
+    ok: bool = False
+    info: str = ""          # IDN / stato connessione / errore
+    elapsed: float = 0.0    # [s] durata dell'avvio del dispositivo
+    timed_out: bool = False
+
+
+@dataclass
+class ReadinessReport:
+    devices: List[DeviceStatus] = field(default_factory=list)
+    elapsed: float = 0.0    # [s] durata complessiva (≈ il dispositivo più lento)
+
+    def get(self, name: str) -> Optional[DeviceStatus]:
+        return next((d for d in self.devices if d.name == name), None)
+
+    def ready(self, kind: Optional[str] = None) -> List[str]:
+        return [d.name for d in self.devices if d.ok and (kind is None or d.kind == kind)]
+
+    def missing(self, kind: Optional[str] = None) -> List[str]:
+        return [d.name for d in self.devices if not d.ok and (kind is None or d.kind == kind)]
+
+    @property
+    def all_ready(self) -> bool:
+        return all(d.ok for d in self.devices)
+
+    def lines(self) -> List[str]:
+        out = []
+        for d in self.devices:
+            state = "OK" if d.ok else ("TIMEOUT" if d.timed_out else "NON presente")
+            out.append(f"[{d.kind}] {d.name} {state} @ {d.address}" + (f" — {d.info}" if d.info else "")
+                       + f" ({d.elapsed:.2f} s)")
+        return out
+
+    def summary(self) -> str:
+        return (f"{len(self.ready())}/{len(self.devices)} strumenti pronti in {self.elapsed:.2f} s"
+                + (f" (mancanti: {', '.join(self.missing())})" if self.missing() else ""))
+
+    def print(self):
+        for ln in self.lines():
+            print(ln)
+        print(f"[INFO] {self.summary()}")
+
+
+# Un task di avvio: fn() → (oggetto, ok, info). Un'eccezione vale come dispositivo assente.
+BringUpTask = Tuple[str, str, str, Callable[[], Tuple[Any, bool, str]], float]
+
+
+def bring_up(tasks: List[BringUpTask], on_late: Optional[Callable[[Any], None]] = None
+             ) -> Tuple[ReadinessReport, Dict[str, Any]]:
+    """
+    Esegue i task (kind, name, address, fn, timeout [s]) in parallelo, un thread ciascuno.
+    Ritorna (report, {name: oggetto}) con i soli dispositivi pronti entro il proprio timeout.
+    I task scaduti continuano in background: se poi completano, l'oggetto passa a 'on_late'
+    (es. per chiuderlo), dato che non verrà usato.
+    """
+    report = ReadinessReport()
+    objs: Dict[str, Any] = {}
+    if not tasks:
+        return report, objs
+    t0 = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="bringup")
+
+    def _timed(fn):
+        t = time.monotonic()
+        res = fn()
+        return res, time.monotonic() - t
+
+    try:
+        futs = [(kind, name, addr, timeout, pool.submit(_timed, fn)) for kind, name, addr, fn, timeout in tasks]
+        for kind, name, addr, timeout, fut in futs:
+            st = DeviceStatus(kind, name, str(addr))
+            try:
+                # i task partono insieme: il timeout di ciascuno si conta dall'avvio comune
+                (obj, ok, info), st.elapsed = fut.result(timeout=max(0.0, t0 + timeout - time.monotonic()))
+                st.ok, st.info = bool(ok), str(info or "")
+                objs[name] = obj
+            except FutureTimeout:
+                st.timed_out, st.elapsed, st.info = True, timeout, f"nessuna risposta entro {timeout:.1f} s"
+                if on_late:
+                    fut.add_done_callback(lambda f: (not f.exception()) and on_late(f.result()[0][0]))
+            except Exception as e:
+                st.info, st.elapsed = str(e), time.monotonic() - t0
+            report.devices.append(st)
+    finally:
+        pool.shutdown(wait=False)
+    report.elapsed = time.monotonic() - t0
+    return report, objs
@@ -0,0 +1,72 @@
+# drivers/deadband.py
+from __future__ import annotations
+import math
+from typing import Dict, List, Optional, Sequence
+
+# Colonna aggiunta ai log "solo variazioni": periodo base di campionamento, serve ai loader
+# dei report per ricostruire la serie densa (vedi report_html._densify_log)
+SPARSE_PERIOD_COL = "sample_period_s"
+
+
+def _num(v) -> Optional[float]:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+
+class DeadbandFilter:
+    """
+    Filtro per il logging "solo variazioni" (soak test lunghi).
+    Una riga viene salvata se almeno una colonna si è mossa oltre la sua banda morta
+    rispetto all'ultimo valore SALVATO, oppure se è passato 'max_silence' secondi
+    dall'ultima riga salvata.
+      - banda colonna = max(abs, rel * |ultimo valore|)
+      - abs_db / rel_db: override per colonna; chiave = nome colonna completo
+        ("Inverter1_Battery SOC [%]") oppure solo label ("Battery SOC [%]")
+      - comparsa/sparizione di un valore (None <-> numero) conta sempre come variazione
+    """
+
+    def __init__(self, default_abs: float = 0.0, default_rel: float = 0.01, max_silence: float = 60.0,
+                 abs_db: Optional[Dict[str, float]] = None, rel_db: Optional[Dict[str, float]] = None):
+        self.default_abs = float(default_abs)
+        self.default_rel = float(default_rel)
+        self.max_silence = float(max_silence)
+        self.abs_db = abs_db or {}
+        self.rel_db = rel_db or {}
+        self._last: Optional[List[Optional[float]]] = None
+        self._last_t: Optional[float] = None
+        self.seen = 0
+        self.stored = 0
+
+    def _band(self, col: str, table: Dict[str, float], default: float) -> float:
+        if col in table:
+            return float(table[col])
+        label = col.split("_", 1)[1] if "_" in col else col
+        return float(table.get(label, default))
+
+    def _changed(self, col: str, last: Optional[float], new: Optional[float]) -> bool:
+        if last is None or new is None:
+            return (last is None) != (new is None)
+        band = max(self._band(col, self.abs_db, self.default_abs),
+                   self._band(col, self.rel_db, self.default_rel) * abs(last))
+        return abs(new - last) > band
+
+    def should_store(self, cols: Sequence[str], values: Sequence, now: float) -> bool:
+        """'now' in secondi monotoni. Aggiorna lo stato interno se la riga va salvata."""
+        self.seen += 1
+        vals = [_num(v) for v in values]
+        store = (self._last is None
+                 or now - self._last_t >= self.max_silence
+                 or any(self._changed(c, l, v) for c, l, v in zip(cols, self._last, vals)))
+        if store:
+            self._last = vals
+            self._last_t = now
+            self.stored += 1
+        return store
+
+    @property
+    def reduction(self) -> float:
+        """Fattore di riduzione righe (campioni visti / righe salvate)."""
+        return self.seen / self.stored if self.stored else 0.0
@@ -1,6 +1,16 @@
 # drivers/decoders.py
 
-from typing import Any, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import struct
+import numpy as np
+
+# Tipi dato registro (5° campo della riga registro del logger):
+#   auto  → 16 bit, two's complement solo sopra signed_hint_thresh (comportamento storico)
+#   u16 / s16, u32 / s32 / f32 (2 registri, MSW per primo; suffisso "_lsw" = LSW per primo)
+#   asciiN → N registri, 2 caratteri per registro
+DTYPE_WIDTH = {"auto": 1, "u16": 1, "s16": 1, "u32": 2, "s32": 2, "f32": 2}
+
 
 def _to_float(x: Any, default: float = 1.0) -> float:
     """
@@ -30,8 +40,192 @@ def decode_u16_auto(raw: Optional[int], scale: Any = 1.0, signed_hint_thresh: in
     return v * sc
 
 
-# ---- Stubs futuri (quando/Se aggiungerai tipi in template) ----
-# def decode_s16(raw, scale=1.0): ...
-# def decode_u32(raw_hi, raw_lo, scale=1.0, word_order="msw_first"): ...
-# def decode_f32(raw_hi, raw_lo, word_order="msw_first"): ...
-# def decode_ascii(raw_regs, bytes_per_reg=2, strip_null=True): ...
+def decode_s16(raw: Optional[int], scale: Any = 1.0) -> Optional[float]:
+    if raw is None:
+        return None
+    v = int(raw) & 0xFFFF
+    return (v - 0x10000 if v & 0x8000 else v) * _to_float(scale, 1.0)
+
+
+def _join32(raw_hi: int, raw_lo: int, word_order: str) -> int:
+    if word_order == "lsw_first":
+        raw_hi, raw_lo = raw_lo, raw_hi
+    return ((int(raw_hi) & 0xFFFF) << 16) | (int(raw_lo) & 0xFFFF)
+
+
+def decode_u32(raw_hi: Optional[int], raw_lo: Optional[int], scale: Any = 1.0,
+               word_order: str = "msw_first", signed: bool = False) -> Optional[float]:
+    """raw_hi/raw_lo nell'ordine in cui arrivano dal bus (registro N, N+1)."""
+    if raw_hi is None or raw_lo is None:
+        return None
+    v = _join32(raw_hi, raw_lo, word_order)
+    if signed and v & 0x80000000:
+        v -= 0x100000000
+    return v * _to_float(scale, 1.0)
+
+
+def decode_f32(raw_hi: Optional[int], raw_lo: Optional[int], word_order: str = "msw_first") -> Optional[float]:
+    if raw_hi is None or raw_lo is None:
+        return None
+    return struct.unpack(">f", struct.pack(">I", _join32(raw_hi, raw_lo, word_order)))[0]
+
+
+def decode_ascii(raw_regs: Optional[Sequence[Optional[int]]], bytes_per_reg: int = 2,
+                 strip_null: bool = True) -> Optional[str]:
+    """Registri → stringa (byte alto per primo, come SN/modello dell'inverter)."""
+    if not raw_regs or any(r is None for r in raw_regs):
+        return None
+    b = bytearray()
+    for r in raw_regs:
+        r = int(r) & 0xFFFF
+        b += bytes([r >> 8, r & 0xFF]) if bytes_per_reg == 2 else bytes([r & 0xFF])
+    s = b.decode("ascii", errors="replace")
+    return s.replace("\x00", "").strip() if strip_null else s
+
+
+# ---- Piano di decodifica compilato (logger) ----
+def parse_dtype(spec: Any) -> Tuple[str, int, str]:
+    """'u32_lsw' → ('u32', 2, 'lsw_first'); vuoto → ('auto', 1, 'msw_first')."""
+    s = str(spec or "").strip().lower() or "auto"
+    word_order = "msw_first"
+    if s.endswith("_lsw"):
+        s, word_order = s[:-4], "lsw_first"
+    if s.startswith("ascii"):
+        n = s[5:]
+        return "ascii", max(1, int(n)) if n.isdigit() else 1, word_order
+    if s not in DTYPE_WIDTH:
+        raise ValueError(f"Tipo registro non supportato: {spec}")
+    return s, DTYPE_WIDTH[s], word_order
+
+
+def register_width(entry: Sequence[Any]) -> int:
+    """Numero di registri occupati dalla riga registro (label, reg, scale[, periodo[, tipo]])."""
+    return parse_dtype(entry[4])[1] if len(entry) > 4 else 1
+
+
+def to_int_reg(r: Any) -> int:
+    """Indirizzo registro da int, "0x0445" o "1093" (stringhe del template / della UI)."""
+    if isinstance(r, int): return r
+    s = str(r).strip().lower()
+    return int(s, 16) if s.startswith("0x") else int(s)
+
+
+@dataclass
+class RegSpec:
+    label: str
+    addr: int
+    scale: float
+    kind: str          # auto / u16 / s16 / u32 / s32 / f32 / ascii
+    width: int
+    word_order: str
+
+
+def compile_register_map(registers: Sequence[Sequence[Any]]) -> List[RegSpec]:
+    """Parsing una tantum di indirizzi, scaling e tipi della lista registri del logger."""
+    specs = []
+    for entry in registers:
+        kind, width, order = parse_dtype(entry[4] if len(entry) > 4 else None)
+        specs.append(RegSpec(label=str(entry[0]), addr=to_int_reg(entry[1]),
+                             scale=_to_float(entry[2], 1.0), kind=kind, width=width, word_order=order))
+    return specs
+
+
+_KINDS = ("auto", "u16", "s16", "u32", "s32", "f32")
+
+
+class _BoundPlan:
+    """Indici precalcolati per un (insieme colonne, piano a blocchi): tutto vettoriale a runtime."""
+
+    def __init__(self, specs: List[RegSpec], cols: Sequence[int], read_plan: Sequence[Any]):
+        self.n = len(cols)
+        self.read_plan = read_plan  # riferimento: la chiave di cache usa id(read_plan)
+        self.block_base = []
+        total = 0
+        pos_index: Dict[int, int] = {}
+        for b in read_plan:
+            self.block_base.append((total, b.count))
+            for j, off in b.slots:
+                pos_index.setdefault(j, total + off)
+            total += b.count
+        self.total = max(1, total)
+        num_pos, hi, lo, kind, scale = [], [], [], [], []
+        self.ascii = []  # (posizione, indice flat, larghezza)
+        for j, c in enumerate(cols):
+            sp = specs[c]
+            idx = pos_index.get(j)
+            if idx is None:
+                continue
+            if sp.kind == "ascii":
+                self.ascii.append((j, idx, sp.width))
+                continue
+            a, b2 = idx, (idx + 1 if sp.width == 2 else idx)
+            if sp.width == 2 and sp.word_order == "lsw_first":
+                a, b2 = b2, a
+            num_pos.append(j); hi.append(a); lo.append(b2)
+            kind.append(_KINDS.index(sp.kind)); scale.append(sp.scale)
+        self.pos = np.asarray(num_pos, dtype=np.intp)
+        self.hi = np.asarray(hi, dtype=np.intp)
+        self.lo = np.asarray(lo, dtype=np.intp)
+        kind = np.asarray(kind, dtype=np.int8)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.is32 = kind >= _KINDS.index("u32")
+        self.is_auto = kind == _KINDS.index("auto")
+        self.is_s16 = kind == _KINDS.index("s16")
+        self.is_s32 = kind == _KINDS.index("s32")
+        self.is_f32 = kind == _KINDS.index("f32")
+
+
+class DecodePlan:
+    """
+    Decodifica vettoriale dei risultati delle letture a blocco.
+    La lista registri viene compilata una volta (indirizzi, scaling, tipo, ordine word);
+    per ogni combinazione (colonne dovute, piano) vengono precalcolati gli indici, così
+    a runtime ogni campione è: blocchi → un array → gather + two's complement + scala in NumPy.
+    """
+
+    def __init__(self, registers: Sequence[Sequence[Any]], signed_hint_thresh: int = 0xF000):
+        self.specs = compile_register_map(registers)
+        self.thresh = int(signed_hint_thresh) & 0xFFFF
+        self._bound: Dict[Tuple[int, ...], _BoundPlan] = {}
+
+    def _bind(self, cols: Sequence[int], read_plan: Sequence[Any]) -> _BoundPlan:
+        key = (tuple(cols), id(read_plan))
+        bp = self._bound.get(key)
+        if bp is None:
+            bp = _BoundPlan(self.specs, cols, read_plan)
+            self._bound[key] = bp
+        return bp
+
+    def decode(self, cols: Sequence[int], read_plan: Sequence[Any],
+               results: Sequence[Optional[List[int]]]) -> List[Any]:
+        """
+        'cols' = colonne dovute (nell'ordine usato per compilare 'read_plan'), 'results' allineato
+        a 'read_plan' (None se il blocco è fallito). Ritorna i valori allineati a 'cols' (None se mancanti).
+        """
+        bp = self._bind(cols, read_plan)
+        out: List[Any] = [None] * bp.n
+        flat = np.full(bp.total, -1, dtype=np.int64)
+        for (base, count), regs in zip(bp.block_base, results):
+            if regs:
+                k = min(count, len(regs))
+                flat[base:base + k] = regs[:k]
+        if bp.pos.size:
+            hi = flat[bp.hi]
+            lo = flat[bp.lo]
+            missing = (hi < 0) | (lo < 0)
+            hi = hi & 0xFFFF
+            lo = lo & 0xFFFF
+            u32 = (hi << 16) | lo
+            val = np.where(bp.is32, u32, hi).astype(np.float64)
+            val = np.where((bp.is_auto & (hi >= self.thresh)) | (bp.is_s16 & (hi >= 0x8000)), hi - 0x10000, val)
+            val = np.where(bp.is_s32 & (u32 >= 0x80000000), u32 - 0x100000000, val)
+            if bp.is_f32.any():
+                f32 = u32.astype(np.uint32).view(np.float32).astype(np.float64)
+                val = np.where(bp.is_f32, f32, val)
+            val = val * bp.scale
+            for j, v, miss in zip(bp.pos.tolist(), val.tolist(), missing.tolist()):
+                out[j] = None if miss else v
+        for j, idx, width in bp.ascii:
+            seg = flat[idx:idx + width].tolist()
+            out[j] = decode_ascii([None if r < 0 else r for r in seg])
+        return out
@@ -0,0 +1,186 @@
+# drivers/discovery.py
+"""
+Scansione dei bus Modbus per la messa in servizio di un rack:
+  - RTU: tutte le porte in parallelo, slave ID in sequenza sulla singola linea (half-duplex)
+  - TCP: range di IP in parallelo (thread pool), pre-check della porta con socket a timeout corto
+  - AzzurroHUB: uno o più HUB in parallelo, slave ID in sequenza dietro ciascun HUB (rate limiter)
+Per ogni dispositivo che risponde legge l'SN (due letture a blocco, vedi Inverter.read_sn,
+che riempie anche la cache SN usata dal pannello Log) e ne ricava famiglia/modello.
+"""
+from __future__ import annotations
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+from serial.tools import list_ports
+from .modbus_inv import Inverter
+from .retry import RetryPolicy, CircuitBreaker
+from .serial_bus import get_serial_bus, release_serial_bus
+
+DEFAULT_PORTS = {"TCP": 8899, "AzzurroHUB": 55400}
+
+
+@dataclass
+class FoundDevice:
+    proto: str
+    address: str            # COM per RTU, IP per TCP/HUB
+    slave: int
+    sn: Optional[str] = None
+    family: Optional[str] = None
+    model: Optional[str] = None
+    port: Optional[int] = None
+    rtt: float = 0.0        # [s] tempo di risposta al primo probe
+
+
+def serial_ports() -> List[str]:
+    return sorted(p.device for p in list_ports.comports())
+
+
+def parse_slave_range(spec) -> List[int]:
+    """'1-10', '3,4,11', '1-5,20' → lista slave ID (1..247)."""
+    if isinstance(spec, (list, tuple, range)):
+        return [int(s) for s in spec if 1 <= int(s) <= 247]
+    out = []
+    for part in str(spec).replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            out.extend(range(int(a), int(b) + 1))
+        else:
+            out.append(int(part))
+    return sorted({s for s in out if 1 <= s <= 247})
+
+
+def parse_ip_range(spec) -> List[str]:
+    """'192.168.1.10-20', '192.168.1.0/28', '10.0.0.5, 10.0.0.7' → lista IP."""
+    if isinstance(spec, (list, tuple)):
+        return [str(s).strip() for s in spec if str(s).strip()]
+    out = []
+    for part in str(spec).replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "/" in part:
+            out.extend(str(h) for h in ipaddress.ip_network(part, strict=False).hosts())
+        elif "-" in part:
+            first, last = part.split("-", 1)
+            base = ipaddress.ip_address(first.strip())
+            last = last.strip()
+            end = ipaddress.ip_address(last) if "." in last else \
+                ipaddress.ip_address(".".join(str(base).split(".")[:3] + [last]))
+            out.extend(str(ipaddress.ip_address(i)) for i in range(int(base), int(end) + 1))
+        else:
+            out.append(part)
+    return out
+
+
+def _family_model(sn: Optional[str]):
+    if not sn:
+        return None, None
+    from .test import parse_sn  # import lazy: drivers.test tira dentro UI e strumenti
+    info = parse_sn(sn)
+    return (info["family"], info["model_code"]) if info else (None, None)
+
+
+def _probe(proto: str, address: str, slave: int, port: Optional[int], timeout: float) -> Optional[FoundDevice]:
+    """Un probe senza retry; se risponde legge l'SN. None se nessuna risposta."""
+    kw = {"com": address} if proto == "RTU" else {"ip": address, "port": port}
+    drv = Inverter(proto, slave=slave, timeout=timeout, retry_policy=RetryPolicy(attempts=1),
+                   breaker=CircuitBreaker(fail_threshold=1_000_000), **kw)
+    try:
+        t0 = time.monotonic()
+        drv.probe()
+        if not drv.stats.successes:
+            return None
+        rtt = time.monotonic() - t0
+        try:
+            sn = drv.read_sn(use_cache=False)
+        except Exception:
+            sn = None
+        family, model = _family_model(sn)
+        return FoundDevice(proto, address, slave, sn, family, model, drv.port, rtt)
+    finally:
+        drv.close()
+
+
+def _tcp_open(host: str, port: int, timeout: float) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _scan_line(proto: str, address: str, slaves: List[int], port: Optional[int], timeout: float,
+               on_found, stop: threading.Event) -> List[FoundDevice]:
+    """Slave in sequenza sulla stessa linea (COM o HUB)."""
+    found = []
+    if proto != "RTU" and not _tcp_open(address, port, timeout):
+        return found
+    if proto == "RTU":
+        # se la COM non è già in uso la bus nasce col timeout di scansione; rilasciata a fine scansione
+        get_serial_bus(address, baudrate=9600, timeout=timeout, stopbits=1, bytesize=8, parity='N')
+    try:
+        for slave in slaves:
+            if stop.is_set():
+                break
+            try:
+                dev = _probe(proto, address, slave, port, timeout)
+            except Exception as e:
+                print(f"[WARN] Scansione {proto} {address}/{slave}: {e}")
+                if proto == "RTU":
+                    break  # porta non apribile: inutile proseguire
+                continue
+            if dev:
+                found.append(dev)
+                if on_found:
+                    on_found(dev)
+    finally:
+        if proto == "RTU":
+            release_serial_bus(address)
+    return found
+
+
+def discover(proto: str, targets: Optional[Iterable[str]] = None, slaves="1-10",
+             timeout: Optional[float] = None, port: Optional[int] = None, workers: int = 32,
+             on_found: Optional[Callable[[FoundDevice], None]] = None,
+             stop: Optional[threading.Event] = None) -> List[FoundDevice]:
+    """
+    Scansiona e ritorna i dispositivi trovati, ordinati per (indirizzo, slave).
+      proto: "RTU" | "TCP" | "AzzurroHUB"
+      targets: porte COM (RTU; None = tutte) oppure IP / range IP (TCP, HUB)
+      slaves: slave ID da provare (RTU, HUB); in TCP si usa lo slave 1
+      on_found: callback chiamata (dal thread di scansione) per ogni dispositivo trovato
+    """
+    stop = stop or threading.Event()
+    if proto == "RTU":
+        lines = list(targets) if targets else serial_ports()
+        timeout = 0.2 if timeout is None else timeout
+    elif proto in DEFAULT_PORTS:
+        lines = parse_ip_range(targets or "")
+        port = port or DEFAULT_PORTS[proto]
+        timeout = 0.5 if timeout is None else timeout
+    else:
+        raise ValueError(f"Protocollo non supportato: {proto}")
+    slave_ids = [1] if proto == "TCP" else parse_slave_range(slaves)
+    if not lines or not slave_ids:
+        return []
+
+    # RTU/HUB: una linea per thread (gli slave della stessa linea restano in sequenza);
+    # TCP: un host per thread, limitato da 'workers'
+    n_workers = len(lines) if proto != "TCP" else max(1, min(workers, len(lines)))
+    found: List[FoundDevice] = []
+    with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="discovery") as pool:
+        futs = [pool.submit(_scan_line, proto, line, slave_ids, port, timeout, on_found, stop)
+                for line in lines]
+        for f in futs:
+            try:
+                found.extend(f.result())
+            except Exception as e:
+                print(f"[WARN] Scansione fallita: {e}")
+    return sorted(found, key=lambda d: (d.address, d.slave))
@@ -0,0 +1,129 @@
+# drivers/event_log.py
+from __future__ import annotations
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from .serial_bus import PRIO_LOW
+
+# Storico eventi inverter: ring di 10 voci da 4 registri a partire da 0x1480
+#   reg0 = codice evento, reg1 = YY|MM, reg2 = DD|hh, reg3 = mm|ss (byte BCD)
+EVENT_LOG_BASE = 0x1480
+EVENT_LOG_ENTRIES = 10
+EVENT_ENTRY_REGS = 4
+EVENT_LOG_BLOCK = (EVENT_LOG_BASE, EVENT_LOG_ENTRIES * EVENT_ENTRY_REGS)
+
+# byte BCD → valore 0..99 (None se un nibble non è una cifra decimale)
+_BCD = [(hi * 10 + lo) if hi < 10 and lo < 10 else None
+        for hi, lo in ((b >> 4, b & 0x0F) for b in range(256))]
+
+
+def bcd_pair(reg: int) -> Tuple[Optional[int], Optional[int]]:
+    """Registro U16 → (byte alto, byte basso) decodificati BCD."""
+    reg = int(reg) & 0xFFFF
+    return _BCD[reg >> 8], _BCD[reg & 0xFF]
+
+
+def decode_event(regs: Sequence[int]) -> Optional[dict]:
+    """4 registri → {'code', 'ts'}; None per voce vuota o timestamp non valido."""
+    if not regs or len(regs) < EVENT_ENTRY_REGS:
+        return None
+    code = int(regs[0]) & 0xFFFF
+    yy, mo = bcd_pair(regs[1])
+    dd, hh = bcd_pair(regs[2])
+    mi, ss = bcd_pair(regs[3])
+    if code == 0 or None in (yy, mo, dd, hh, mi, ss):
+        return None
+    try:
+        ts = datetime(2000 + yy, mo, dd, hh, mi, ss)  # anno su 2 cifre → 20YY
+    except ValueError:
+        return None
+    return {"code": code, "ts": ts}
+
+
+def decode_event_block(regs: Sequence[int]) -> List[dict]:
+    """Blocco 0x1480..0x14A7 → eventi validi (ordine del ring)."""
+    out = []
+    for k in range(0, len(regs) - EVENT_ENTRY_REGS + 1, EVENT_ENTRY_REGS):
+        ev = decode_event(regs[k:k + EVENT_ENTRY_REGS])
+        if ev:
+            out.append(ev)
+    return out
+
+
+def event_row(ev: dict) -> dict:
+    """Riga del foglio <SN>_LogErrori (stesse colonne lette da report / report_html)."""
+    ts = ev["ts"]
+    return {
+        "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
+        "code_dec": ev["code"],
+        "code_hex": f"0x{ev['code']:04X}",
+        "fault_index": None,
+        "register": None,
+        "source": "HIST",
+        "YY": ts.year % 100, "MM": ts.month, "DD": ts.day,
+        "hh": ts.hour, "mm": ts.minute, "ss": ts.second,
+    }
+
+
+class EventLogCollector:
+    """
+    Cattura incrementale dello storico eventi durante il log: ogni 'period' secondi legge il
+    ring 0x1480 di ogni inverter in un'unica richiesta (priorità bassa: SN/eventi passano
+    dopo il logger) e accumula gli eventi nuovi, de-duplicati per (codice, timestamp).
+    Così gli eventi che escono dal ring da 10 voci nei test lunghi non vanno persi e a fine
+    test non serve rileggere nulla voce per voce.
+    """
+
+    def __init__(self, ins, names: Sequence[str], period: float = 30.0):
+        self.ins = ins
+        self.names = list(names)
+        self.period = float(period)
+        self.events: Dict[str, List[dict]] = {n: [] for n in self.names}
+        self._seen: Dict[str, Set[Tuple[int, datetime]]] = {n: set() for n in self.names}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self) -> int:
+        """Una passata su tutti gli inverter; ritorna il numero di eventi nuovi."""
+        new = 0
+        for name in self.names:
+            try:
+                regs = self.ins.inv_read_blocks(name, [EVENT_LOG_BLOCK], priority=PRIO_LOW)[0]
+            except Exception as e:
+                print(f"[WARN] lettura storico eventi {name}: {e}")
+                regs = None
+            if not regs:
+                continue
+            with self._lock:
+                for ev in decode_event_block(regs):
+                    key = (ev["code"], ev["ts"])
+                    if key not in self._seen[name]:
+                        self._seen[name].add(key)
+                        self.events[name].append(ev)
+                        new += 1
+        return new
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.poll()
+
+    def start(self) -> "EventLogCollector":
+        self.poll()  # istantanea iniziale
+        self._thread = threading.Thread(target=self._run, name="EventLogCollector", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, final_poll: bool = True):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        if final_poll:
+            self.poll()
+
+    def rows(self, name: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+        """Eventi di 'name' nella finestra [start, end], ordinati per timestamp."""
+        with self._lock:
+            evs = [e for e in self.events.get(name, [])
+                   if (start is None or e["ts"] >= start) and (end is None or e["ts"] <= end)]
+        return [event_row(e) for e in sorted(evs, key=lambda e: e["ts"])]
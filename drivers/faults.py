@@ -0,0 +1,165 @@
+# drivers/faults.py
+from __future__ import annotations
+import csv
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .serial_bus import PRIO_LOW
+
+# Registri fault attivi: Fault1..Fault10 = 0x0405..0x040E, un bit per condizione
+FAULT_BASE = 0x0405
+FAULT_REGS = 10
+FAULT_BLOCK = (FAULT_BASE, FAULT_REGS)
+
+# Tabella bit → descrizione: ./database/fault_map.csv (colonne register, bit, description;
+# register come "0x0405" o indice fault 1..10). I bit non in tabella usano "FaultN.bK".
+FAULT_MAP_PATH = os.path.join("./database", "fault_map.csv")
+
+
+def load_fault_map(path: Optional[str] = None) -> Dict[Tuple[int, int], str]:
+    """{(indice fault 0..9, bit 0..15): descrizione}; vuoto se il file non c'è."""
+    path = path or FAULT_MAP_PATH
+    table: Dict[Tuple[int, int], str] = {}
+    if not os.path.isfile(path):
+        return table
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            try:
+                reg = str(row.get("register", "")).strip().lower()
+                idx = int(reg, 16) - FAULT_BASE if reg.startswith("0x") else int(reg) - 1
+                bit = int(row.get("bit", ""))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= idx < FAULT_REGS and 0 <= bit < 16:
+                table[(idx, bit)] = str(row.get("description", "")).strip()
+    return table
+
+
+def fault_edges(prev: Sequence[int], cur: Sequence[int]) -> List[Tuple[int, int, bool]]:
+    """Fronti tra due istantanee: [(indice fault, bit, True=attivato / False=rientrato)]."""
+    out = []
+    for idx, (old, new) in enumerate(zip(prev, cur)):
+        changed = (int(old) ^ int(new)) & 0xFFFF
+        while changed:
+            low = changed & -changed
+            bit = low.bit_length() - 1
+            out.append((idx, bit, bool(new & low)))
+            changed ^= low
+    return out
+
+
+class FaultWatcher:
+    """
+    Sorveglianza dei fault attivi durante il log: ogni 'period' secondi legge Fault1..10 di tutti
+    gli inverter in una sola richiesta ciascuno (TCP/HUB in parallelo, vedi inv_poll_blocks),
+    confronta con l'istantanea precedente (XOR) ed emette solo i fronti, con timestamp al ms.
+    Le letture fallite non generano fronti: si confronta con l'ultima istantanea valida.
+    Gli eventi vanno nel CSV di sessione (se 'csv_path') e nel foglio <SN>_LogErrori (source FAULT).
+    Le letture sono a priorità bassa: su bus/HUB condivisi passano dopo logger e test executor.
+    """
+
+    CSV_HEADER = ["timestamp", "inverter", "register", "bit", "edge", "description"]
+
+    def __init__(self, ins, names: Sequence[str], period: float = 1.0,
+                 fault_map: Optional[Dict[Tuple[int, int], str]] = None, csv_path: Optional[str] = None,
+                 on_event: Optional[Callable[[dict], None]] = None):
+        self.ins = ins
+        self.names = list(names)
+        self.period = float(period)
+        self.fault_map = load_fault_map() if fault_map is None else fault_map
+        self.csv_path = csv_path
+        self.on_event = on_event
+        self.events: Dict[str, List[dict]] = {n: [] for n in self.names}
+        self._snap: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._csv = None
+        self._writer = None
+
+    def describe(self, idx: int, bit: int) -> str:
+        return self.fault_map.get((idx, bit)) or f"Fault{idx + 1}.b{bit}"
+
+    def _emit(self, name: str, idx: int, bit: int, rising: bool, ts: datetime):
+        ev = {"ts": ts, "inverter": name, "index": idx, "bit": bit, "rising": rising,
+              "description": self.describe(idx, bit)}
+        with self._lock:
+            self.events[name].append(ev)
+            if self._writer:
+                self._writer.writerow([ts.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], name,
+                                       f"0x{FAULT_BASE + idx:04X}", bit, "ON" if rising else "OFF",
+                                       ev["description"]])
+        print(f"[FAULT] {name} {ev['description']} {'ON' if rising else 'OFF'}")
+        if self.on_event:
+            try:
+                self.on_event(ev)
+            except Exception as e:
+                print(f"[WARN] callback fault: {e}")
+
+    def poll(self) -> int:
+        """Una lettura di tutti gli inverter; ritorna il numero di fronti emessi."""
+        try:
+            res = self.ins.inv_poll_blocks([FAULT_BLOCK], names=self.names, deadline=max(0.2, self.period),
+                                           priority=PRIO_LOW)
+        except Exception as e:
+            print(f"[WARN] lettura fault: {e}")
+            return 0
+        ts = datetime.now()
+        n = 0
+        for name in self.names:
+            regs = (res.get(name) or [None])[0]
+            if not regs or len(regs) < FAULT_REGS:
+                continue
+            cur = [int(v) & 0xFFFF for v in regs[:FAULT_REGS]]
+            # prima istantanea: i fault già attivi all'avvio vengono riportati come attivazioni
+            prev = self._snap.get(name, [0] * FAULT_REGS)
+            for idx, bit, rising in fault_edges(prev, cur):
+                self._emit(name, idx, bit, rising, ts)
+                n += 1
+            self._snap[name] = cur
+        return n
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.poll()
+
+    def start(self) -> "FaultWatcher":
+        if self.csv_path:
+            self._csv = open(self.csv_path, mode="w", newline="", encoding="utf-8", buffering=1)
+            self._writer = csv.writer(self._csv)
+            self._writer.writerow(self.CSV_HEADER)
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="FaultWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        with self._lock:
+            if self._csv:
+                self._csv.close()
+                self._csv = None
+                self._writer = None
+
+    def active(self, name: str) -> List[Tuple[int, int]]:
+        """Fault attivi nell'ultima istantanea: [(indice fault, bit)]."""
+        snap = self._snap.get(name)
+        return [(i, b) for i, b, _ in fault_edges([0] * FAULT_REGS, snap)] if snap else []
+
+    def rows(self, name: str) -> List[dict]:
+        """Fronti di 'name' come righe del foglio <SN>_LogErrori."""
+        with self._lock:
+            evs = list(self.events.get(name, []))
+        return [{
+            "timestamp": e["ts"].strftime("%Y-%m-%d %H:%M:%S"),
+            "code_dec": e["index"] * 16 + e["bit"],
+            "code_hex": f"0x{FAULT_BASE + e['index']:04X}.{e['bit']}",
+            "fault_index": e["index"] + 1,
+            "register": f"0x{FAULT_BASE + e['index']:04X}",
+            "source": "FAULT " + ("ON" if e["rising"] else "OFF"),
+            "description": e["description"],
+            "time_ms": e["ts"].strftime("%H:%M:%S.%f")[:-3],
+        } for e in evs]
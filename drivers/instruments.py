@@ -1,10 +1,27 @@
 from dataclasses import dataclass
-from typing import Dict, Optional, List, Union
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional, List, Tuple, Union
 from .visadc import DCSource
 from .visaac import ACSource
-from .modbus_inv import Inverter
+from .modbus_inv import Inverter, STATE_CONNECTED
+from .async_poll import get_async_poller
+from .serial_bus import PRIO_NORMAL
+from .bringup import bring_up
+from .visa_registry import probe as visa_probe
+from .state_cache import StateCache
+import csv
+import os
+import threading
 import time
 
+# Colonne di log delle misure degli strumenti: (chiave di measure(), suffisso colonna)
+SOURCE_COLUMNS = {
+    "DC": (("V", "Voltage [V]"), ("I", "Current [A]"), ("P", "Power [W]")),
+    "AC": (("V", "Voltage [V]"), ("I", "Current [A]"), ("P", "Power [W]"), ("F", "Frequency [Hz]")),
+}
+
+
 @dataclass
 class InverterNode:
     name: str          # es. "INV1"
@@ -16,60 +33,305 @@ class Instruments:
     """Facciata unica per DC/AC e più Inverter."""
 
     def __init__(self, dc_map: Dict[str, str] = None, ac_addr: Optional[str] = None,
-                 inv_cfgs: List[dict] = None, protocol: Optional[str] = None):
-        self.dc = {name: DCSource(addr) for name, addr in (dc_map or {}).items()}
-        self.ac = ACSource(ac_addr) if ac_addr else None
-
+                 inv_cfgs: List[dict] = None, protocol: Optional[str] = None,
+                 visa_timeout: float = 2.0, probe_timeout_ms: int = 500, inv_timeout: float = 5.0):
+        """
+        Apre DC, AC e inverter in parallelo (vedi bringup): ciascuno con il proprio timeout
+        (visa_timeout / inv_timeout [s]); *IDN? di presenza con probe_timeout_ms.
+        Gli strumenti VISA assenti vengono esclusi; gli inverter restano anche se non connessi
+        (si riconnettono col backoff). L'esito è in self.readiness.
+        """
+        self.dc: Dict[str, DCSource] = {}
+        self.ac: Optional[ACSource] = None
         self.inverters: Dict[str, InverterNode] = {}
-        if inv_cfgs:
-            for idx, cfg in enumerate(inv_cfgs, start=1):
-                name = cfg.get("name", f"INV{idx}")
-                role = "slave" if cfg.get("is_slave") else "master"
-                alimentatore = cfg.get("alimentatore", "Nessuno")
-                proto = protocol or cfg.get("proto") or "TCP"
-                try:
-                    if proto in ("TCP", "AzzurroHUB"):
-                        drv = Inverter(proto=proto, ip=cfg["address"], slave=int(cfg["modbus"]))
-                    elif proto == "RTU":
-                        drv = Inverter(proto="RTU", com=cfg["address"], slave=int(cfg["modbus"]))
-                    else:
-                        raise ValueError(f"Protocollo non supportato: {proto}")
-                    self.inverters[name] = InverterNode(
-                        name=name, role=role, alimentatore=alimentatore, driver=drv
-                    )
-                except Exception as e:
-                    print(
-                        f"[WARN] Inverter '{name}' non disponibile ({cfg.get('address')}): {e} — continuo con gli altri.")
+        self.cmd_cache = StateCache()  # ultimo stato comandato (comandi identici non reinviati)
+        self._meas_pool: Optional[ThreadPoolExecutor] = None  # misure DC/AC in parallelo (log)
+        self._meas_futs: Dict[str, Future] = {}
+        # log errori SCPI della sessione (CSV, vedi check_errors); None = solo console
+        self.scpi_log_path: Optional[str] = None
+        self._scpi_log_lock = threading.Lock()
+
+        tasks = [("DC", name, addr, self._visa_task(DCSource, addr, probe_timeout_ms), visa_timeout)
+                 for name, addr in (dc_map or {}).items()]
+        if ac_addr:
+            tasks.append(("AC", "AC", ac_addr, self._visa_task(ACSource, ac_addr, probe_timeout_ms), visa_timeout))
+        nodes = {}
+        for idx, cfg in enumerate(inv_cfgs or [], start=1):
+            name = cfg.get("name", f"INV{idx}")
+            nodes[name] = cfg
+            tasks.append(("INV", name, cfg.get("address"),
+                          self._inverter_task(cfg, protocol or cfg.get("proto") or "TCP"), inv_timeout))
+
+        self.readiness, objs = bring_up(tasks, on_late=lambda o: o.close())
+        for name in (dc_map or {}):
+            if name in objs:
+                self.dc[name] = objs[name]
+        self.ac = objs.get("AC") if ac_addr else None
+        for name, cfg in nodes.items():
+            if name in objs:
+                self.inverters[name] = InverterNode(
+                    name=name, role="slave" if cfg.get("is_slave") else "master",
+                    alimentatore=cfg.get("alimentatore", "Nessuno"), driver=objs[name])
+        self.readiness.print()
+
+    @staticmethod
+    def _visa_task(cls, addr: str, probe_timeout_ms: int):
+        def fn():
+            ok, info = visa_probe(addr, timeout_ms=probe_timeout_ms)
+            if not ok:
+                raise ConnectionError(info)
+            return cls(addr), True, info
+        return fn
+
+    @staticmethod
+    def _inverter_task(cfg: dict, proto: str):
+        def fn():
+            if proto in ("TCP", "AzzurroHUB"):
+                # "port" opzionale: default 8899 (TCP) / 55400 (HUB) nel driver
+                drv = Inverter(proto=proto, ip=cfg["address"], port=cfg.get("port"), slave=int(cfg["modbus"]))
+            elif proto == "RTU":
+                drv = Inverter(proto="RTU", com=cfg["address"], slave=int(cfg["modbus"]))
+            else:
+                raise ValueError(f"Protocollo non supportato: {proto}")
+            # TCP/HUB: esito della connessione del socket; RTU: porta aperta sul bus condiviso
+            return drv, drv.state == STATE_CONNECTED, f"{proto} {drv.state}"
+        return fn
 
     # ---- DC ----
 
     def dc_measure(self, name): return self.dc[name].measure()
-    def dc_set_iv(self, name, voc, isc, ff=1.0):
+
+    # ---- Misure strumenti nel log ----
+    def source_columns(self) -> List[Tuple[str, str, str]]:
+        """[(strumento, chiave, colonna)] per le sorgenti presenti, es. ("DC1", "V", "DC1_Voltage [V]")."""
+        srcs = [(n, "DC") for n in self.dc] + ([("AC", "AC")] if self.ac else [])
+        return [(n, key, f"{n}_{suffix}") for n, kind in srcs for key, suffix in SOURCE_COLUMNS[kind]]
+
+    def sources_measure(self, deadline: float = 1.0) -> Dict[str, dict]:
+        """
+        Misura tutte le sorgenti in parallelo (una query composta ciascuna).
+        Gli strumenti che non rispondono entro 'deadline' [s] tornano {} per questo campione.
+        """
+        srcs = dict(self.dc)
+        if self.ac:
+            srcs["AC"] = self.ac
+        if not srcs:
+            return {}
+        if self._meas_pool is None:
+            self._meas_pool = ThreadPoolExecutor(max_workers=len(srcs), thread_name_prefix="meas")
+        # uno strumento ancora bloccato sulla misura precedente non riceve una nuova richiesta
+        futs = {}
+        for n, d in srcs.items():
+            prev = self._meas_futs.get(n)
+            futs[n] = prev if prev is not None and not prev.done() else self._meas_pool.submit(d.measure)
+        self._meas_futs = futs
+        wait(list(futs.values()), timeout=deadline)
+        return {n: (f.result() if f.done() and not f.exception() else {}) for n, f in futs.items()}
+
+    @staticmethod
+    def _iv_key(voc, isc, ff):
+        # stessi arrotondamenti della riga SCPI inviata da DCSource.set_iv
+        return (round(voc, 2), round(voc * ff, 2), round(isc, 2), round(isc * ff, 2))
+
+    def _source_cmd(self, name, cfg, on, send):
+        """
+        Invia solo la parte che cambia rispetto allo stato noto di 'name' (force=True nei
+        chiamanti: cache invalidata prima). send(send_cfg, send_on) esegue l'I/O.
+        """
+        send_cfg, send_on = self.cmd_cache.source_delta(name, cfg, on)
+        if not (send_cfg or send_on):
+            return True
+        try:
+            ok = send(send_cfg, send_on)
+        except Exception:
+            self.cmd_cache.invalidate(name)
+            raise
+        if ok:
+            self.cmd_cache.source_set(name, cfg if send_cfg else None, on if send_on else None)
+        else:  # invio fallito: lo stato reale della sorgente non è noto
+            self.cmd_cache.invalidate(name)
+        return ok
+
+    def dc_set_iv(self, name, voc, isc, ff=1.0, on=None, opc=False, force=False):
+        """
+        on=True/False: accende/spegne l'uscita nella stessa riga SCPI della curva I-V.
+        Curva e uscita già nello stato richiesto non vengono reinviate (force=True per reinviare).
+        """
         drv = self.dc.get(name);
         if not drv:
             print(f"[WARN] DC {name} non disponibile")
             return False
-        return drv.set_iv(voc, isc, ff)
-    def dc_on(self, name):
+        if force:
+            self.cmd_cache.invalidate(name)
+
+        def send(send_cfg, send_on):
+            if send_cfg:
+                return drv.set_iv(voc, isc, ff, on=on if send_on else None, opc=opc)
+            return drv.turn_on() if on else drv.turn_off()
+        return self._source_cmd(name, self._iv_key(voc, isc, ff), on, send)
+    def dc_on(self, name, force=False):
         drv = self.dc.get(name)
         if not drv:
             print(f"[WARN] DC {name} non disponibile")
             return False
-        return drv.turn_on()
-    def dc_off(self, name):
+        if force:
+            self.cmd_cache.invalidate(name)
+        return self._source_cmd(name, None, True, lambda c, o: drv.turn_on())
+    def dc_off(self, name, force=False):
         drv = self.dc.get(name)
         if not drv:
             print(f"[WARN] DC {name} non disponibile")
             return False
-        return drv.turn_off()
-    def dc_safe_quench_and_off(self, name, target_v=200.0, target_i=1.0):
+        if force:
+            self.cmd_cache.invalidate(name)
+        return self._source_cmd(name, None, False, lambda c, o: drv.turn_off())
+    def dc_safe_quench_and_off(self, name, target_v=200.0, target_i=1.0, timeout=5.0):
+        """Porta l'uscita a (target_v, target_i), attende l'assestamento (max 'timeout' s) e spegne."""
         drv = self.dc.get(name)
         if not drv:
             print(f"[WARN] DC {name} non disponibile")
             return False
-        drv.set_iv(target_v, target_i)
-        time.sleep(5)
-        return drv.turn_off()
+        self.dc_set_iv(name, target_v, target_i, ff=0.9, opc=True)
+        if not drv.wait_settled(v_max=target_v, i_max=target_i, timeout=timeout):
+            print(f"[WARN] DC {name} non assestato entro {timeout:.0f} s: spengo comunque")
+        return self.dc_off(name)
+
+    def _dc_parallel(self, names, fn) -> bool:
+        """fn(driver) su più DC in parallelo; True se riesce su tutti quelli presenti."""
+        drvs = [self.dc[n] for n in names if n in self.dc]
+        if not drvs:
+            return True
+        with ThreadPoolExecutor(max_workers=len(drvs), thread_name_prefix="dc-wait") as pool:
+            return all(pool.map(fn, drvs))
+
+    def dc_wait_settled(self, names, timeout=5.0, **kw) -> bool:
+        """Attende l'assestamento delle uscite (vedi DCSource.wait_settled) invece di un'attesa fissa."""
+        return self._dc_parallel(names, lambda d: d.wait_settled(timeout=timeout, **kw))
+
+    def dc_wait_load(self, names, min_i=0.1, timeout=60.0) -> bool:
+        """Attende che gli inverter inizino ad assorbire da tutti i DC 'names' (fine preconnessione)."""
+        return self._dc_parallel(names, lambda d: d.wait_current(min_i, timeout=timeout))
+    def dc_run_iv_lists(self, lists: Dict[str, list], margin: float = 30.0, poll: float = 2.0) -> int:
+        """
+        Sweep I-V eseguito dagli strumenti: carica in ciascun DC la sua lista di passi
+        (voc, isc, ff, dwell [s]), le avvia insieme e ne segue solo l'avanzamento.
+        Sweep più lunghi di DCSource.LIST_MAX_STEPS vanno a blocchi: la lista viene ricaricata
+        tra un blocco e l'altro, con l'uscita accesa sull'ultimo passo eseguito.
+        Ritorna quanti passi (stesso indice per tutti i DC) hanno eseguito le liste: il chiamante
+        pilota dall'host i passi rimanenti. 0 se il caricamento fallisce o lo strumento segnala
+        errori SCPI (lista non supportata o rifiutata).
+        """
+        lists = {n: list(steps) for n, steps in lists.items() if steps and n in self.dc}
+        total = max((len(s) for s in lists.values()), default=0)
+        done = 0
+        while done < total:
+            chunk = {n: s[done:done + DCSource.LIST_MAX_STEPS] for n, s in lists.items() if len(s) > done}
+            size = max(len(s) for s in chunk.values())
+            ran = self._dc_run_iv_chunk(chunk, margin, poll, offset=done)
+            done += ran
+            if ran < size:
+                break
+        return done
+
+    def _dc_run_iv_chunk(self, chunk: Dict[str, list], margin: float, poll: float, offset: int) -> int:
+        """Un blocco di dc_run_iv_lists: passi completati (il minimo tra i DC), 0 se non avviato."""
+        loaded = []
+        try:
+            for name, steps in chunk.items():
+                self.dc[name].upload_iv_list(steps)
+                loaded.append(name)
+            errs = self.check_errors(f"lista I-V passi {offset + 1}-{offset + max(map(len, chunk.values()))}",
+                                     list(chunk))
+            if errs:
+                raise RuntimeError(f"errori SCPI su {', '.join(errs)}")
+        except Exception as e:
+            print(f"[WARN] Lista I-V non utilizzabile ({e}): sweep pilotato dall'host")
+            for n in loaded:
+                try: self.dc[n].stop_list()
+                except Exception: pass
+            return 0
+        t0 = time.monotonic()
+        for name in chunk:
+            self.cmd_cache.invalidate(name)  # durante e dopo la lista lo stato lo decide lo strumento
+            self.dc[name].start_list(on=True)
+        timeout = max(sum(s[3] for s in steps) for steps in chunk.values()) + margin
+        t_end = t0 + timeout
+        reached = {}
+        for name, steps in chunk.items():
+            last = [0]
+
+            def _on_step(k, n=name, tot=len(steps)):
+                last[0] = k
+                print(f"[DC] {n} passo {offset + k}/{offset + tot}")
+            try:
+                finished = self.dc[name].wait_list(max(0.0, t_end - time.monotonic()), poll=poll, on_step=_on_step)
+            except Exception as e:
+                # stato della lista non leggibile: lo strumento prosegue da solo, l'host attende
+                # la durata nominale della lista
+                print(f"[WARN] Stato lista I-V {name} non leggibile ({e}): attendo la durata nominale")
+                time.sleep(max(0.0, t0 + sum(s[3] for s in steps) - time.monotonic()))
+                finished = True
+            if finished:
+                reached[name] = len(steps)
+            else:
+                print(f"[WARN] Lista I-V {name} non terminata entro {timeout:.0f} s: la fermo")
+                try: self.dc[name].stop_list()
+                except Exception: pass
+                reached[name] = max(0, last[0] - 1)  # il passo in corso non è completo
+        pending = [k for n, k in reached.items() if k < len(chunk[n])]
+        return min(pending) if pending else max(map(len, chunk.values()))
+    SCPI_LOG_HEADER = ["timestamp", "instrument", "context", "code", "message", "commands"]
+
+    def check_errors(self, context: str = "", names: Optional[List[str]] = None) -> Dict[str, dict]:
+        """
+        Controllo differito degli errori SCPI (una volta per step di test o su richiesta):
+        svuota in parallelo la coda SYST:ERR? di DC/AC e attribuisce gli errori ai comandi
+        inviati dall'ultimo controllo. Gli errori vanno in console e in scpi_log_path.
+        Ritorna {strumento: {"errors", "commands"}} dei soli strumenti con errori.
+        """
+        srcs = dict(self.dc)
+        if self.ac:
+            srcs["AC"] = self.ac
+        if names is not None:
+            srcs = {n: d for n, d in srcs.items() if n in names}
+        if not srcs:
+            return {}
+
+        def _check(item):
+            n, d = item
+            try:
+                return n, d.check_errors()
+            except Exception as e:
+                print(f"[WARN] Lettura coda errori {n} fallita: {e}")
+                return n, {"errors": [], "commands": []}
+        with ThreadPoolExecutor(max_workers=len(srcs), thread_name_prefix="scpi-err") as pool:
+            found = {n: r for n, r in pool.map(_check, srcs.items()) if r["errors"]}
+        if found:
+            self._log_scpi_errors(context, found)
+        return found
+
+    def _log_scpi_errors(self, context: str, found: Dict[str, dict]):
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        rows = []
+        for n, r in found.items():
+            cmds = " | ".join(c if k == 1 else f"{c} (x{k})" for _, c, k in r["commands"])
+            for code, msg in r["errors"]:
+                print(f"[SCPI] {n} {code} \"{msg}\"" + (f" [{context}]" if context else "")
+                      + (f" dopo: {cmds}" if cmds else ""))
+                rows.append([ts, n, context, code, msg, cmds])
+        if not self.scpi_log_path:
+            return
+        try:
+            with self._scpi_log_lock:
+                new = not os.path.isfile(self.scpi_log_path)
+                with open(self.scpi_log_path, mode="a", newline="", encoding="utf-8") as f:
+                    w = csv.writer(f)
+                    if new:
+                        w.writerow(self.SCPI_LOG_HEADER)
+                    w.writerows(rows)
+        except Exception as e:
+            print(f"[WARN] scrittura log errori SCPI fallita: {e}")
+
     # ========== Rilascia i client Modbus (libera COM/IP) ==========
     def inv_disconnect_all(self):
         for name, node in self.inverters.items():
@@ -79,28 +341,147 @@ class Instruments:
                 print(f"[WARN] close inverter {name}: {e}")
 
     # ---- AC ----
-    def ac_set(self, vrms, freq, phases="mono"): return self.ac.configure(vrms, freq, phases) if self.ac else None
-    def ac_on(self): return self.ac.turn_on() if self.ac else None
-    def ac_off(self): return self.ac.turn_off() if self.ac else None
+    def ac_set(self, vrms, freq, phases="mono", on=None, opc=False, force=False):
+        if not self.ac:
+            return None
+        if force:
+            self.cmd_cache.invalidate("AC")
+        ac = self.ac
+
+        def send(send_cfg, send_on):
+            if send_cfg:
+                return ac.configure(vrms, freq, phases, on=on if send_on else None, opc=opc)
+            return ac.turn_on() if on else ac.turn_off()
+        mono = str(phases).lower().startswith("mono")
+        return self._source_cmd("AC", (mono, float(vrms), float(freq)), on, send)
+    def ac_on(self, force=False):
+        if not self.ac:
+            return None
+        if force:
+            self.cmd_cache.invalidate("AC")
+        return self._source_cmd("AC", None, True, lambda c, o: self.ac.turn_on())
+    def ac_off(self, force=False):
+        if not self.ac:
+            return None
+        if force:
+            self.cmd_cache.invalidate("AC")
+        return self._source_cmd("AC", None, False, lambda c, o: self.ac.turn_off())
 
     # ---- Inverter ----
     def inv_read(self, inv_name: str, reg: Union[int,str], count=1):
         return self.inverters[inv_name].driver.read(reg, count)
 
-    def inv_write(self, inv_name: str, reg: Union[int,str], values: Union[int,List[int]], scale=1):
-        return self.inverters[inv_name].driver.write(reg, values, scale=scale)
+    def inv_write(self, inv_name: str, reg: Union[int,str], values: Union[int,List[int]], scale=1, force=False):
+        """
+        Scrittura con cache: se i registri hanno già quei valori (scritti da qui sulla stessa
+        connessione) non si genera traffico. force=True scrive comunque.
+        """
+        drv = self.inverters[inv_name].driver
+        r = int(reg, 16) if isinstance(reg, str) else int(reg)
+        # stessa scalatura di Inverter.write
+        words = [int(v / scale) for v in (values if isinstance(values, list) else [values])]
+        if not force and self.cmd_cache.regs_match(inv_name, r, words, drv.generation):
+            return True
+        try:
+            ok = drv.write(r, values, scale=scale)
+        except Exception:
+            self.cmd_cache.regs_forget(inv_name, r, len(words))
+            raise
+        if ok:
+            self.cmd_cache.regs_set(inv_name, r, words, drv.generation)
+        else:
+            self.cmd_cache.regs_forget(inv_name, r, len(words))
+        return ok
+
+    def invalidate_state(self, name: Optional[str] = None):
+        """Dimentica lo stato comandato di una sorgente/inverter (o di tutti): il prossimo comando parte sempre."""
+        self.cmd_cache.invalidate(name)
+
+    def inv_read_blocks(self, inv_name: str, blocks, priority: int = PRIO_NORMAL) -> List[Optional[List[int]]]:
+        """
+        Lettura indirizzata (solo l'inverter 'inv_name') di più blocchi.
+        'blocks' = oggetti con .start/.count (es. ReadBlock) o tuple (start, count).
+        'priority' = priorità sul bus condiviso (PRIO_LOW per letture di servizio).
+        Ritorna una lista allineata ai blocchi, None per i blocchi falliti.
+        """
+        node = self.inverters.get(inv_name)
+        out: List[Optional[List[int]]] = []
+        for b in blocks:
+            start, count = (b.start, b.count) if hasattr(b, "start") else b
+            if node is None:
+                out.append(None)
+                continue
+            try:
+                out.append(node.driver.read(start, count, priority=priority))
+            except Exception as e:
+                print(f"[WARN] Lettura {inv_name} @0x{int(start):04X} x{count} fallita: {e}")
+                out.append(None)
+        return out
+
+    def inv_poll_blocks(self, blocks, names: Optional[List[str]] = None, deadline: float = 2.0,
+                        priority: int = PRIO_NORMAL) -> Dict[str, List[Optional[List[int]]]]:
+        """
+        Legge gli stessi blocchi da più inverter in un colpo solo.
+        TCP/AzzurroHUB: polling concorrente (AsyncPoller) con deadline per dispositivo.
+        RTU: letture indirizzate in sequenza (il bus seriale è comunque condiviso).
+        'priority' = priorità sul bus/limiter condiviso (PRIO_LOW per le letture di servizio).
+        Ritorna {nome: [regs|None per blocco]}.
+        """
+        names = list(self.inverters.keys()) if names is None else names
+        tcp_devs, out = {}, {}
+        for n in names:
+            node = self.inverters.get(n)
+            if node is not None and not node.driver.available():
+                node.driver.stats.rejected += 1
+                out[n] = [None] * len(blocks)  # in backoff / breaker aperto: fail-fast, niente traffico
+            elif node is not None and node.driver.proto in ("TCP", "AzzurroHUB"):
+                if not node.driver.breaker.allow():
+                    node.driver.stats.rejected += 1
+                    out[n] = [None] * len(blocks)
+                    continue
+                tcp_devs[n] = (node.driver.ip, node.driver.port, node.driver.slave)
+            else:
+                out[n] = self.inv_read_blocks(n, blocks, priority=priority)
+        if tcp_devs:
+            res = get_async_poller().read_blocks(tcp_devs, blocks, deadline=deadline, priority=priority)
+            for n, regs in res.items():
+                # letture fatte dal poller, non da driver.read: riportiamo l'esito allo stato del driver
+                drv = self.inverters[n].driver
+                drv.note_success() if any(r is not None for r in regs) else drv.note_failure()
+            out.update(res)
+        return {n: out[n] for n in names}
+
+    def inv_state(self, inv_name: str) -> str:
+        """Stato connessione dell'inverter ('connected' | 'degraded' | 'reconnecting' | 'offline')."""
+        node = self.inverters.get(inv_name)
+        return node.driver.state if node else "offline"
+
+    def inv_states(self) -> Dict[str, str]:
+        return {n: node.driver.state for n, node in self.inverters.items()}
+
+    def inv_stats(self) -> Dict[str, dict]:
+        """Statistiche per inverter: richieste, fallimenti, retry, rifiuti, aperture breaker."""
+        return {n: dict(node.driver.stats.as_dict(), breaker=node.driver.breaker.state, state=node.driver.state)
+                for n, node in self.inverters.items()}
+
+    def inv_probe_all(self) -> Dict[str, str]:
+        """Health probe su tutti gli inverter (una lettura senza retry ciascuno)."""
+        return {n: node.driver.probe() for n, node in self.inverters.items()}
 
     def inv_names(self, role: Optional[str] = None) -> List[str]:
         if role is None: return list(self.inverters.keys())
         return [n for n,node in self.inverters.items() if node.role==role]
 
-    def inv_broadcast_write(self, reg, values, scale=1, role: Optional[str] = None):
-        return {n: self.inverters[n].driver.write(reg, values, scale=scale) for n in self.inv_names(role)}
+    def inv_broadcast_write(self, reg, values, scale=1, role: Optional[str] = None, force=False):
+        return {n: self.inv_write(n, reg, values, scale=scale, force=force) for n in self.inv_names(role)}
 
     def inv_broadcast_read(self, reg, count=1, role: Optional[str] = None):
         return {n: self.inverters[n].driver.read(reg, count) for n in self.inv_names(role)}
 
     def close_all(self):
+        if self._meas_pool is not None:
+            self._meas_pool.shutdown(wait=False)
+            self._meas_pool = None
         for s in self.dc.values():
             try: s.close()
             except: pass
@@ -1,49 +1,261 @@
 from __future__ import annotations
-from pymodbus.client import ModbusTcpClient, ModbusSerialClient
 import serial
 from serial.tools import list_ports
 from pymodbus.exceptions import ModbusIOException
 import time
-from typing import Optional, List, Union
+from typing import Dict, Optional, List, Tuple, Union
 import threading
+from .serial_bus import (SerialBus, get_serial_bus, has_serial_bus, release_serial_bus, com_lock,
+                         PRIO_HIGH, PRIO_NORMAL, PRIO_LOW)
+from .retry import RetryPolicy, CircuitBreaker, DeviceStats
+from .rate_limit import TokenBucket, get_hub_limiter
+from .async_poll import get_tcp_transport, add_reconnect_listener
+from .decoders import decode_ascii
+
+# Stati della connessione (ciclo di vita gestito da Inverter)
+STATE_CONNECTED = "connected"        # ultima operazione riuscita
+STATE_DEGRADED = "degraded"          # errori recenti, connessione ancora in uso
+STATE_RECONNECTING = "reconnecting"  # connessione chiusa, nuovo tentativo dopo il backoff
+STATE_OFFLINE = "offline"            # troppi tentativi falliti: si riprova solo a backoff massimo
+
+# Serial number: 0x0445..0x044C (16 caratteri) + 0x0470..0x0471 (ultimi 4, solo SN a 20 caratteri).
+# Modelli con SN a 14 caratteri: 0x0445..0x044B (vedi fallback in Inverter.read_sn)
+SN_BLOCKS = ((0x0445, 8), (0x0470, 2))
+SN_SHORT_BLOCK = (0x0445, 7)
+SN_LENGTHS = (14, 20)
+
+# Porte TCP di default per protocollo (RTU: nessuna porta)
+DEFAULT_PORTS = {"TCP": 8899, "AzzurroHUB": 55400}
+
+# ---- cache SN process-wide: (protocollo, indirizzo, porta TCP, slave) -> SN ----
+_sn_cache: Dict[Tuple[str, str, int, int], str] = {}
+_sn_lock = threading.Lock()
+
+
+def _sn_port(proto: str, port) -> int:
+    """Porta TCP effettiva (default del protocollo se None); 0 per RTU."""
+    return int(port or DEFAULT_PORTS.get(str(proto), 0))
+
+
+def _sn_key(proto: str, address, slave, port=None) -> Tuple[str, str, int, int]:
+    return (str(proto), str(address), _sn_port(proto, port), int(slave))
+
+
+def cached_sn(proto: str, address, slave, port=None) -> Optional[str]:
+    with _sn_lock:
+        return _sn_cache.get(_sn_key(proto, address, slave, port))
+
+
+def invalidate_sn(proto: Optional[str] = None, address=None, slave=None, port=None):
+    """Invalida la cache SN: tutto, un indirizzo (COM/IP, eventualmente una sola porta) o un singolo slave."""
+    with _sn_lock:
+        for k in list(_sn_cache):
+            if ((proto is None or k[0] == proto) and (address is None or k[1] == str(address))
+                    and (port is None or k[2] == _sn_port(k[0], port))
+                    and (slave is None or k[3] == int(slave))):
+                del _sn_cache[k]
+
+
+# l'AsyncPoller può riaprire da solo la connessione condivisa (TCP/HUB) senza che il driver
+# si riconnetta: anche in quel caso dall'altra parte potrebbe esserci un altro apparecchio
+add_reconnect_listener(lambda host, port: invalidate_sn(address=host, port=port))
+
 
 class Inverter:
     """Driver Modbus per inverter (TCP / RTU / AzzurroHUB)."""
 
+    degraded_after = 3        # errori consecutivi prima di chiudere e riconnettere
+    offline_after = 5         # riconnessioni fallite consecutive prima di OFFLINE
+    backoff_base = 0.5        # [s] primo backoff di riconnessione
+    backoff_max = 30.0        # [s] tetto del backoff esponenziale
+
     def __init__(self, proto: str, ip: Optional[str] = None, port: Optional[int] = None,
-                 com: Optional[str] = None, slave: int = 1, timeout: float = 1.0):
+                 com: Optional[str] = None, slave: int = 1, timeout: float = 1.0,
+                 retry_policy: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None):
         self.proto = proto
         self.slave = int(slave)
         self.timeout = timeout
         self.client = None
+        self.ip = ip
+        self.port = port
+        self.com = com
+        self.bus: Optional[SerialBus] = None  # solo RTU: trasporto condiviso per porta
+        self.limiter: Optional[TokenBucket] = None  # solo AzzurroHUB: rate limiter condiviso per HUB
 
         if proto == "TCP":
-            self.client = ModbusTcpClient(ip, port=port or 8899, timeout=timeout)
+            self.port = port or DEFAULT_PORTS["TCP"]
+            # una sola connessione per (ip, porta), condivisa con il polling async (retries=0:
+            # i tentativi li gestisce RetryPolicy, altrimenti si moltiplicano)
+            self.client = get_tcp_transport(ip, self.port, timeout=timeout)
         elif proto == "AzzurroHUB":
-            self.client = ModbusTcpClient(ip, port=port or 55400, timeout=timeout)
+            self.port = port or DEFAULT_PORTS["AzzurroHUB"]
+            self.client = get_tcp_transport(ip, self.port, timeout=timeout)
+            self.limiter = get_hub_limiter(ip, self.port)
         elif proto == "RTU":
-            # Preflight: la porta esiste ed è apribile?
-            self._preflight_serial(com)
-            self.client = ModbusSerialClient(
-            port = com, baudrate = 9600, timeout = timeout, stopbits = 1, bytesize = 8, parity = 'N')
+            # Preflight: la porta esiste ed è apribile? (solo se nessun altro slave la sta già usando).
+            # Check e presa della bus sotto il lock della COM: con bring-up e letture SN in parallelo
+            # un solo thread fa il preflight, gli altri trovano la bus già registrata
+            with com_lock(com):
+                if not has_serial_bus(com):
+                    self._preflight_serial(com)
+                # una sola SerialBus per COM, condivisa da tutti gli slave sulla stessa linea RS485
+                self._acquire_bus()
         else:
             raise ValueError("Protocollo non supportato")
 
+        # Retry / circuit breaker / statistiche per dispositivo
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = DeviceStats()
+
+        # Stato connessione
+        self.state = STATE_RECONNECTING
+        self._fails = 0             # operazioni fallite consecutive
+        self._reconnect_fails = 0   # riconnessioni fallite consecutive
+        self._next_attempt = 0.0    # time.monotonic() prima del quale non si ritenta
+        self._connected_once = False  # dalla seconda connessione in poi la cache SN va invalidata
+        self.generation = 0           # connessioni riuscite: cambia a ogni riconnessione (cache scritture)
+        self._transport_gen = None    # generazione del trasporto condiviso (TCP/HUB) vista per ultima
+        self._released = False        # close() chiamato: trasporto condiviso rilasciato
+
         # Primo tentativo di connessione (non bloccante)
         self._lock = threading.RLock()
+        self._connect()
+
+    def _acquire_bus(self):
+        """RTU: prende (e conta) la SerialBus della COM; rilasciata da close()."""
+        self.bus = get_serial_bus(self.com, baudrate=9600, timeout=self.timeout, stopbits=1, bytesize=8, parity='N')
+        self.client = self.bus.client
+
+    def _exec(self, fn, priority: int = PRIO_NORMAL):
+        """
+        Esegue fn(client): su RTU passa dalla coda della SerialBus, altrimenti sotto il lock locale.
+        Su AzzurroHUB attende prima un token dal limiter dell'HUB (il lock non è ancora preso).
+        """
+        if self.bus is not None:
+            return self.bus.submit(fn, priority=priority)
+        if self.limiter is not None:
+            self.limiter.acquire(priority)
+        with self._lock:
+            return fn(self.client)
+
+    # ---- ciclo di vita della connessione ----
+    def _is_open(self) -> bool:
+        """True se il socket/porta risulta aperto (senza generare traffico)."""
         try:
-            self.client.connect()
-        except Exception as e:
-            print(f"[WARN] Connessione Modbus iniziale fallita: {e}")
+            return bool(self.client and self.client.connected)
+        except Exception:
+            return False
 
-    def _ensure_connected(self) -> bool:
-        """Assicura connessione aperta; ritorna True se ok, False se non riuscito."""
+    def _connect(self) -> bool:
+        if self._released:
+            # riuso dopo close(): si riprende il trasporto condiviso
+            self._released = False
+            if self.bus is not None:
+                self._acquire_bus()
         try:
-            # il client pymodbus non espone un flag affidabile, richiamiamo connect()
-            return bool(self.client and self.client.connect())
+            ok = bool(self.client and self._exec(lambda c: c.connect(), priority=PRIO_HIGH))
         except Exception as e:
             print(f'[WARN] Connessione Modbus non disponibile: {e}')
+            ok = False
+        if ok:
+            if self._connected_once:
+                # riconnessione: dall'altra parte potrebbe esserci un altro apparecchio
+                invalidate_sn(self.proto, self.ip or self.com, self.slave, port=self.port)
+            self._connected_once = True
+            self.generation += 1
+            self._transport_gen = getattr(self.client, "generation", None)
+            self._reconnect_fails = 0
+            self._fails = 0
+            self.state = STATE_CONNECTED
+        else:
+            self._reconnect_fails += 1
+            self._schedule_reconnect()
+        return ok
+
+    def _schedule_reconnect(self):
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** max(0, self._reconnect_fails - 1)))
+        self._next_attempt = time.monotonic() + backoff
+        self.state = STATE_OFFLINE if self._reconnect_fails >= self.offline_after else STATE_RECONNECTING
+
+    def available(self) -> bool:
+        """False se siamo in backoff o col breaker aperto: le operazioni falliscono subito senza toccare il bus."""
+        if self.breaker.is_open():
+            return False
+        if self.state in (STATE_CONNECTED, STATE_DEGRADED):
+            return True
+        return time.monotonic() >= self._next_attempt
+
+    def note_success(self):
+        self.stats.requests += 1
+        self.stats.successes += 1
+        self.breaker.record_success()
+        self._fails = 0
+        self._reconnect_fails = 0
+        self.state = STATE_CONNECTED
+
+    def note_failure(self, err: Optional[Exception] = None):
+        self.stats.requests += 1
+        self.stats.failures += 1
+        self.stats.last_failure_ts = time.time()
+        if err is not None:
+            self.stats.last_error = str(err)
+        if self.breaker.record_failure():
+            self.stats.breaker_trips += 1
+            print(f"[WARN] Inverter slave {self.slave} ({self.ip or self.com}): circuit breaker aperto")
+        self._fails += 1
+        if self.state not in (STATE_CONNECTED, STATE_DEGRADED):
+            # tentativo durante il backoff fallito: allunga il backoff
+            self._reconnect_fails += 1
+            self._schedule_reconnect()
+        elif self._fails >= self.degraded_after:
+            # troppi errori: chiude (solo TCP/HUB; la COM RTU è condivisa) e passa al backoff
+            if self.bus is None:
+                try: self.client.close()
+                except Exception: pass
+            self._reconnect_fails = 1
+            self._schedule_reconnect()
+        else:
+            self.state = STATE_DEGRADED
+
+    def _admit(self) -> bool:
+        """Ammissione di un'operazione: breaker + stato connessione. False = fallisci subito."""
+        if not self.breaker.allow():
+            self.stats.rejected += 1
+            return False
+        if not self._ensure_connected():
+            self.note_failure()
             return False
+        return True
+
+    def _ensure_connected(self) -> bool:
+        """Assicura connessione aperta senza riconnettere a ogni chiamata; fail-fast in backoff."""
+        if not (self.state in (STATE_CONNECTED, STATE_DEGRADED) or time.monotonic() >= self._next_attempt):
+            return False
+        if self.state in (STATE_CONNECTED, STATE_DEGRADED) and self._is_open():
+            gen = getattr(self.client, "generation", None)
+            if gen != self._transport_gen:
+                # connessione condivisa riaperta dall'AsyncPoller: per la cache scritture
+                # vale come una nostra riconnessione (la cache SN la invalida il listener)
+                self._transport_gen = gen
+                self.generation += 1
+            return True
+        return self._connect()
+
+    def probe(self, reg: int = 0x0404) -> str:
+        """Health probe: una lettura singola senza retry; aggiorna e ritorna lo stato."""
+        if not self._admit():
+            return self.state
+        try:
+            rr = self._exec(lambda c: c.read_holding_registers(address=reg, count=1, slave=self.slave),
+                            priority=PRIO_NORMAL)
+            if rr is not None and not isinstance(rr, ModbusIOException) and not rr.isError():
+                self.note_success()
+            else:
+                self.note_failure()
+        except Exception as e:
+            self.note_failure(e)
+        return self.state
 
     def _preflight_serial(self, port: str):
         # 1) la porta esiste?
@@ -60,43 +272,144 @@ class Inverter:
             print(f'[WARN] Porta seriale occupata o non apribile: {port} ({e}) — riprovo al primo utilizzo.')
             return False
 
-    def _retry(self, fn, attempts: int = 3, delay: float = 0.3):
+    def _retry(self, fn, policy: Optional[RetryPolicy] = None):
+        """
+        Esegue fn() secondo la RetryPolicy. Ogni tentativo prende il bus (lock/coda) solo
+        per la durata del frame: il backoff tra i tentativi è dormito senza lock, così
+        gli altri thread/dispositivi non restano in attesa.
+        """
+        policy = policy or self.retry_policy
+        delays = policy.delays()
         last = None
-        for _ in range(attempts):
+        for attempt in range(max(1, policy.attempts)):
+            if attempt:
+                self.stats.retries += 1
             try:
                 res = fn()
                 if res and not isinstance(res, ModbusIOException):
                     return res
             except Exception as e:
                 last = e
-            time.sleep(delay)
+            d = next(delays, None)
+            if d is None:
+                break
+            time.sleep(d)
         if last:
             raise last
         raise IOError("Operazione Modbus fallita")
 
-    def read(self, reg: Union[int, str], count: int = 1) -> Optional[List[int]]:
+    def read(self, reg: Union[int, str], count: int = 1, priority: int = PRIO_NORMAL) -> Optional[List[int]]:
         r = int(reg, 16) if isinstance(reg, str) else int(reg)
-        if not self._ensure_connected():
+        if not self._admit():
             return None
-        with self._lock:
-            rr = self._retry(lambda: self.client.read_holding_registers(address=r, count=count, slave=self.slave))
+        try:
+            rr = self._retry(lambda: self._exec(
+                lambda c: c.read_holding_registers(address=r, count=count, slave=self.slave), priority=priority))
+        except Exception as e:
+            self.note_failure(e)
+            raise
+        self.note_success()
         return rr.registers if hasattr(rr, 'registers') else None
 
-    def write(self, reg: Union[int, str], values: Union[int, List[int]], scale: int = 1) -> bool:
+    def write(self, reg: Union[int, str], values: Union[int, List[int]], scale: int = 1,
+              priority: int = PRIO_HIGH) -> bool:
         r = int(reg, 16) if isinstance(reg, str) else int(reg)
-        if not self._ensure_connected():
+        if not self._admit():
+            return False
+        if isinstance(values, list):
+            scaled = [int(v / scale) for v in values]
+        else:
+            scaled = [int(values / scale)]
+        try:
+            rr = self._retry(lambda: self._exec(lambda c: c.write_registers(r, scaled, slave=self.slave),
+                                                priority=priority))
+        except Exception as e:
+            self.note_failure(e)
+            raise
+        self.note_success()  # l'inverter ha risposto, anche se con un'eccezione Modbus
+        if rr.isError():
+            print(f"[WARN] Scrittura 0x{r:04X} rifiutata da slave {self.slave} ({self.ip or self.com}): {rr}")
             return False
-        with self._lock:
-            if isinstance(values, list):
-                scaled = [int(v / scale) for v in values]
-                self._retry(lambda: self.client.write_registers(r, scaled, slave=self.slave))
-            else:
-                self._retry(lambda: self.client.write_registers(r, [int(values / scale)], slave=self.slave))
         return True
 
-    def close(self):
+    def read_sn(self, use_cache: bool = True) -> Optional[str]:
+        """
+        Serial number in due letture a blocco (SN_BLOCKS) sul trasporto condiviso
+        (coda SerialBus su RTU, limiter su HUB), priorità bassa. Il risultato valido
+        viene messo in cache per (protocollo, indirizzo, porta, slave); None se non leggibile.
+        """
+        address = self.ip or self.com
+        if use_cache:
+            sn = cached_sn(self.proto, address, self.slave, port=self.port)
+            if sn:
+                return sn
         try:
-            if self.client:
-                self.client.close()
+            head = self.read(SN_BLOCKS[0][0], SN_BLOCKS[0][1], priority=PRIO_LOW)
         except Exception:
-            pass
+            head = None
+        if not head:
+            # SN corto: alcuni modelli rifiutano 0x044C (risposta di eccezione: read() ritorna None)
+            head = self.read(SN_SHORT_BLOCK[0], SN_SHORT_BLOCK[1], priority=PRIO_LOW)
+        if not head:
+            return None
+        regs = list(head)
+        if len(regs) == SN_BLOCKS[0][1]:
+            try:
+                tail = self.read(SN_BLOCKS[1][0], SN_BLOCKS[1][1], priority=PRIO_LOW)
+                regs += list(tail or [])
+            except Exception:
+                pass  # SN a 14/16 caratteri: la seconda parte può mancare
+        # registri a zero = caratteri assenti (come nella lettura storica registro per registro)
+        sn = decode_ascii([r for r in regs if r])
+        if not sn or len(sn) not in SN_LENGTHS:
+            print(f"[WARN] SN incompleto da slave {self.slave} ({address}): {sn!r}")
+            return None
+        with _sn_lock:
+            _sn_cache[_sn_key(self.proto, address, self.slave, self.port)] = sn
+        return sn
+
+    def close(self):
+        """Rilascia il trasporto condiviso: COM/connessione si chiudono solo con l'ultimo slave."""
+        if not self._released:
+            self._released = True
+            try:
+                if self.bus is not None:
+                    release_serial_bus(self.com)
+                elif self.client:
+                    self.client.release()
+            except Exception:
+                pass
+        # chiusura volontaria: al prossimo uso si riconnette subito, senza backoff
+        self.state = STATE_RECONNECTING
+        self._next_attempt = 0.0
+
+
+def read_inverter_sn(proto: str, address: str, slave: int = 1, port: Optional[int] = None,
+                     timeout: float = 1.0, use_cache: bool = True, attempts: int = 3) -> Optional[str]:
+    """
+    SN di un inverter senza istanziare Instruments (pannello Log, Debug.py).
+    Cache prima di tutto; altrimenti Inverter temporaneo sul trasporto condiviso,
+    rilasciato alla fine (COM/connessione restano aperte solo se altri slave le usano).
+    """
+    if use_cache:
+        sn = cached_sn(proto, address, slave, port=port)
+        if sn:
+            return sn
+    if proto == "RTU":
+        drv = Inverter(proto, com=address, slave=slave, timeout=timeout)
+    else:
+        drv = Inverter(proto, ip=address, port=port, slave=slave, timeout=timeout)
+    try:
+        for _ in range(max(1, attempts)):
+            try:
+                sn = drv.read_sn(use_cache=False)
+            except Exception as e:
+                print(f"[WARN] Lettura SN {proto} {address}/{slave}: {e}")
+                sn = None
+            if sn:
+                return sn
+            if not drv.available():
+                break
+        return None
+    finally:
+        drv.close()
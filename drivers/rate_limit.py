@@ -0,0 +1,130 @@
+# drivers/rate_limit.py
+from __future__ import annotations
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from .serial_bus import PRIO_NORMAL
+
+# Valori di default per l'AzzurroHUB (richieste/s sostenibili e burst) — adattabili
+# per singolo HUB con configure_hub_limiter() (pannello Log: campo "HUB req/s").
+# Il burst copre una riga di logging completa (10 inverter x ~4 blocchi) senza attese;
+# rate <= 0 disattiva il limite.
+HUB_DEFAULT_RATE = 40.0
+HUB_DEFAULT_BURST = 40
+
+
+class TokenBucket:
+    """
+    Token bucket con coda a priorità: 'rate' richieste/s a regime, fino a 'burst'
+    richieste ravvicinate. A parità di token disponibili passa prima la priorità più
+    alta (valore più basso), poi FIFO. Condiviso da tutti i thread che parlano allo stesso HUB.
+    Con rate <= 0 il limite è disattivato (acquire/try_acquire passano sempre).
+    """
+
+    def __init__(self, rate: float = HUB_DEFAULT_RATE, burst: int = HUB_DEFAULT_BURST):
+        self.configure(rate, burst)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def configure(self, rate: float, burst: int):
+        if burst < 1:
+            raise ValueError("burst deve essere >= 1")
+        self.rate = max(0.0, float(rate))
+        self.burst = int(burst)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def try_acquire(self, priority: int = PRIO_NORMAL) -> bool:
+        """
+        Prende un token senza attendere. Rispetta la coda: passa solo se nessun thread in
+        attesa ha priorità uguale o più alta. Pensato per i chiamanti asyncio, che attendono
+        con asyncio.sleep (vedi wait_hint) e non lasciano nulla in sospeso se cancellati.
+        """
+        if not self.enabled:
+            return True
+        with self._cond:
+            self._refill()
+            if self._tokens >= 1.0 and (not self._waiters or self._waiters[0][0] > priority):
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def wait_hint(self) -> float:
+        """Attesa suggerita [s] prima di riprovare try_acquire."""
+        if not self.enabled:
+            return 0.0
+        with self._cond:
+            self._refill()
+            return max(0.01, (1.0 - self._tokens) / self.rate) if self._tokens < 1.0 else 0.01
+
+    def acquire(self, priority: int = PRIO_NORMAL, timeout: Optional[float] = None) -> bool:
+        """Attende un token; False solo se scade 'timeout'."""
+        if not self.enabled:
+            return True
+        ticket = (priority, next(self._seq))
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    if not self.enabled:  # limite disattivato mentre eravamo in coda
+                        return True
+                    self._refill()
+                    if self._waiters[0] == ticket and self._tokens >= 1.0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1.0
+                        self._cond.notify_all()
+                        return True
+                    wait = (1.0 - self._tokens) / self.rate if self._tokens < 1.0 else 0.05
+                    if end is not None:
+                        left = end - time.monotonic()
+                        if left <= 0:
+                            return False
+                        wait = min(wait, left)
+                    self._cond.wait(timeout=wait)
+            finally:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+
+
+# ---- registro process-wide: un limiter per HUB (ip, porta) ----
+_hub_limiters: Dict[Tuple[str, int], TokenBucket] = {}
+_hub_lock = threading.Lock()
+
+
+def get_hub_limiter(ip: str, port: int = 55400) -> TokenBucket:
+    with _hub_lock:
+        lim = _hub_limiters.get((ip, int(port)))
+        if lim is None:
+            lim = TokenBucket()
+            _hub_limiters[(ip, int(port))] = lim
+        return lim
+
+
+def find_hub_limiter(ip: str, port: int) -> Optional[TokenBucket]:
+    """Limiter già registrato per (ip, porta), None se la destinazione non è un HUB noto."""
+    with _hub_lock:
+        return _hub_limiters.get((ip, int(port)))
+
+
+def configure_hub_limiter(ip: str, port: int = 55400, rate: float = HUB_DEFAULT_RATE,
+                          burst: int = HUB_DEFAULT_BURST) -> TokenBucket:
+    lim = get_hub_limiter(ip, port)
+    with lim._cond:
+        lim.configure(rate, burst)
+        lim._cond.notify_all()
+    return lim
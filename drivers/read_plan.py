@@ -0,0 +1,129 @@
+# drivers/read_plan.py
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence, Tuple
+from .decoders import register_width, to_int_reg
+
+# Limite protocollo Modbus per FC03 (read holding registers)
+MODBUS_MAX_READ = 125
+
+
+@dataclass
+class ReadBlock:
+    start: int                     # primo registro del blocco
+    count: int                     # numero di registri letti in un'unica richiesta
+    slots: List[Tuple[int, int]] = field(default_factory=list)  # (indice colonna, offset nel blocco)
+
+    @property
+    def end(self) -> int:
+        return self.start + self.count - 1
+
+
+def compile_read_plan(registers: Sequence[Tuple[Any, Any, Any]], max_gap: int = 0,
+                      max_count: int = MODBUS_MAX_READ) -> List[ReadBlock]:
+    """
+    Compila la lista registri del logger [(label, reg, scale[, periodo[, tipo]]), ...] nel numero
+    minimo di letture a blocco (i tipi a 32 bit / ascii occupano più registri consecutivi).
+      - max_gap: registri "buchi" tollerati tra due indirizzi usati (letti e scartati)
+      - max_count: lunghezza massima del blocco (limite Modbus 125)
+    Registri duplicati finiscono nello stesso slot di lettura.
+    """
+    max_count = max(1, min(int(max_count), MODBUS_MAX_READ))
+    max_gap = max(0, int(max_gap))
+
+    addrs = sorted((to_int_reg(entry[1]), col, register_width(entry)) for col, entry in enumerate(registers))
+    blocks: List[ReadBlock] = []
+    cur: Optional[ReadBlock] = None
+    for addr, col, width in addrs:
+        if cur is not None:
+            gap = addr - cur.end - 1
+            new_count = addr + width - cur.start
+            if gap <= max_gap and new_count <= max_count:
+                cur.count = max(cur.count, new_count)
+                cur.slots.append((col, addr - cur.start))
+                continue
+        cur = ReadBlock(start=addr, count=min(width, max_count), slots=[(col, 0)])
+        blocks.append(cur)
+    return blocks
+
+
+def split_block_values(plan: Sequence[ReadBlock], results: Sequence[Optional[List[int]]],
+                       n_cols: int) -> List[Optional[int]]:
+    """
+    Riporta i valori grezzi letti a blocco nell'ordine delle colonne del logger.
+    'results' è allineato a 'plan' (None se la lettura del blocco è fallita).
+    """
+    out: List[Optional[int]] = [None] * n_cols
+    for block, regs in zip(plan, results):
+        if not regs:
+            continue
+        for col, off in block.slots:
+            if off < len(regs):
+                out[col] = regs[off]
+    return out
+
+
+# ---- Polling multi-rate ----
+def register_period(entry: Sequence[Any], default: float) -> float:
+    """Periodo di polling della riga registro (label, reg, scale[, periodo]); vuoto → default."""
+    if len(entry) > 3 and entry[3] not in (None, ""):
+        try:
+            return float(str(entry[3]).strip().replace(",", "."))
+        except ValueError:
+            pass
+    return float(default)
+
+
+@dataclass
+class PollGroup:
+    every: int                     # ogni quanti tick base viene letto
+    phase: int                     # primo tick (sfasa i gruppi lenti tra loro)
+    cols: List[int] = field(default_factory=list)
+    last_tick: Optional[int] = None
+
+
+class MultiRatePlanner:
+    """
+    Raggruppa i registri per periodo di polling (multipli interi del tick base) e,
+    tick per tick, ritorna solo le colonne dovute con il relativo piano a blocchi.
+    I gruppi lenti sono sfasati così non cadono tutti sullo stesso tick: il bus resta
+    libero per i canali veloci. Se un tick viene saltato dallo scheduler, il gruppo
+    viene letto al primo tick utile.
+    """
+
+    def __init__(self, registers: Sequence[Sequence[Any]], base_period: float, max_gap: int = 0,
+                 max_count: int = MODBUS_MAX_READ):
+        self.registers = list(registers)
+        self.max_gap = max_gap
+        self.max_count = max_count
+        by_every = {}
+        for col, entry in enumerate(self.registers):
+            every = max(1, int(round(register_period(entry, base_period) / float(base_period))))
+            by_every.setdefault(every, []).append(col)
+        self.groups = [PollGroup(every=e, phase=(i % e), cols=cols)
+                       for i, (e, cols) in enumerate(sorted(by_every.items()))]
+        self._plans = {}  # cache: tupla colonne dovute -> piano
+
+    @property
+    def multirate(self) -> bool:
+        return any(g.every > 1 for g in self.groups)
+
+    def due(self, tick_index: int) -> Tuple[List[int], List[ReadBlock]]:
+        cols: List[int] = []
+        for g in self.groups:
+            if g.last_tick is None:
+                ok = tick_index >= g.phase
+            else:
+                # tick_index < last_tick: griglia ripartita (pausa) → rilegge subito
+                ok = tick_index < g.last_tick or tick_index - g.last_tick >= g.every
+            if ok:
+                g.last_tick = tick_index
+                cols.extend(g.cols)
+        cols.sort()
+        key = tuple(cols)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = compile_read_plan([self.registers[c] for c in cols],
+                                     max_gap=self.max_gap, max_count=self.max_count)
+            self._plans[key] = plan
+        return cols, plan
@@ -161,6 +161,31 @@ def _find_batt_power_col(df):
     return None
 
 
+def _densify_log(df):
+    """
+    Log "solo variazioni" (colonna sample_period_s): ricostruisce la serie densa sul
+    periodo base con forward-fill. I log normali sono ritornati invariati.
+    """
+    from .deadband import SPARSE_PERIOD_COL
+    if SPARSE_PERIOD_COL not in df.columns or "timestamp" not in df.columns or df.empty:
+        return df
+    try:
+        period = float(pd.to_numeric(df[SPARSE_PERIOD_COL], errors="coerce").dropna().iloc[0])
+    except Exception:
+        return df.drop(columns=[SPARSE_PERIOD_COL])
+    ts = pd.to_datetime(df["timestamp"], errors="coerce")
+    d = df.drop(columns=[SPARSE_PERIOD_COL]).assign(timestamp=ts).dropna(subset=["timestamp"])
+    d = d.drop_duplicates(subset="timestamp", keep="last").set_index("timestamp").sort_index()
+    if d.empty or period <= 0:
+        return df.drop(columns=[SPARSE_PERIOD_COL])
+    grid = pd.date_range(d.index[0], d.index[-1], freq=pd.to_timedelta(period, unit="s"))
+    dense = d.reindex(d.index.union(grid)).ffill().reindex(grid)
+    dense.index.name = "timestamp"
+    dense = dense.reset_index()
+    dense["timestamp"] = dense["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return dense
+
+
 def _build_time_axis(df):
     """Ritorna (t_s, has_ts): array di secondi da inizio e flag se c'era timestamp.
        Se non c'è timestamp, usa dt uniforme dalla mediana delle differenze o 1 s."""
@@ -630,7 +655,7 @@ def render_mppt_report_html(log_xlsx_path: str,
             main_serial = sn
             break
     sheet_name = sheet_name or xls.sheet_names[0]
-    df = pd.read_excel(xls, sheet_name=sheet_name)
+    df = _densify_log(pd.read_excel(xls, sheet_name=sheet_name))
 
     # # ---- Calcolo PASS/FAIL in base al template ----
 
@@ -1002,7 +1027,7 @@ def _compute_result_for(log_xlsx_path, template_path, serial):
         xls = pd.ExcelFile(log_xlsx_path, engine="openpyxl")
         # scegli foglio del seriale, altrimenti il primo
         sheet = serial if serial in xls.sheet_names else xls.sheet_names[0]
-        df = pd.read_excel(xls, sheet_name=sheet)
+        df = _densify_log(pd.read_excel(xls, sheet_name=sheet))
     except Exception:
         return "n/d"
 
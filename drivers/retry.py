@@ -0,0 +1,100 @@
+# drivers/retry.py
+from __future__ import annotations
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Iterator, Optional
+
+
+@dataclass
+class RetryPolicy:
+    """Retry con backoff esponenziale e jitter; i ritardi sono dormiti SENZA lock sul bus."""
+    attempts: int = 3
+    base_delay: float = 0.1   # [s] ritardo dopo il primo tentativo fallito
+    max_delay: float = 1.0    # [s] tetto del singolo ritardo
+    jitter: float = 0.5       # frazione casuale ±jitter sul ritardo (evita retry sincronizzati)
+
+    def delays(self) -> Iterator[float]:
+        """Ritardi da applicare tra un tentativo e il successivo (attempts-1 valori)."""
+        for i in range(max(0, self.attempts - 1)):
+            d = min(self.max_delay, self.base_delay * (2 ** i))
+            yield max(0.0, d * (1.0 + random.uniform(-self.jitter, self.jitter)))
+
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per dispositivo:
+      - closed: operazioni libere; dopo 'fail_threshold' fallimenti consecutivi → open
+      - open: operazioni rifiutate subito per 'reset_timeout' secondi
+      - half_open: passa un solo tentativo di prova; successo → closed, fallimento → open
+    """
+
+    def __init__(self, fail_threshold: int = 5, reset_timeout: float = 10.0):
+        self.fail_threshold = fail_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BREAKER_CLOSED
+        self._fails = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """Controllo senza effetti collaterali: True se le operazioni verrebbero rifiutate."""
+        with self._lock:
+            if self.state == BREAKER_OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == BREAKER_HALF_OPEN and self._trial
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return True
+            if self.state == BREAKER_OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = BREAKER_HALF_OPEN
+                self._trial = False
+            if self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = BREAKER_CLOSED
+            self._fails = 0
+            self._trial = False
+
+    def record_failure(self) -> bool:
+        """Registra un fallimento; ritorna True se il breaker si è (ri)aperto ora."""
+        with self._lock:
+            self._fails += 1
+            if self.state == BREAKER_HALF_OPEN or self._fails >= self.fail_threshold:
+                tripped = self.state != BREAKER_OPEN
+                self.state = BREAKER_OPEN
+                self._opened_at = time.monotonic()
+                self._trial = False
+                return tripped
+            return False
+
+
+@dataclass
+class DeviceStats:
+    """Statistiche per dispositivo (operazioni Modbus complete, non singoli tentativi)."""
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    retries: int = 0
+    rejected: int = 0          # operazioni rifiutate da breaker/backoff senza traffico
+    breaker_trips: int = 0
+    last_error: Optional[str] = None
+    last_failure_ts: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
@@ -0,0 +1,99 @@
+# drivers/scheduler.py
+from __future__ import annotations
+import math
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class Tick:
+    index: int         # indice sulla griglia (t0 + index*period)
+    deadline: float    # istante previsto (time.monotonic)
+    start: float       # istante reale di inizio acquisizione
+    lateness: float    # start - deadline [s]
+    duration: float = 0.0   # durata acquisizione [s] (compilata da end_tick)
+    overrun: bool = False   # acquisizione oltre la deadline successiva
+    skipped: int = 0        # tick della griglia saltati dopo questo
+
+
+class FixedRateScheduler:
+    """
+    Scheduler a periodo fisso su orologio monotono: i campioni restano sulla griglia
+    t0 + k*period indipendentemente dalla durata dell'acquisizione (niente deriva).
+      - skip_late=True: se un'acquisizione sfora, si salta al primo punto di griglia futuro
+        e i tick persi vengono contati come missed
+      - skip_late=False: il tick in ritardo parte subito ed è solo segnalato (overrun)
+    Tiene le statistiche di latenza/jitter (Welford) e i contatori di deadline mancate.
+    """
+
+    def __init__(self, period: float, skip_late: bool = True):
+        if period <= 0:
+            raise ValueError("period deve essere > 0")
+        self.period = float(period)
+        self.skip_late = skip_late
+        self._t0 = None
+        self._k = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+        self.max_duration = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def start(self):
+        self._t0 = time.monotonic()
+        self._k = 0
+
+    def reanchor(self):
+        """Riparte la griglia da adesso (es. dopo una pausa) senza contare i tick persi."""
+        self.start()
+
+    def wait_next(self) -> Tick:
+        if self._t0 is None:
+            self.start()
+        deadline = self._t0 + self._k * self.period
+        now = time.monotonic()
+        if now < deadline:
+            time.sleep(deadline - now)
+            now = time.monotonic()
+        return Tick(index=self._k, deadline=deadline, start=now, lateness=max(0.0, now - deadline))
+
+    def end_tick(self, tick: Tick) -> Tick:
+        now = time.monotonic()
+        tick.duration = now - tick.start
+        self.ticks += 1
+        self.max_lateness = max(self.max_lateness, tick.lateness)
+        self.max_duration = max(self.max_duration, tick.duration)
+        delta = tick.lateness - self._mean
+        self._mean += delta / self.ticks
+        self._m2 += delta * (tick.lateness - self._mean)
+
+        self._k = tick.index + 1
+        next_deadline = self._t0 + self._k * self.period
+        if now > next_deadline:
+            tick.overrun = True
+            self.overruns += 1
+            if self.skip_late:
+                k_next = int(math.floor((now - self._t0) / self.period)) + 1
+                tick.skipped = k_next - self._k
+                self.missed += tick.skipped
+                self._k = k_next
+        return tick
+
+    @property
+    def jitter(self) -> float:
+        """Deviazione standard della latenza di avvio dei tick [s]."""
+        return math.sqrt(self._m2 / (self.ticks - 1)) if self.ticks > 1 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "period_s": self.period,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "missed": self.missed,
+            "mean_lateness_s": self._mean,
+            "max_lateness_s": self.max_lateness,
+            "jitter_s": self.jitter,
+            "max_duration_s": self.max_duration,
+        }
@@ -0,0 +1,113 @@
+# drivers/scpi.py
+from __future__ import annotations
+from typing import Iterable, List, Optional, Tuple
+
+# Coda errori: 'SYST:ERR?' ritorna '<codice>,"<messaggio>"', codice 0 = coda vuota
+SCPI_ERR_QUERY = "SYST:ERR?"
+SCPI_ERR_MAX_READS = 32  # la coda degli strumenti è limitata: oltre c'è un problema di lettura
+
+# Lunghezza massima di una riga SCPI composta (buffer di ingresso degli strumenti seriali);
+# oltre, il batch viene spezzato in più righe
+SCPI_MAX_LINE = 200
+
+
+def join_commands(cmds: Iterable[str], max_line: int = SCPI_MAX_LINE) -> List[str]:
+    """
+    Unisce comandi SCPI in righe composte separate da ';'. Ogni comando successivo al primo
+    riparte dalla radice (':'), così il path dell'header non dipende dal comando precedente.
+    """
+    lines: List[str] = []
+    cur = ""
+    for c in cmds:
+        c = str(c).strip()
+        if not c:
+            continue
+        part = c if (not cur or c.startswith("*") or c.startswith(":")) else ":" + c
+        if cur and len(cur) + 1 + len(part) > max_line:
+            lines.append(cur)
+            cur, part = "", c
+        cur = f"{cur};{part}" if cur else part
+    if cur:
+        lines.append(cur)
+    return lines
+
+
+def send_batch(inst, cmds: Iterable[str], opc: bool = False, max_line: int = SCPI_MAX_LINE) -> bool:
+    """
+    Invia i comandi come righe composte (una sola nel caso tipico).
+    opc=True: l'ultima riga termina con '*OPC?' e si attende la risposta (comandi completati).
+    """
+    lines = join_commands(cmds, max_line=max_line)
+    if not lines:
+        return True
+    for line in lines[:-1]:
+        inst.write(line)
+    if opc:
+        return inst.query(lines[-1] + ";*OPC?").strip().endswith("1")
+    inst.write(lines[-1])
+    return True
+
+
+class ScpiBatch:
+    """
+    Accumula comandi e li invia in un'unica riga all'uscita dal blocco:
+        with ScpiBatch(dc.inst, opc=True) as b:
+            b.add("SOL:USER:VOC 400"); b.add("OUTP 1")
+    """
+
+    def __init__(self, inst, opc: bool = False, max_line: int = SCPI_MAX_LINE):
+        self.inst = inst
+        self.opc = opc
+        self.max_line = max_line
+        self.cmds: List[str] = []
+        self.result: Optional[bool] = None
+
+    def add(self, cmd: str) -> "ScpiBatch":
+        self.cmds.append(cmd)
+        return self
+
+    def flush(self) -> bool:
+        cmds, self.cmds = self.cmds, []
+        self.result = send_batch(self.inst, cmds, opc=self.opc, max_line=self.max_line)
+        return self.result
+
+    def __enter__(self) -> "ScpiBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+
+def parse_scpi_error(resp: str) -> Tuple[int, str]:
+    """'-222,"Data out of range"' → (-222, 'Data out of range'); risposta illeggibile → codice -1."""
+    code, _, msg = str(resp).strip().partition(",")
+    try:
+        return int(code), msg.strip().strip('"')
+    except ValueError:
+        return -1, str(resp).strip()
+
+
+def check_errors(inst) -> dict:
+    """
+    Svuota la coda errori dello strumento e la associa ai comandi inviati dall'ultimo controllo.
+    'inst' è una VisaSession (journal e lock); con una risorsa semplice 'commands' resta vuoto.
+    Ritorna {"errors": [(codice, messaggio)], "commands": [[ts, comando, ripetizioni]]}.
+    """
+    query = getattr(inst, "raw_query", inst.query)  # la query di controllo non entra nel journal
+    lock = getattr(inst, "lock", None)
+    errors = []
+    if lock is not None:
+        lock.acquire()
+    try:
+        for _ in range(SCPI_ERR_MAX_READS):
+            code, msg = parse_scpi_error(query(SCPI_ERR_QUERY))
+            if code == 0:
+                break
+            errors.append((code, msg))
+        commands = inst.take_journal() if hasattr(inst, "take_journal") else []
+    finally:
+        if lock is not None:
+            lock.release()
+    return {"errors": errors, "commands": commands}
@@ -0,0 +1,148 @@
+# drivers/serial_bus.py
+from __future__ import annotations
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+from pymodbus.client import ModbusSerialClient
+
+# Priorità richieste (valore più basso = servita prima)
+PRIO_HIGH = 0     # scritture del test executor
+PRIO_NORMAL = 1   # letture del logger
+PRIO_LOW = 2      # letture di servizio (storico eventi, SN, ...)
+
+# Attesa massima [s] di una richiesta accodata (coda + frame): oltre, il chiamante riceve TimeoutError
+SUBMIT_WAIT_MAX = 30.0
+
+
+def _silent_interval(baudrate: int, bits_per_char: int = 11) -> float:
+    """t3.5 Modbus RTU: 3.5 caratteri; sopra 19200 baud la specifica fissa 1.75 ms."""
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * bits_per_char / float(baudrate)
+
+
+class SerialBus:
+    """
+    Arbitro di una porta seriale RS485: un solo ModbusSerialClient per COM e una coda
+    a priorità servita da un thread dedicato. Tutti gli slave sulla stessa porta
+    passano da qui, quindi i frame di logger e test non si sovrappongono mai sul filo
+    e tra un frame e il successivo viene sempre rispettato il silenzio t3.5.
+    """
+
+    def __init__(self, com: str, baudrate: int = 9600, timeout: float = 1.0,
+                 stopbits: int = 1, bytesize: int = 8, parity: str = 'N', turnaround: float = 0.0):
+        self.com = com
+        self.baudrate = baudrate
+        # retries=0: i tentativi li gestisce la RetryPolicy del driver, fuori dalla coda
+        self.client = ModbusSerialClient(port=com, baudrate=baudrate, timeout=timeout, retries=0,
+                                         stopbits=stopbits, bytesize=bytesize, parity=parity)
+        self.silent_interval = _silent_interval(baudrate) + max(0.0, turnaround)
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()  # FIFO a parità di priorità
+        self._last_frame = 0.0
+        self._worker = threading.Thread(target=self._run, name=f"SerialBus-{com}", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            _, _, fn, fut = self._queue.get()
+            if fut is None:  # sentinella di stop
+                break
+            if not fut.set_running_or_notify_cancel():
+                continue
+            wait = self._last_frame + self.silent_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                fut.set_result(fn(self.client))
+            except Exception as e:
+                fut.set_exception(e)
+            finally:
+                self._last_frame = time.monotonic()
+
+    def submit(self, fn: Callable[[ModbusSerialClient], Any], priority: int = PRIO_NORMAL,
+               timeout: Optional[float] = SUBMIT_WAIT_MAX) -> Any:
+        """
+        Accoda fn(client) e attende il risultato (le eccezioni vengono rilanciate al chiamante).
+        Se entro 'timeout' la richiesta non è servita viene tolta dalla coda (TimeoutError);
+        se era già sul filo il worker la completa comunque, ma nessuno ne attende l'esito.
+        """
+        if threading.current_thread() is self._worker:
+            return fn(self.client)  # chiamata annidata dal worker stesso
+        if not self._worker.is_alive():
+            raise IOError(f"SerialBus {self.com} rilasciata")
+        fut: Future = Future()
+        self._queue.put((priority, next(self._seq), fn, fut))
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            fut.cancel()
+            raise TimeoutError(f"SerialBus {self.com}: nessuna risposta entro {timeout:.1f}s")
+
+    def connect(self) -> bool:
+        return bool(self.submit(lambda c: c.connect(), priority=PRIO_HIGH))
+
+    def close(self):
+        """Chiude la porta (libera la COM); il worker resta attivo e riapre al prossimo connect()."""
+        try:
+            self.submit(lambda c: c.close(), priority=PRIO_HIGH)
+        except Exception:
+            pass
+
+
+# ---- registro process-wide: una SerialBus per porta fisica, con conteggio utenti ----
+_buses: Dict[str, SerialBus] = {}
+_bus_users: Dict[str, int] = {}
+_com_locks: Dict[str, threading.Lock] = {}
+_buses_lock = threading.Lock()
+
+
+def get_serial_bus(com: str, **kwargs) -> SerialBus:
+    """
+    Ritorna la SerialBus della porta 'com', creandola al primo uso (kwargs solo alla creazione).
+    Ogni chiamata conta come un utente: va bilanciata da release_serial_bus().
+    """
+    with _buses_lock:
+        bus = _buses.get(com)
+        if bus is None:
+            bus = SerialBus(com, **kwargs)
+            _buses[com] = bus
+        _bus_users[com] = _bus_users.get(com, 0) + 1
+        return bus
+
+
+def com_lock(com: str) -> threading.Lock:
+    """
+    Lock per porta: chi deve controllare/aprire la COM prima di prendere la bus (preflight
+    negli Inverter RTU creati in parallelo) lo tiene per tutto check + apertura + get_serial_bus.
+    """
+    with _buses_lock:
+        lock = _com_locks.get(com)
+        if lock is None:
+            lock = _com_locks[com] = threading.Lock()
+        return lock
+
+
+def has_serial_bus(com: str) -> bool:
+    with _buses_lock:
+        return com in _buses
+
+
+def release_serial_bus(com: str):
+    """
+    Rilascia un utente della SerialBus di 'com'. Con l'ultimo la porta viene chiusa (COM
+    libera), il worker fermato e la bus rimossa dal registro.
+    """
+    with _buses_lock:
+        left = _bus_users.get(com, 0) - 1
+        if left > 0:
+            _bus_users[com] = left
+            return
+        _bus_users.pop(com, None)
+        bus = _buses.pop(com, None)
+    if bus is not None:
+        bus.close()
+        bus._queue.put((-1, -1, None, None))  # sentinella: ferma il worker
@@ -0,0 +1,309 @@
+# drivers/simulator.py
+"""
+Simulatore locale di inverter Modbus (TCP / AzzurroHUB / RTU su pty) per provare
+Inverter, Instruments e il percorso di acquisizione senza hardware.
+Serve la stessa mappa registri usata da logger e test (vedi default_register_map).
+
+Uso tipico (vedi Benchmark.py):
+    sim = TcpSimulator(slaves=[1], cfg=SimConfig(latency=0.01)); sim.start()
+    ... Inverter(proto="TCP", ip="127.0.0.1", port=sim.port) ...
+    sim.stop()
+
+Nota: RtuSimulator usa una pseudo-tty (os.openpty), quindi solo Linux/macOS.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import random
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+EXC_ILLEGAL_FUNCTION = 0x01
+EXC_ILLEGAL_ADDRESS = 0x02
+EXC_DEVICE_FAILURE = 0x04
+
+
+@dataclass
+class SimConfig:
+    latency: float = 0.005      # [s] tempo di risposta medio
+    jitter: float = 0.0         # [s] ± variazione uniforme sul tempo di risposta
+    error_rate: float = 0.0     # probabilità di risposta d'eccezione (slave device failure)
+    drop_rate: float = 0.0      # probabilità di nessuna risposta (il client va in timeout)
+    strict: bool = False        # True: registri non mappati → eccezione 02; False → 0
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+def _bcd(n: int) -> int:
+    return ((n // 10) << 4) | (n % 10)
+
+
+def _ascii_regs(text: str, n_regs: int) -> List[int]:
+    b = text.encode("ascii")[:2 * n_regs].ljust(2 * n_regs, b"\x00")
+    return [(b[i] << 8) | b[i + 1] for i in range(0, len(b), 2)]
+
+
+def default_register_map(slave: int, sn: Optional[str] = None) -> Dict[int, int]:
+    """Mappa registri di un inverter simulato (indirizzi come nel logger/test)."""
+    sn = sn or f"ZH1050006KE23C1803{slave:02d}"[-20:]
+    regs: Dict[int, int] = {}
+    regs[0x0404] = 2                                  # System State
+    for a in range(0x0405, 0x040F):                   # Fault1..10
+        regs[a] = 0
+    for i, v in enumerate(_ascii_regs(sn[:16], 8)):   # SN 0x0445..0x044C
+        regs[0x0445 + i] = v
+    for i, v in enumerate(_ascii_regs(sn[16:], 2)):   # SN 0x0470..0x0471
+        regs[0x0470 + i] = v
+    for a in range(0x0485, 0x048B):                   # potenze uscita/PCC
+        regs[a] = 0
+    for a in range(0x0584, 0x058A):                   # DC1/DC2
+        regs[a] = 0
+    regs[0x0667] = 0                                  # Charge/Discharge power
+    regs[0x0668] = 50                                 # SOC
+    regs[0x1110] = 0                                  # modalità controllo batteria
+    for a in range(0x1189, 0x118D):                   # setpoint batteria
+        regs[a] = 0
+    # storico eventi 0x1480: 10 voci da 4 registri (codice, YYMM, DDhh, mmss in BCD)
+    now = datetime.now()
+    for k in range(10):
+        ts = now - timedelta(minutes=10 * (k + 1))
+        base = 0x1480 + 4 * k
+        regs[base] = 0x0100 + k
+        regs[base + 1] = (_bcd(ts.year % 100) << 8) | _bcd(ts.month)
+        regs[base + 2] = (_bcd(ts.day) << 8) | _bcd(ts.hour)
+        regs[base + 3] = (_bcd(ts.minute) << 8) | _bcd(ts.second)
+    return regs
+
+
+class SimInverter:
+    """Stato registri di uno slave simulato, con misure che variano nel tempo."""
+
+    def __init__(self, slave: int, cfg: SimConfig, regs: Optional[Dict[int, int]] = None):
+        self.slave = slave
+        self.cfg = cfg
+        self.regs = regs if regs is not None else default_register_map(slave)
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+
+    def _update_measures(self):
+        t = time.monotonic() - self._t0
+        p = int(300 + 50 * (1 + ((t * 0.1) % 1.0)) + random.randint(-3, 3))  # 0.01 kW
+        self.regs[0x0485] = p
+        self.regs[0x0487] = p + 2
+        self.regs[0x0584] = 3500 + random.randint(-5, 5)                        # 0.1 V
+        self.regs[0x0585] = 1000 + random.randint(-5, 5)                        # 0.01 A
+        self.regs[0x0586] = p + 10
+
+    def read(self, addr: int, count: int):
+        """Ritorna lista valori oppure codice eccezione (int)."""
+        with self._lock:
+            self._update_measures()
+            out = []
+            for a in range(addr, addr + count):
+                if a not in self.regs and self.cfg.strict:
+                    return EXC_ILLEGAL_ADDRESS
+                out.append(self.regs.get(a, 0) & 0xFFFF)
+            return out
+
+    def write(self, addr: int, values: Iterable[int]):
+        with self._lock:
+            for i, v in enumerate(values):
+                if self.cfg.strict and (addr + i) not in self.regs:
+                    return EXC_ILLEGAL_ADDRESS
+                self.regs[addr + i] = int(v) & 0xFFFF
+            return None
+
+
+def _handle_pdu(inv: SimInverter, pdu: bytes) -> Optional[bytes]:
+    """Esegue una PDU Modbus (FC03/FC06/FC16). None = nessuna risposta (drop)."""
+    cfg = inv.cfg
+    fc = pdu[0]
+    if random.random() < cfg.drop_rate:
+        return None
+    if random.random() < cfg.error_rate:
+        return bytes([fc | 0x80, EXC_DEVICE_FAILURE])
+    if fc == 0x03 and len(pdu) >= 5:
+        addr, count = struct.unpack(">HH", pdu[1:5])
+        if not 1 <= count <= 125:
+            return bytes([fc | 0x80, 0x03])
+        res = inv.read(addr, count)
+        if isinstance(res, int):
+            return bytes([fc | 0x80, res])
+        return bytes([fc, 2 * count]) + struct.pack(f">{count}H", *res)
+    if fc == 0x06 and len(pdu) >= 5:
+        addr, value = struct.unpack(">HH", pdu[1:5])
+        res = inv.write(addr, [value])
+        return bytes([fc | 0x80, res]) if res else pdu[:5]
+    if fc == 0x10 and len(pdu) >= 6:
+        addr, count, nbytes = struct.unpack(">HHB", pdu[1:6])
+        values = struct.unpack(f">{count}H", pdu[6:6 + nbytes])
+        res = inv.write(addr, values)
+        return bytes([fc | 0x80, res]) if res else pdu[:5]
+    return bytes([fc | 0x80, EXC_ILLEGAL_FUNCTION])
+
+
+# ---------------- Modbus TCP (anche AzzurroHUB: più slave sulla stessa porta) ----------------
+class TcpSimulator:
+    """Server Modbus TCP su 127.0.0.1; più slave ID dietro la stessa porta (come l'HUB)."""
+
+    def __init__(self, slaves: Iterable[int] = (1,), cfg: Optional[SimConfig] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.cfg = cfg or SimConfig()
+        self.host = host
+        self.port = port
+        self.inverters = {s: SimInverter(s, self.cfg) for s in slaves}
+        self.requests = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread: Optional[threading.Thread] = None
+        self._server = None
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readexactly(7)
+                tid, pid, length, uid = struct.unpack(">HHHB", head)
+                pdu = await reader.readexactly(length - 1)
+                self.requests += 1
+                inv = self.inverters.get(uid)
+                if inv is None:
+                    continue  # slave inesistente: nessuna risposta
+                await asyncio.sleep(self.cfg.delay())
+                resp = _handle_pdu(inv, pdu)
+                if resp is None:
+                    continue
+                writer.write(struct.pack(">HHHB", tid, pid, len(resp) + 1, uid) + resp)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> "TcpSimulator":
+        ready = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._client, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+        ready.wait(5.0)
+        return self
+
+    async def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=2.0)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+
+# ---------------- Modbus RTU su pseudo-tty ----------------
+def crc16(data: bytes) -> int:
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+class RtuSimulator:
+    """
+    Linea RS485 simulata: N slave ID su una pseudo-tty. 'port' è il device da passare
+    a Inverter(proto="RTU", com=...). Ritardo di risposta = SimConfig + tempo di
+    trasmissione al baudrate indicato (così il benchmark rispecchia la 9600 reale).
+    """
+
+    def __init__(self, slaves: Iterable[int] = (1,), cfg: Optional[SimConfig] = None, baudrate: int = 9600):
+        self.cfg = cfg or SimConfig()
+        self.baudrate = baudrate
+        self.inverters = {s: SimInverter(s, self.cfg) for s in slaves}
+        self.requests = 0
+        self.port: Optional[str] = None
+        self._master = None
+        self._slave_fd = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _frame_len(self, buf: bytes) -> Optional[int]:
+        if len(buf) < 2:
+            return None
+        fc = buf[1]
+        if fc in (0x03, 0x06):
+            return 8
+        if fc == 0x10:
+            return 9 + buf[6] if len(buf) >= 7 else None
+        return -1  # funzione non gestita: scarta
+
+    def _wire_time(self, nbytes: int) -> float:
+        return nbytes * 11.0 / self.baudrate
+
+    def _run(self):
+        buf = b""
+        while not self._stop.is_set():
+            r, _, _ = select.select([self._master], [], [], 0.05)
+            if not r:
+                buf = b""  # silenzio > t3.5: frame incompleto scartato
+                continue
+            buf += os.read(self._master, 256)
+            while True:
+                n = self._frame_len(buf)
+                if n is None or (n > 0 and len(buf) < n):
+                    break
+                if n < 0:
+                    buf = b""
+                    break
+                frame, buf = buf[:n], buf[n:]
+                if crc16(frame[:-2]) != struct.unpack("<H", frame[-2:])[0]:
+                    buf = b""
+                    break
+                self.requests += 1
+                inv = self.inverters.get(frame[0])
+                if inv is None:
+                    continue
+                resp = _handle_pdu(inv, frame[1:-2])
+                time.sleep(self.cfg.delay() + self._wire_time(len(frame)))
+                if resp is None:
+                    continue
+                out = bytes([frame[0]]) + resp
+                out += struct.pack("<H", crc16(out))
+                time.sleep(self._wire_time(len(out)))
+                os.write(self._master, out)
+
+    def start(self) -> "RtuSimulator":
+        import tty
+        self._master, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        for fd in (self._master, self._slave_fd):
+            try: os.close(fd)
+            except Exception: pass
@@ -0,0 +1,79 @@
+# drivers/state_cache.py
+from __future__ import annotations
+import threading
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+
+class StateCache:
+    """
+    Cache write-through dell'ultimo stato comandato:
+      - sorgenti DC/AC: configurazione (chiave confrontabile) e stato dell'uscita
+      - inverter: valore dell'ultima scrittura di ogni registro, legato alla generazione della
+        connessione (dopo una riconnessione l'inverter potrebbe essere ripartito: si riscrive)
+    Si aggiorna solo dopo una scrittura riuscita; una scrittura fallita invalida le voci coinvolte.
+    Le modifiche fatte fuori da Instruments (pannelli manuali, frontale) non sono viste:
+    in quel caso invalidate() oppure force=True sul comando.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._src: Dict[str, dict] = {}                             # "DC1"/"AC" → {"cfg", "on"}
+        self._regs: Dict[str, Dict[int, Tuple[int, int]]] = {}      # inverter → {reg: (valore, generazione)}
+        self.hits = 0      # comandi saltati perché identici allo stato noto
+        self.misses = 0    # comandi inviati
+
+    # ---- sorgenti ----
+    def source_delta(self, name: str, cfg: Optional[Hashable] = None,
+                     on: Optional[bool] = None) -> Tuple[bool, bool]:
+        """(cfg da inviare?, uscita da inviare?) rispetto allo stato noto di 'name'."""
+        with self._lock:
+            st = self._src.get(name, {})
+            send_cfg = cfg is not None and st.get("cfg") != cfg
+            send_on = on is not None and st.get("on") != bool(on)
+            if send_cfg or send_on:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return send_cfg, send_on
+
+    def source_set(self, name: str, cfg: Optional[Hashable] = None, on: Optional[bool] = None):
+        with self._lock:
+            st = self._src.setdefault(name, {})
+            if cfg is not None:
+                st["cfg"] = cfg
+            if on is not None:
+                st["on"] = bool(on)
+
+    # ---- registri inverter ----
+    def regs_match(self, inv: str, start: int, words: Sequence[int], generation: int) -> bool:
+        """True se tutti i registri start..start+len(words)-1 hanno già quei valori."""
+        with self._lock:
+            known = self._regs.get(inv, {})
+            hit = all(known.get(start + k) == (int(w), generation) for k, w in enumerate(words))
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return hit
+
+    def regs_set(self, inv: str, start: int, words: Sequence[int], generation: int):
+        with self._lock:
+            known = self._regs.setdefault(inv, {})
+            for k, w in enumerate(words):
+                known[start + k] = (int(w), generation)
+
+    def regs_forget(self, inv: str, start: int, count: int):
+        with self._lock:
+            known = self._regs.get(inv, {})
+            for r in range(start, start + count):
+                known.pop(r, None)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Dimentica lo stato di 'name' (sorgente o inverter), o tutto se None."""
+        with self._lock:
+            if name is None:
+                self._src.clear()
+                self._regs.clear()
+            else:
+                self._src.pop(name, None)
+                self._regs.pop(name, None)
@@ -5,6 +5,7 @@ import os
 import threading
 import time
 from .instruments import *
+from .decoders import to_int_reg
 import ast
 
 logging_thread = None
@@ -23,6 +24,37 @@ def _as_py(x):
     return x
 
 
+def _on_flag(v):
+    """Colonna 'on/off' del template: 1 → accendi, 0 → spegni, altro → lascia com'è."""
+    if v == 1: return True
+    if v == 0: return False
+    return None
+
+
+# Limite protocollo Modbus per FC16 (write multiple registers)
+MODBUS_MAX_WRITE = 123
+
+
+def _coalesce_writes(pairs, max_count=MODBUS_MAX_WRITE):
+    """
+    Fonde scritture consecutive (nell'ordine del template) su indirizzi contigui in un
+    unico frame FC16: [(0x1000,[a]), (0x1001,[b]), (0x2000,[c])] -> [(0x1000,[a,b]), (0x2000,[c])].
+    Non riordina mai: due scritture si fondono solo se la seconda parte esattamente dove
+    finisce la prima e il blocco resta entro max_count registri.
+    """
+    out = []
+    for r, vals in pairs:
+        r = to_int_reg(r)
+        vals = list(vals) if isinstance(vals, (list, tuple)) else [vals]
+        if out:
+            start, cur = out[-1]
+            if start + len(cur) == r and len(cur) + len(vals) <= max_count:
+                cur.extend(vals)
+                continue
+        out.append((r, vals))
+    return out
+
+
 def apply_template_writes(ins, role, regs, vals, scale=1):
     regs = _as_py(regs)
     vals = _as_py(vals)
@@ -34,26 +66,25 @@ def apply_template_writes(ins, role, regs, vals, scale=1):
 
     # Caso B: reg[] + valore scalare -> ripeti
     if not isinstance(vals, (list, tuple)):
-        for r in regs:
-            ins.inv_broadcast_write(r, vals, scale=scale, role=role)
-        return
+        pairs = [(r, vals) for r in regs]
 
     # Caso C: reg[] + value[] (scalari)
-    if all(not isinstance(v, (list, tuple)) for v in vals):
+    elif all(not isinstance(v, (list, tuple)) for v in vals):
         if len(vals) != len(regs):
             # fallback: usa il primo valore per tutti
-            for r in regs:
-                ins.inv_broadcast_write(r, vals[0], scale=scale, role=role)
+            pairs = [(r, vals[0]) for r in regs]
         else:
-            for r, v in zip(regs, vals):
-                ins.inv_broadcast_write(r, v, scale=scale, role=role)
-        return
+            pairs = list(zip(regs, vals))
 
     # Caso D: reg[] + value[][] (blocchi)
-    if len(vals) != len(regs):
-        raise ValueError("value[][] deve avere la stessa lunghezza di reg[]")
-    for r, block in zip(regs, vals):
-        ins.inv_broadcast_write(r, block, scale=scale, role=role)
+    else:
+        if len(vals) != len(regs):
+            raise ValueError("value[][] deve avere la stessa lunghezza di reg[]")
+        pairs = list(zip(regs, vals))
+
+    # registri contigui -> un solo write_registers (FC16) per blocco
+    for start, block in _coalesce_writes(pairs):
+        ins.inv_broadcast_write(start, block, scale=scale, role=role)
 
 
 def build_inv_cfgs_from_ui(protocol: str, inverter_data: List[dict]) -> List[dict]:
@@ -142,6 +173,9 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
         dc_map = {"DC1": "ASRL20::INSTR", "DC2": "ASRL21::INSTR", "DC3": "ASRL22::INSTR"}
         ac_addr = "ASRL5::INSTR"
         ins = shared_ins or Instruments(dc_map=dc_map, ac_addr=ac_addr, inv_cfgs=inv_cfgs, protocol=protocol)
+        # stato comandato dimenticato a ogni test: tra un test e l'altro della playlist gli inverter
+        # possono essersi riavviati senza che RTU/HUB risultino mai disconnessi
+        ins.invalidate_state()
         df_template = pd.read_excel(template_file_path.split('.xlsx')[0]+'.xlsx')
         list_dc = list()
         dc1_yes = ''
@@ -178,41 +212,25 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                         pmp1 = df_template['potenza DC1'][i]
                         pf1 = df_template['pf1'][i]
                         turn_on1 = df_template['on/off DC1'][i]
-                        ins.dc_set_iv("DC1", voc=vmp1/pf1, isc=pmp1/(vmp1*pf1), ff=pf1)
-                        if turn_on1 == 1:
-                            ins.dc_on("DC1")
-                        elif turn_on1 == 0:
-                            ins.dc_off("DC1")
+                        ins.dc_set_iv("DC1", voc=vmp1/pf1, isc=pmp1/(vmp1*pf1), ff=pf1, on=_on_flag(turn_on1))
                     if df_template['on/off DC2'][i] != 'no':
                         vmp2 = df_template['tensione DC2'][i]
                         pmp2 = df_template['potenza DC2'][i]
                         pf2 = df_template['pf2'][i]
                         turn_on2 = df_template['on/off DC2'][i]
-                        ins.dc_set_iv("DC2", voc=vmp2 / pf2, isc=pmp2 / (vmp2 * pf2), ff=pf2)
-                        if turn_on2 == 1:
-                            ins.dc_on("DC2")
-                        elif turn_on2 == 0:
-                            ins.dc_off("DC2")
+                        ins.dc_set_iv("DC2", voc=vmp2 / pf2, isc=pmp2 / (vmp2 * pf2), ff=pf2, on=_on_flag(turn_on2))
                     if df_template['on/off DC3'][i] != 'no':
                         vmp3 = df_template['tensione DC3'][i]
                         pmp3 = df_template['potenza DC3'][i]
                         pf3 = df_template['pf3'][i]
                         turn_on3 = df_template['on/off DC3'][i]
-                        ins.dc_set_iv("DC3", voc=vmp3 / pf3, isc=pmp3 / (vmp3 * pf3), ff=pf3)
-                        if turn_on3 == 1:
-                            ins.dc_on("DC3")
-                        elif turn_on3 == 0:
-                            ins.dc_off("DC3")
+                        ins.dc_set_iv("DC3", voc=vmp3 / pf3, isc=pmp3 / (vmp3 * pf3), ff=pf3, on=_on_flag(turn_on3))
                     if df_template['on/off AC'][i] != 'no':
                         vac = df_template['tensione AC'][i]
                         fac = df_template['frequenza AC'][i]
                         turn_onAC = df_template['on/off AC'][i]
                         fase = df_template['fase'][i]
-                        ins.ac_set(vac, fac, phases=fase)
-                        if turn_onAC == 1:
-                            ins.ac_on()
-                        elif turn_onAC == 0:
-                            ins.ac_off()
+                        ins.ac_set(vac, fac, phases=fase, on=_on_flag(turn_onAC))
                     if df_template['potenza batteria'][i] != 'no':
                         pbatt = int(df_template['potenza batteria'][i])
                         pbatt = max(0, min(65535, pbatt))
@@ -238,6 +256,7 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                             df_template['value slave'][i],
                             scale=1
                         )
+                    ins.check_errors(f"custom riga {i + 1}")
                     time.sleep(df_template['tempo'][i])
             elif 'curva MPPT' in template_file_path:
                 row = df_inverter.iloc[0]
@@ -253,26 +272,38 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                 vac = int(df_template['tensione AC'][0])
                 fac = float(df_template['frequenza AC'][0])
                 fase = str(df_template['fase'][0])
-                shared_ins.ac_set(vac, fac, fase)
-                shared_ins.ac_on()
-                for i in range(vmin, vmax+1, 5):
+                shared_ins.ac_set(vac, fac, fase, on=True, opc=True)
+                chans = [(ch, pf) for ch, pf in (("DC1", pf1), ("DC2", pf2), ("DC3", pf3)) if ch in list_dc]
+                # preconnessione: primo passo e attesa che l'inverter inizi ad assorbire (max 60 s)
+                for ch, pf in chans:
+                    shared_ins.dc_set_iv(ch, voc=min(vmin/pf, vmax), isc=imax/pf, ff=pf, on=True, opc=True)
+                if not shared_ins.dc_wait_load(list_dc, timeout=60):
+                    print("[WARN] Preconnessione non rilevata entro 60 s: proseguo con lo sweep")
+                shared_ins.check_errors("curva MPPT preconnessione")
+                # sweep caricato negli strumenti (liste SAS): l'host avvia e segue l'avanzamento;
+                # i passi non eseguiti dalle liste (caricamento rifiutato, timeout) li pilota l'host
+                sweep = list(range(vmin, vmax+1, 5))
+                tempo = int(df_template['tempo'][0])
+                iv_lists = {ch: [(min(i/pf, vmax), imax/pf, pf, tempo) for i in sweep] for ch, pf in chans}
+                done = shared_ins.dc_run_iv_lists(iv_lists)
+                if done:
+                    shared_ins.check_errors("curva MPPT lista I-V")
+                    sweep = sweep[done:]
+                for i in sweep:
                     if 'DC1' in list_dc:
                         shared_ins.dc_set_iv("DC1", voc=min(i/pf1, vmax),
-                                      isc=imax/pf1, ff=pf1)
-                        shared_ins.dc_on('DC1')
+                                      isc=imax/pf1, ff=pf1, on=True)
                     if 'DC2' in list_dc:
                         shared_ins.dc_set_iv("DC2", voc=min(i/pf2, vmax),
-                                      isc=imax/pf2, ff=pf2)
-                        shared_ins.dc_on('DC2')
+                                      isc=imax/pf2, ff=pf2, on=True)
                     if 'DC3' in list_dc:
                         shared_ins.dc_set_iv("DC3", voc=min(i/pf3, vmax),
-                                      isc=imax/pf3, ff=pf3)
-                        shared_ins.dc_on('DC3')
-
-                    if i == vmin:
-                        time.sleep(60)
-                    else:
-                        time.sleep(int(df_template['tempo'][0]))
+                                      isc=imax/pf3, ff=pf3, on=True)
+                    time.sleep(tempo)
+                # coda errori letta una volta per lo sweep pilotato dall'host (il journal dice a
+                # quale passo appartiene l'errore), come per le liste
+                if sweep:
+                    shared_ins.check_errors(f"curva MPPT sweep host {sweep[0]}-{sweep[-1]} V")
             elif 'ciclo batteria' in template_file_path:
                 row = df_inverter.iloc[0]
                 vnom = int(row['VNOM'])
@@ -285,21 +316,22 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                 vac = int(df_template['tensione AC'][0])
                 fac = float(df_template['frequenza AC'][0])
                 fase = str(df_template['fase'][0])
-                shared_ins.ac_set(vac, fac, fase)
-                shared_ins.ac_on()
+                shared_ins.ac_set(vac, fac, fase, on=True, opc=True)
                 if dc1_yes != '':
                     shared_ins.dc_set_iv("DC1", voc=vnom,
-                                        isc=pbat_db/vnom, ff=pf1)
-                    shared_ins.dc_off('DC1')
+                                        isc=pbat_db/vnom, ff=pf1, on=False, opc=True)
                 if dc2_yes != '':
                     shared_ins.dc_set_iv("DC2", voc=vnom,
-                                         isc=pbat_db/vnom, ff=pf2)
-                    shared_ins.dc_off('DC2')
+                                         isc=pbat_db/vnom, ff=pf2, on=False, opc=True)
                 if dc3_yes != '':
                     shared_ins.dc_set_iv("DC3", voc=vnom,
-                                         isc=pbat_db/vnom, ff=pf3)
-                    shared_ins.dc_off('DC3')
-                time.sleep(5)
+                                         isc=pbat_db/vnom, ff=pf3, on=False, opc=True)
+                # uscite DC spente e scariche prima di comandare la batteria (max 5 s): corrente nulla
+                # subito dopo lo spegnimento, la tensione ai morsetti (ingresso inverter) scende più piano
+                batt_dc = [ch for ch, yes in (("DC1", dc1_yes), ("DC2", dc2_yes), ("DC3", dc3_yes)) if yes != '']
+                if not shared_ins.dc_wait_settled(batt_dc, v_max=5.0, i_max=0.05, timeout=5.0):
+                    print("[WARN] Uscite DC non scariche entro 5 s: proseguo con il ciclo batteria")
+                shared_ins.check_errors("ciclo batteria setup")
                 shared_ins.inv_broadcast_write("0x1110", [3], scale=1, role=None)
                 for i in range(0, len(df_template['pf1'])):
                     if df_template['potenza batteria'][i] != 'P BAT':
@@ -328,21 +360,18 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                 vac = int(df_template['tensione AC'][0])
                 fac = float(df_template['frequenza AC'][0])
                 fase = str(df_template['fase'][0])
-                shared_ins.ac_set(vac, fac, fase)
-                shared_ins.ac_on()
+                shared_ins.ac_set(vac, fac, fase, on=True)
                 #registri master, value master -> registro e valori da inserire
                 if 'DC1' in list_dc:
                     shared_ins.dc_set_iv("DC1", voc=min(vnom/pf1, vmax),
-                                  isc=imax/pf1, ff=pf1)
-                    shared_ins.dc_on('DC1')
+                                  isc=imax/pf1, ff=pf1, on=True)
                 if 'DC2' in list_dc:
                     shared_ins.dc_set_iv("DC2", voc=min(vnom/pf2, vmax),
-                                  isc=imax/pf2, ff=pf2)
-                    shared_ins.dc_on('DC2')
+                                  isc=imax/pf2, ff=pf2, on=True)
                 if 'DC3' in list_dc:
                     shared_ins.dc_set_iv("DC3", voc=min(vnom/pf3, vmax),
-                                  isc=imax/pf3, ff=pf3)
-                    shared_ins.dc_on('DC3')
+                                  isc=imax/pf3, ff=pf3, on=True)
+                shared_ins.check_errors("MAX SOUT setup")
                 for i in range(-900, 900, 50):
                     registro_write = str(df_template['registri master'][0])
                     registri_valori = list()  # df_template['value master'][0]
@@ -370,21 +399,18 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                 vac = int(df_template['tensione AC'][0])
                 fac = float(df_template['frequenza AC'][0])
                 fase = str(df_template['fase'][0])
-                shared_ins.ac_set(vac, fac, fase)
-                shared_ins.ac_on()
+                shared_ins.ac_set(vac, fac, fase, on=True)
                 #registri master, value master -> registro e valori da inserire
                 if 'DC1' in list_dc:
                     shared_ins.dc_set_iv("DC1", voc=min(vnom/pf1, vmax),
-                                  isc=imax/pf1, ff=pf1)
-                    shared_ins.dc_on('DC1')
+                                  isc=imax/pf1, ff=pf1, on=True)
                 if 'DC2' in list_dc:
                     shared_ins.dc_set_iv("DC2", voc=min(vnom/pf2, vmax),
-                                  isc=imax/pf2, ff=pf2)
-                    shared_ins.dc_on('DC2')
+                                  isc=imax/pf2, ff=pf2, on=True)
                 if 'DC3' in list_dc:
                     shared_ins.dc_set_iv("DC3", voc=min(vnom/pf3, vmax),
-                                  isc=imax/pf3, ff=pf3)
-                    shared_ins.dc_on('DC3')
+                                  isc=imax/pf3, ff=pf3, on=True)
+                shared_ins.check_errors("0-INJ setup")
                 for i in range(0, 60, 5):
                     registro_write = str(df_template['registri master'][0])
                     registri_valori = list()  # df_template['value master'][0]
@@ -404,6 +430,10 @@ def run_test_from_template(template_file_path, sn, protocol, inverter_data, shar
                     #(shared_ins or ins).dc_off(_i)
             except Exception as e:
                 print(f"[WARN] safe quench DC: {e}")
+            try:
+                (shared_ins or ins).check_errors("fine test")
+            except Exception as e:
+                print(f"[WARN] controllo errori SCPI: {e}")
             # try:
             #     (shared_ins or ins).ac_off()
             # except Exception as e:
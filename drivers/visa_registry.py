@@ -0,0 +1,220 @@
+# drivers/visa_registry.py
+"""
+Registro VISA di processo: un solo ResourceManager e una sessione per risorsa, condivisa tra
+driver (DCSource/ACSource), probe di presenza e pannelli manuali. Aprire il ResourceManager
+(caricamento della libreria VISA) e la risorsa seriale costa decine/centinaia di ms, e una
+stessa porta ASRL aperta due volte fallisce: le sessioni restano aperte finché non vengono
+chiuse esplicitamente (close_session / close_all_sessions all'uscita del programma).
+"""
+from __future__ import annotations
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import pyvisa
+from pyvisa.constants import StatusCode
+
+# Comandi ricordati per sessione dall'ultimo controllo della coda errori (vedi scpi.check_errors)
+JOURNAL_LEN = 200
+
+_rm: Optional[pyvisa.ResourceManager] = None
+_sessions: Dict[str, "VisaSession"] = {}
+_open_locks: Dict[str, threading.Lock] = {}  # apertura (lenta) serializzata per risorsa
+_registry_lock = threading.Lock()
+
+# Errori VISA che lasciano la sessione inutilizzabile (strumento spento, cavo USB/seriale staccato):
+# la risorsa viene chiusa e riaperta al primo uso successivo. Il timeout non è tra questi.
+_BROKEN_STATUS = {StatusCode.error_connection_lost, StatusCode.error_invalid_object,
+                  StatusCode.error_io, StatusCode.error_resource_not_found}
+
+
+class VisaSession:
+    """
+    Sessione condivisa su una risorsa VISA. write/query/read sono serializzati da un lock
+    (le sessioni pyvisa non sono thread-safe e la stessa porta può essere usata dal test,
+    dal logger e dai pannelli manuali). Gli altri attributi passano alla risorsa pyvisa.
+    close() non chiude la risorsa: la sessione appartiene al registro.
+    Ogni comando di write/query finisce nel journal (ripetizioni consecutive accorpate), così
+    gli errori SCPI letti in differita si possono attribuire ai comandi inviati dall'ultimo
+    controllo; le letture di misura e di stato passano da raw_query e non lo riempiono.
+    Un errore di I/O che rompe la sessione la toglie dal registro e chiude la risorsa;
+    il comando successivo la riapre (stesso oggetto: i driver non devono ricollegarsi).
+    """
+
+    def __init__(self, resource: str, inst):
+        self.resource = resource
+        self.inst = inst
+        self.lock = threading.RLock()
+        self.journal = deque(maxlen=JOURNAL_LEN)  # [timestamp, comando, ripetizioni]
+        self._timeout = inst.timeout
+
+    def _raw(self):
+        """Risorsa pyvisa, riaperta se la sessione era stata chiusa per errore (chiamare sotto lock)."""
+        if self.inst is None:
+            self.inst = get_resource_manager().open_resource(self.resource)
+            self.inst.timeout = self._timeout
+            with _registry_lock:
+                _sessions.setdefault(self.resource, self)
+        return self.inst
+
+    def _io(self, fn, *args):
+        try:
+            return fn(self._raw(), *args)
+        except pyvisa.errors.VisaIOError as e:
+            if e.error_code in _BROKEN_STATUS:
+                self._evict(e)
+            raise
+        except (pyvisa.errors.InvalidSession, OSError) as e:
+            self._evict(e)
+            raise
+
+    def _evict(self, err: Exception):
+        print(f"[WARN] Sessione VISA {self.resource} chiusa dopo errore di I/O: {err}")
+        with _registry_lock:
+            if _sessions.get(self.resource) is self:
+                del _sessions[self.resource]
+        inst, self.inst = self.inst, None
+        if inst is not None:
+            try:
+                inst.close()
+            except Exception:
+                pass
+
+    def _note(self, cmd: str):
+        if self.journal and self.journal[-1][1] == cmd:
+            self.journal[-1][2] += 1
+        else:
+            self.journal.append([datetime.now(), cmd, 1])
+
+    def take_journal(self) -> List[list]:
+        """Comandi dall'ultima chiamata (e svuota il journal)."""
+        with self.lock:
+            out = list(self.journal)
+            self.journal.clear()
+            return out
+
+    def write(self, cmd: str):
+        with self.lock:
+            self._note(cmd)
+            return self._io(lambda i: i.write(cmd))
+
+    def query(self, cmd: str) -> str:
+        with self.lock:
+            self._note(cmd)
+            return self._io(lambda i: i.query(cmd))
+
+    def raw_query(self, cmd: str) -> str:
+        """Query fuori dal journal: letture senza effetti (misure, stato lista, coda errori, *IDN?)."""
+        with self.lock:
+            return self._io(lambda i: i.query(cmd))
+
+    def read(self) -> str:
+        with self.lock:
+            return self._io(lambda i: i.read())
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        with self.lock:
+            self._timeout = value
+            if self.inst is not None:
+                self.inst.timeout = value
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        with self.lock:
+            return getattr(self._raw(), name)
+
+
+def get_resource_manager() -> pyvisa.ResourceManager:
+    """ResourceManager di processo, creato al primo uso."""
+    global _rm
+    with _registry_lock:
+        if _rm is None:
+            _rm = pyvisa.ResourceManager()
+        return _rm
+
+
+def open_session(resource: str, timeout_ms: Optional[int] = None) -> VisaSession:
+    """
+    Sessione su 'resource', aperta al primo uso e poi riusata. timeout_ms aggiorna il timeout.
+    L'apertura (lenta, o appesa su una porta che non risponde) avviene fuori dal lock del
+    registro, sotto un lock della sola risorsa: le altre risorse si aprono in parallelo.
+    """
+    rm = get_resource_manager()
+    with _registry_lock:
+        sess = _sessions.get(resource)
+        open_lock = _open_locks.setdefault(resource, threading.Lock())
+    if sess is None:
+        with open_lock:
+            with _registry_lock:
+                sess = _sessions.get(resource)
+            if sess is None:
+                sess = VisaSession(resource, rm.open_resource(resource))
+                with _registry_lock:
+                    _sessions[resource] = sess
+    if timeout_ms is not None:
+        sess.timeout = timeout_ms
+    return sess
+
+
+def has_session(resource: str) -> bool:
+    with _registry_lock:
+        return resource in _sessions
+
+
+def close_session(resource: str):
+    """Chiude e rimuove dal registro la sessione di 'resource' (es. strumento spento o in errore)."""
+    with _registry_lock:
+        sess = _sessions.pop(resource, None)
+    if sess is not None:
+        with sess.lock:
+            inst, sess.inst = sess.inst, None
+            try:
+                if inst is not None:
+                    inst.close()
+            except Exception:
+                pass
+
+
+def close_all_sessions():
+    """Chiude tutte le sessioni e il ResourceManager (uscita del programma)."""
+    global _rm
+    with _registry_lock:
+        names = list(_sessions)
+    for r in names:
+        close_session(r)
+    with _registry_lock:
+        rm, _rm = _rm, None
+    if rm is not None:
+        try:
+            rm.close()
+        except Exception:
+            pass
+
+
+def probe(resource: str, timeout_ms: int = 500) -> Tuple[bool, str]:
+    """
+    Verifica di presenza riusando la sessione condivisa: (True, IDN) se la risorsa si apre.
+    *IDN? è un tentativo soft (se non supportato l'IDN resta vuoto). La sessione resta aperta
+    per il driver che la userà subito dopo; il timeout viene ripristinato.
+    """
+    try:
+        sess = open_session(resource)
+    except Exception as e:
+        return False, str(e)
+    with sess.lock:
+        old = sess.timeout
+        sess.timeout = timeout_ms
+        try:
+            idn = sess.raw_query("*IDN?").strip()
+        except Exception:
+            idn = ""
+        finally:
+            sess.timeout = old
+    return True, idn
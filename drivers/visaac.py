@@ -1,9 +1,14 @@
 from __future__ import annotations
 import pyvisa
 from typing import Optional
+from .scpi import send_batch, check_errors
+from .visa_registry import get_resource_manager, open_session
 
 class ACSource:
     """Driver minimale per sorgente AC via VISA."""
+    # Misure in un'unica query composta: risposte nell'ordine di MEAS_KEYS
+    MEAS_QUERY = "MEAS:VOLT?;:MEAS:CURR?;:MEAS:POW?;:MEAS:FREQ?"
+    MEAS_KEYS = ("V", "I", "P", "F")
 
     def __init__(self, resource: str, timeout_ms: int = 2000):
         self.resource = resource
@@ -13,15 +18,20 @@ class ACSource:
         self._connect()
 
     def _connect(self):
-        self.rm = pyvisa.ResourceManager()
-        self.inst = self.rm.open_resource(self.resource)
-        self.inst.timeout = self.timeout_ms
-
-    def configure(self, vrms: float, freq: float, phases: str = "mono") -> bool:
-        self.inst.write('SYST:FUNC ONE' if phases.lower().startswith('mono') else 'SYST:FUNC THREE')
-        self.inst.write(f'VOLT {vrms}')
-        self.inst.write(f'FREQ {freq}')
-        return True
+        # ResourceManager e sessione condivisi (vedi visa_registry): niente riaperture
+        # della porta a ogni istanza del driver
+        self.rm = get_resource_manager()
+        self.inst = open_session(self.resource, self.timeout_ms)
+
+    def configure(self, vrms: float, freq: float, phases: str = "mono", on: Optional[bool] = None,
+                  opc: bool = False) -> bool:
+        """Fasi, tensione, frequenza (ed eventualmente uscita) in un'unica riga SCPI composta."""
+        cmds = ['SYST:FUNC ONE' if phases.lower().startswith('mono') else 'SYST:FUNC THREE',
+                f'VOLT {vrms}',
+                f'FREQ {freq}']
+        if on is not None:
+            cmds.append('OUTP ON' if on else 'OUTP OFF')
+        return send_batch(self.inst, cmds, opc=opc)
 
     def turn_on(self) -> bool:
         self.inst.write('OUTP ON')
@@ -31,11 +41,19 @@ class ACSource:
         self.inst.write('OUTP OFF')
         return True
 
-    def close(self):
+    def measure(self) -> dict:
+        """V/I/P/F con un solo round-trip. {} se non disponibile."""
         try:
-            if self.inst is not None:
-                self.inst.close()
-        finally:
-            if self.rm is not None:
-                try: self.rm.close()
-                except: pass
+            vals = self.inst.raw_query(self.MEAS_QUERY).strip().split(";")
+            return {k: float(v) for k, v in zip(self.MEAS_KEYS, vals)}
+        except Exception:
+            return {}
+
+    def check_errors(self) -> dict:
+        """Coda SYST:ERR? svuotata e comandi inviati dall'ultimo controllo (vedi scpi.check_errors)."""
+        return check_errors(self.inst)
+
+    def close(self):
+        """La sessione resta nel registro VISA (close_session / close_all_sessions per chiuderla)."""
+        self.inst = None
+        self.rm = None
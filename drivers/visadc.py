@@ -1,13 +1,33 @@
 # drivers/visadc.py
 from __future__ import annotations
 import pyvisa
-from typing import Optional
+import time
+from typing import Callable, Optional, Sequence, Tuple
+from .scpi import send_batch, check_errors
+from .visa_registry import get_resource_manager, open_session
+
+
+# Passo di una lista I-V lato strumento: (voc, isc, ff, dwell [s])
+IVStep = Tuple[float, float, float, float]
 
 
 class DCSource:
     """Driver minimale per alimentatori DC (profilo solare) via VISA.
      Adatta i comandi SCPI ai tuoi strumenti.
      """
+    # Lista curve I-V (SAS list degli ITECH): un passo = curva SOL:USER + tempo di permanenza.
+    # {k} = indice passo (1..n). Adatta i template al firmware dello strumento.
+    LIST_MAX_STEPS = 100  # passi per lista: sweep più lunghi a blocchi (Instruments.dc_run_iv_lists)
+    LIST_STEP_CMDS = ("SOL:LIST:VOC {k},{voc}", "SOL:LIST:VMP {k},{vmp}",
+                      "SOL:LIST:ISC {k},{isc}", "SOL:LIST:IMP {k},{imp}", "SOL:LIST:WIDT {k},{dwell}")
+    LIST_COUNT_CMD = "SOL:LIST:STEP:COUN {n}"
+    LIST_REPEAT_CMD = "SOL:LIST:COUN {repeat}"
+    LIST_START_CMD = "SOL:LIST:STAT ON"
+    LIST_STOP_CMD = "SOL:LIST:STAT OFF"
+    LIST_STATE_QUERY = "SOL:LIST:STAT?"
+    LIST_STEP_QUERY = "SOL:LIST:STEP?"
+    # Misura V e I nella stessa transazione
+    MEAS_QUERY = "MEAS:VOLT?;:MEAS:CURR?"
     def __init__(self, resource: str, timeout_ms: int = 2000):
         self.resource = resource
         self.rm: Optional[pyvisa.ResourceManager] = None
@@ -16,20 +36,117 @@ class DCSource:
         self._connect()
 
     def _connect(self):
-        self.rm = pyvisa.ResourceManager()
-        self.inst = self.rm.open_resource(self.resource)
-        self.inst.timeout = self.timeout_ms
+        # ResourceManager e sessione condivisi (vedi visa_registry): niente riaperture
+        # della porta a ogni istanza del driver
+        self.rm = get_resource_manager()
+        self.inst = open_session(self.resource, self.timeout_ms)
 
     # --- Configurazione curva I-V (esempio tipico da solar simulator) ---
-    def set_iv(self, voc: float, isc: float, ff: float = 0.9) -> bool:
+    def set_iv(self, voc: float, isc: float, ff: float = 0.9, on: Optional[bool] = None,
+               opc: bool = False) -> bool:
+        """
+        Curva I-V (e, se 'on' non è None, stato dell'uscita) in un'unica riga SCPI composta.
+        opc=True: attende il completamento con *OPC? nella stessa transazione.
+        """
         if not (0 < ff < 1):
             raise ValueError("ff deve essere tra 0 e 1")
-        self.inst.write('SOL:USER:VOC '+str(round(voc, 2)))
-        self.inst.write('SOL:USER:VMP '+str(round(voc * ff, 2)))
-        self.inst.write('SOL:USER:ISC '+str(round(isc, 2)))
-        self.inst.write('SOL:USER:IMP '+str(round(isc * ff, 2)))
+        cmds = ['SOL:USER:VOC ' + str(round(voc, 2)),
+                'SOL:USER:VMP ' + str(round(voc * ff, 2)),
+                'SOL:USER:ISC ' + str(round(isc, 2)),
+                'SOL:USER:IMP ' + str(round(isc * ff, 2))]
+        if on is not None:
+            cmds.append('OUTP 1' if on else 'OUTP 0')
+        return send_batch(self.inst, cmds, opc=opc)
+
+    # --- Lista I-V lato strumento: la temporizzazione dei passi la fa lo strumento ---
+    def upload_iv_list(self, steps: Sequence[IVStep], repeat: int = 1) -> int:
+        """
+        Carica l'intera sequenza di curve I-V (con tempi di permanenza) nella lista dello
+        strumento, in righe SCPI composte; *OPC? finale conferma il caricamento.
+        Ritorna il numero di passi. Solleva se la lista è troppo lunga o lo strumento non risponde.
+        """
+        n = len(steps)
+        if not 0 < n <= self.LIST_MAX_STEPS:
+            raise ValueError(f"Lista I-V: {n} passi (max {self.LIST_MAX_STEPS})")
+        cmds = [self.LIST_STOP_CMD]
+        for k, (voc, isc, ff, dwell) in enumerate(steps, start=1):
+            if not (0 < ff < 1):
+                raise ValueError("ff deve essere tra 0 e 1")
+            vals = dict(k=k, voc=round(voc, 2), vmp=round(voc * ff, 2), isc=round(isc, 2),
+                        imp=round(isc * ff, 2), dwell=round(float(dwell), 3))
+            cmds.extend(c.format(**vals) for c in self.LIST_STEP_CMDS)
+        cmds += [self.LIST_COUNT_CMD.format(n=n), self.LIST_REPEAT_CMD.format(repeat=int(repeat))]
+        if not send_batch(self.inst, cmds, opc=True):
+            raise RuntimeError("Lista I-V: caricamento non confermato (*OPC?)")
+        return n
+
+    def start_list(self, on: bool = True) -> bool:
+        """Avvia la lista caricata (e l'uscita, nella stessa riga)."""
+        return send_batch(self.inst, [self.LIST_START_CMD] + (['OUTP 1'] if on else []))
+
+    def stop_list(self) -> bool:
+        self.inst.write(self.LIST_STOP_CMD)
         return True
 
+    def list_status(self) -> Tuple[bool, Optional[int]]:
+        """(lista in esecuzione?, passo corrente) in un'unica query composta."""
+        resp = self.inst.raw_query(f"{self.LIST_STATE_QUERY};:{self.LIST_STEP_QUERY}").strip()
+        state, _, step = resp.partition(";")
+        running = state.strip().upper() in ("1", "ON")
+        try:
+            return running, int(float(step))
+        except ValueError:
+            return running, None
+
+    def wait_list(self, timeout: float, poll: float = 2.0,
+                  on_step: Optional[Callable[[int], None]] = None) -> bool:
+        """Attende la fine della lista interrogando lo stato ogni 'poll' s. False se scade il timeout."""
+        deadline = time.monotonic() + timeout
+        last = None
+        while time.monotonic() < deadline:
+            running, step = self.list_status()
+            if step is not None and step != last:
+                last = step
+                if on_step:
+                    on_step(step)
+            if not running:
+                return True
+            time.sleep(min(poll, max(0.0, deadline - time.monotonic())))
+        return False
+
+    # --- Sincronizzazione: attese solo per il tempo che serve davvero allo strumento ---
+    def wait_settled(self, v_max: Optional[float] = None, i_max: Optional[float] = None,
+                     tol_v: float = 1.0, tol_i: float = 0.05, timeout: float = 5.0,
+                     poll: float = 0.2) -> bool:
+        """
+        Attende che l'uscita sia assestata: due misure consecutive entro tol_v/tol_i e, se dati,
+        V <= v_max + tol_v e I <= i_max + tol_i. False allo scadere del timeout.
+        """
+        deadline = time.monotonic() + timeout
+        prev = None
+        while True:
+            m = self.measure()
+            if m and prev and abs(m["V"] - prev["V"]) <= tol_v and abs(m["I"] - prev["I"]) <= tol_i \
+                    and (v_max is None or m["V"] <= v_max + tol_v) and (i_max is None or m["I"] <= i_max + tol_i):
+                return True
+            prev = m or None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll, remaining))
+
+    def wait_current(self, min_i: float, timeout: float = 60.0, poll: float = 1.0) -> bool:
+        """Attende che il carico (inverter) assorba almeno min_i [A]: es. fine preconnessione."""
+        deadline = time.monotonic() + timeout
+        while True:
+            m = self.measure()
+            if m and m["I"] >= min_i:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll, remaining))
+
     def turn_on(self) -> bool:
         self.inst.write('OUTP 1')
         return True
@@ -39,31 +156,27 @@ class DCSource:
         return True
 
     def measure(self) -> dict:
-        """Esempio: misura V/I/P se supportato (adatta ai tuoi comandi)."""
+        """V/I in un'unica query composta (un solo round-trip); P calcolata. {} se non disponibile."""
         try:
-            v = float(self.inst.query('MEAS:VOLT?'))
-            i = float(self.inst.query('MEAS:CURR?'))
-            p = v * i
-            return {"V": v, "I": i, "P": p}
+            v, i = (float(x) for x in self.inst.raw_query(self.MEAS_QUERY).strip().split(";")[:2])
+            return {"V": v, "I": i, "P": v * i}
         except Exception:
             return {}
 
+    def check_errors(self) -> dict:
+        """Coda SYST:ERR? svuotata e comandi inviati dall'ultimo controllo (vedi scpi.check_errors)."""
+        return check_errors(self.inst)
+
     def close(self):
-        try:
-            if self.inst is not None:
-                self.inst.close()
-        finally:
-            if self.rm is not None:
-                try:
-                    self.rm.close()
-                except:
-                    pass
+        """La sessione resta nel registro VISA (close_session / close_all_sessions per chiuderla)."""
+        self.inst = None
+        self.rm = None
 
     # --------- Aggiunte per config ITECH ---------
     def identify(self) -> str:
         """Ritorna la stringa *IDN? dell'alimentatore."""
         try:
-            return self.inst.query("*IDN?").strip()
+            return self.inst.raw_query("*IDN?").strip()
         except Exception as e:
             return f"UNKNOWN ({e})"
 
@@ -75,10 +188,10 @@ class DCSource:
         idn = self.identify()
          # imposta FUNZIONE SOLARE
         self.inst.write("FUNC:MODE SOL")
-        func_mode = self.inst.query("FUNC:MODE?").strip()
+        func_mode = self.inst.raw_query("FUNC:MODE?").strip()
         # imposta curva/algoritmo solare (es. DEF_C)
         self.inst.write(f"SOL:MODE {curve_mode}")
-        sol_mode = self.inst.query("SOL:MODE?").strip()
+        sol_mode = self.inst.raw_query("SOL:MODE?").strip()
         # echo stile tuo snippet
         print(f">>> {idn}")
         print(f">>> {func_mode}")